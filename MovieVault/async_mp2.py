@@ -0,0 +1,494 @@
+import asyncio
+import sys
+
+import psycopg
+from psycopg.rows import args_row
+from psycopg_pool import AsyncConnectionPool
+
+from config import get_bool, get_float, get_int, read_config
+from customer import Customer
+from messages import *
+from movie import Movie
+from mp2 import chunked
+from output import RowWriter
+from pagination import decode_page_token, encode_page_token
+from plan import Plan
+import queries
+from validators import *
+
+"""
+    asyncio version of Mp2Client for serving many customer sessions from one process.
+    - Connections come from a psycopg 3 AsyncConnectionPool configured by the [pool] section.
+    - Commands take the same arguments and return the same (status, message) tuples as Mp2Client.
+      Output is written to the given out stream (sys.stdout by default) instead of being printed,
+      so concurrent sessions do not interleave their results.
+    - Searches use the ILIKE match condition, which is served by the trigram index if one exists,
+      and suggestions use the single-query implementation.
+"""
+
+
+class AsyncMp2Client:
+    def __init__(self, config_filename):
+        self.db_conn_params = read_config(filename=config_filename, section="postgresql")
+        # psycopg 3 only accepts the libpq name of the database option; psycopg2 also takes "database"
+        if "database" in self.db_conn_params:
+            self.db_conn_params["dbname"] = self.db_conn_params.pop("database")
+        self.pool_params = read_config(filename=config_filename, section="pool", required=False)
+        self.watch_params = read_config(filename=config_filename, section="watch", required=False)
+        self.watch_chunk_size = get_int(self.watch_params, "chunksize", 1000)
+        self.output_params = read_config(filename=config_filename, section="output", required=False)
+        self.output_batch_size = get_int(self.output_params, "batchsize", 2000)
+        self.suggestion_params = read_config(filename=config_filename, section="suggestions", required=False)
+        self.cowatch_limit = get_int(self.suggestion_params, "cowatchlimit", 20)
+        self.session_params = read_config(filename=config_filename, section="sessions", required=False)
+        self.session_lease = get_float(self.session_params, "leaseseconds", 300.0)
+        self.session_heartbeat_interval = get_float(self.session_params, "heartbeatinterval", 60.0)
+        self.pool = None
+        self._session_ids = set()
+        self._heartbeat = None
+
+    """
+        Opens the asynchronous connection pool and starts renewing the leases of the sessions signed in through
+        this client. The session lease table must already exist, see migrate.py.
+    """
+
+    async def connect(self):
+        self.pool = AsyncConnectionPool(
+            kwargs=self.db_conn_params,
+            min_size=get_int(self.pool_params, "minidle", 1),
+            max_size=get_int(self.pool_params, "maxsize", 10),
+            max_lifetime=get_float(self.pool_params, "maxlifetime", 3600.0),
+            timeout=get_float(self.pool_params, "timeout", 30.0),
+            check=AsyncConnectionPool.check_connection if get_bool(self.pool_params, "healthcheck", True) else None,
+            open=False)
+        await self.pool.open()
+        self._heartbeat = asyncio.ensure_future(self._renew_session_leases())
+
+    """
+        Closes every pooled connection.
+    """
+
+    async def disconnect(self):
+        self._heartbeat.cancel()
+        await self.pool.close()
+
+    """
+        Renews the leases of the signed in sessions, and reclaims expired leases of every client,
+        every heartbeat interval.
+    """
+
+    async def _renew_session_leases(self):
+        while True:
+            await asyncio.sleep(self.session_heartbeat_interval)
+            try:
+                async with self.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    if self._session_ids:
+                        session_ids = list(self._session_ids)
+                        await cursor.execute(queries.RENEW_SESSION_LEASES, (self.session_lease, session_ids))
+                        renewed_ids = set(row[0] for row in await cursor.fetchall())
+                        self._session_ids.difference_update(set(session_ids) - renewed_ids)
+                    await cursor.execute(queries.REAP_EXPIRED_SESSIONS)
+                    await conn.commit()
+            except (Exception, psycopg.DatabaseError) as error:
+                # the database may be unreachable for a while; leases are renewed on the next round
+                pass
+
+    """
+        Returns connection pool counters.
+    """
+
+    def pool_stats(self):
+        return self.pool.get_stats()
+
+    """
+        Validates and runs one tokenized command the way main.py does, writing its output and messages to out.
+        - Return type is a tuple, 1st element is the signed in customer after the command,
+          2nd and 3rd elements are the status and message of the command.
+        - quit signs the customer out; closing the session is left to the caller.
+    """
+
+    async def execute(self, auth_customer, cmd_tokens, out=None):
+        out = out if out is not None else sys.stdout
+        cmd = cmd_tokens[0]
+
+        if cmd == "help":
+            self.help(out=out)
+            return auth_customer, True, None
+
+        elif cmd == "sign_up":
+            status, message = sign_up_validator(auth_customer, cmd_tokens)
+            if status:
+                _, email, password, first_name, last_name, plan_id = cmd_tokens
+                status, message = await self.sign_up(email=email, password=password, first_name=first_name,
+                                                     last_name=last_name, plan_id=plan_id)
+
+        elif cmd == "sign_in":
+            status, message = sign_in_validator(auth_customer, cmd_tokens)
+            if status:
+                _, email, password = cmd_tokens
+                customer, message = await self.sign_in(email=email, password=password)
+                status = customer is not None
+                if customer:
+                    auth_customer = customer
+
+        elif cmd == "sign_out":
+            status, message = sign_out_validator(auth_customer, cmd_tokens)
+            if status:
+                status, message = await self.sign_out(customer=auth_customer)
+                if status:
+                    auth_customer = None
+
+        elif cmd == "quit":
+            status, message = quit_validator(cmd_tokens)
+            if status:
+                status, message = await self.quit(customer=auth_customer)
+                if status:
+                    auth_customer = None
+                    message = None
+
+        elif cmd == "show_plans":
+            status, message = show_plans_validator(auth_customer, cmd_tokens)
+            if status:
+                status, message = await self.show_plans(out=out)
+                message = None if status else message
+
+        elif cmd == "show_subscription":
+            status, message = show_subscription_validator(auth_customer, cmd_tokens)
+            if status:
+                status, message = await self.show_subscription(customer=auth_customer, out=out)
+                message = None if status else message
+
+        elif cmd == "watch":
+            status, message = watch_validator(auth_customer, cmd_tokens)
+            if status:
+                status, message = await self.watch(customer=auth_customer, movie_ids=cmd_tokens[1:])
+
+        elif cmd == "subscribe":
+            status, message = subscribe_validator(auth_customer, cmd_tokens)
+            if status:
+                customer, message = await self.subscribe(customer=auth_customer, plan_id=cmd_tokens[1])
+                status = bool(customer)
+                if customer:
+                    auth_customer = customer
+
+        elif cmd == "search_for_movies":
+            status, message = search_for_movies_validator(auth_customer, cmd_tokens)
+            if status:
+                search_text, page_size, page_token = search_for_movies_args(cmd_tokens)
+                status, message = await self.search_for_movies(customer=auth_customer, search_text=search_text,
+                                                               out=out, page_size=page_size, page_token=page_token)
+                message = None if status else message
+
+        elif cmd == "suggest_movies":
+            status, message = suggest_movies_validator(auth_customer, cmd_tokens)
+            if status:
+                status, message = await self.suggest_movies(customer=auth_customer, out=out,
+                                                            cowatch=len(cmd_tokens) == 2)
+                message = None if status else message
+
+        elif cmd == "":
+            return auth_customer, True, None
+
+        else:
+            status, message = False, CMD_UNDEFINED
+
+        if message:
+            out.write((message if status else "ERROR: %s" % message) + "\n")
+        return auth_customer, status, message
+
+    """
+        Writes the list of available commands to out.
+    """
+
+    def help(self, out=None):
+        out = out if out is not None else sys.stdout
+        out.write("\n*** Please enter one of the following commands ***\n"
+                  "> help\n"
+                  "> sign_up <email> <password> <first_name> <last_name> <plan_id>\n"
+                  "> sign_in <email> <password>\n"
+                  "> sign_out\n"
+                  "> show_plans\n"
+                  "> show_subscription\n"
+                  "> subscribe <plan_id>\n"
+                  "> watch <movie_id_1> <movie_id_2> <movie_id_3> ... <movie_id_n>\n"
+                  "> search_for_movies <keyword_1> <keyword_2> <keyword_3> ... <keyword_n>\n"
+                  "> search_for_movies --page <page_size> [--after <page_token>] <keyword_1> ... <keyword_n>\n"
+                  "> suggest_movies [--cowatch]\n"
+                  "> quit\n")
+
+    """
+        Saves customer with given details. Same semantics as Mp2Client.sign_up.
+    """
+
+    async def sign_up(self, email, password, first_name, last_name, plan_id):
+        try:
+            async with self.pool.connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    await cursor.execute(queries.CHECK_CUSTOMER, (email,))
+                    if await cursor.fetchall():
+                        await conn.rollback()
+                        return False, CMD_EXECUTION_FAILED
+                    await cursor.execute(queries.SIGN_UP_CUSTOMER, (email, password, first_name, last_name, 0, plan_id))
+                    await conn.commit()
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg.DatabaseError) as error:
+                    await conn.rollback()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg.DatabaseError) as error:
+            # no connection could be checked out, or rolling back on a broken one failed
+            return False, CMD_EXECUTION_FAILED
+
+    """
+        Signs the customer in if sessionCount < maxParallelSessions. Same semantics as Mp2Client.sign_in.
+    """
+
+    async def sign_in(self, email, password):
+        try:
+            async with self.pool.connection() as conn:
+                try:
+                    cursor = conn.cursor(row_factory=args_row(Customer))
+                    await cursor.execute(queries.SIGN_IN_LEASE, {"email": email, "password": password,
+                                                                 "lease_seconds": self.session_lease})
+                    customer_records = await cursor.fetchall()
+                    if len(customer_records) != 1:
+                        await conn.rollback()
+                        return None, USER_SIGNIN_FAILED
+
+                    customer = customer_records[0]
+                    if customer.session_id is None:
+                        await conn.rollback()
+                        return None, USER_ALL_SESSIONS_ARE_USED
+
+                    await conn.commit()
+                    self._session_ids.add(customer.session_id)
+                    return customer, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg.DatabaseError) as error:
+                    await conn.rollback()
+                    return None, USER_SIGNIN_FAILED
+        except (Exception, psycopg.DatabaseError) as error:
+            return None, USER_SIGNIN_FAILED
+
+    """
+        Signs out from given customer's account. Same semantics as Mp2Client.sign_out.
+    """
+
+    async def sign_out(self, customer):
+        try:
+            async with self.pool.connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    await cursor.execute(queries.SIGN_OUT_LEASE, (customer.session_id,))
+                    session_count_records = await cursor.fetchall()
+                    await conn.commit()
+                    self._session_ids.discard(customer.session_id)
+                    if session_count_records:
+                        customer.session_count = session_count_records[0][0]
+                    customer.session_id = None
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg.DatabaseError) as error:
+                    await conn.rollback()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg.DatabaseError) as error:
+            return False, CMD_EXECUTION_FAILED
+
+    """
+        Signs the given customer out, if any. Same semantics as Mp2Client.quit.
+    """
+
+    async def quit(self, customer):
+        if customer:
+            await self.sign_out(customer)
+        return True, CMD_EXECUTION_SUCCESS
+
+    """
+        Writes all available plans to out. Same semantics as Mp2Client.show_plans.
+    """
+
+    async def show_plans(self, out=None):
+        try:
+            async with self.pool.connection() as conn:
+                try:
+                    cursor = conn.cursor(row_factory=args_row(Plan))
+                    await cursor.execute(queries.ALL_PLANS)
+                    all_plans_records = sorted(await cursor.fetchall(), key=lambda plan: plan.plan_id)
+                    await conn.commit()
+                    if not all_plans_records:
+                        return False, CMD_EXECUTION_FAILED
+
+                    with RowWriter(stream=out) as writer:
+                        writer.write_line("#|Name|Resolution|Max Sessions|Monthly Fee")
+                        writer.write_rows(all_plans_records)
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg.DatabaseError) as error:
+                    await conn.rollback()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg.DatabaseError) as error:
+            return False, CMD_EXECUTION_FAILED
+
+    """
+        Writes the customer's plan to out. Same semantics as Mp2Client.show_subscription.
+    """
+
+    async def show_subscription(self, customer, out=None):
+        try:
+            async with self.pool.connection() as conn:
+                try:
+                    cursor = conn.cursor(row_factory=args_row(Plan))
+                    await cursor.execute(queries.PLAN, (customer.plan_id,))
+                    plan_records = await cursor.fetchall()
+                    await conn.commit()
+                    if len(plan_records) != 1:
+                        return False, CMD_EXECUTION_FAILED
+
+                    with RowWriter(stream=out) as writer:
+                        writer.write_line("#|Name|Resolution|Max Sessions|Monthly Fee")
+                        writer.write_rows(plan_records)
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg.DatabaseError) as error:
+                    await conn.rollback()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg.DatabaseError) as error:
+            return False, CMD_EXECUTION_FAILED
+
+    """
+        Inserts the missing customer-movie pairs, all or nothing. Same semantics as Mp2Client.watch.
+    """
+
+    async def watch(self, customer, movie_ids):
+        try:
+            async with self.pool.connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    for movie_id_chunk in chunked(movie_ids, self.watch_chunk_size):
+                        await cursor.execute(queries.WATCH_MOVIES, (movie_id_chunk, customer.customer_id,
+                                                                    customer.customer_id))
+                        unknown_movie_count = (await cursor.fetchone())[0]
+                        if unknown_movie_count > 0:
+                            await conn.rollback()
+                            return False, CMD_EXECUTION_FAILED
+                    await conn.commit()
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg.DatabaseError) as error:
+                    await conn.rollback()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg.DatabaseError) as error:
+            return False, CMD_EXECUTION_FAILED
+
+    """
+        Subscribes the customer to a new plan. Same semantics as Mp2Client.subscribe.
+    """
+
+    async def subscribe(self, customer, plan_id):
+        try:
+            async with self.pool.connection() as conn:
+                try:
+                    cursor = conn.cursor(row_factory=args_row(Plan))
+                    await cursor.execute(queries.PLAN, (plan_id,))
+                    new_plan = await cursor.fetchone()
+                    if not new_plan:
+                        await conn.rollback()
+                        return None, SUBSCRIBE_PLAN_NOT_FOUND
+
+                    await cursor.execute(queries.PLAN, (customer.plan_id,))
+                    old_plan = await cursor.fetchone()
+                    if new_plan.max_parallel_sessions < old_plan.max_parallel_sessions:
+                        await conn.rollback()
+                        return None, SUBSCRIBE_MAX_PARALLEL_SESSIONS_UNAVAILABLE
+
+                    await cursor.execute(queries.SUBSCRIBE_CUSTOMER, (plan_id, customer.customer_id))
+                    await conn.commit()
+                    customer.plan_id = plan_id
+                    return customer, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg.DatabaseError) as error:
+                    await conn.rollback()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg.DatabaseError) as error:
+            return False, CMD_EXECUTION_FAILED
+
+    """
+        Writes the movies whose titles contain search_text to out. Same semantics as Mp2Client.search_for_movies.
+        Rows are read from a server-side cursor in batches of output_batch_size, unless a page is requested.
+    """
+
+    async def search_for_movies(self, customer, search_text, out=None, page_size=None, page_token=None):
+        if page_size is not None:
+            return await self._search_page(customer, search_text, out, page_size, page_token)
+
+        try:
+            async with self.pool.connection() as conn:
+                try:
+                    cursor = conn.cursor(name="search_for_movies", row_factory=args_row(Movie))
+                    cursor.itersize = self.output_batch_size
+                    await cursor.execute(queries.SEARCH_MOVIES.format(match="m.originaltitle ILIKE %s"),
+                                         (customer.customer_id, '%' + search_text + '%',))
+                    with RowWriter(stream=out, buffer_lines=self.output_batch_size) as writer:
+                        writer.write_line("Id|Title|Year|Rating|Votes|Watched")
+                        async for movie in cursor:
+                            writer.write_row(movie)
+                    await cursor.close()
+                    await conn.commit()
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg.DatabaseError) as error:
+                    await conn.rollback()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg.DatabaseError) as error:
+            return False, CMD_EXECUTION_FAILED
+
+    async def _search_page(self, customer, search_text, out, page_size, page_token):
+        try:
+            last_movie_id = decode_page_token(page_token, search_text) if page_token else ""
+        except ValueError as error:
+            return False, SEARCH_PAGE_TOKEN_INVALID
+
+        try:
+            async with self.pool.connection() as conn:
+                try:
+                    cursor = conn.cursor(row_factory=args_row(Movie))
+                    await cursor.execute(queries.SEARCH_MOVIES_PAGE.format(match="m.originaltitle ILIKE %s"),
+                                         (customer.customer_id, '%' + search_text + '%', last_movie_id, page_size + 1))
+                    movies = await cursor.fetchall()
+                    await conn.commit()
+                except (Exception, psycopg.DatabaseError) as error:
+                    await conn.rollback()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg.DatabaseError) as error:
+            return False, CMD_EXECUTION_FAILED
+
+        with RowWriter(stream=out, buffer_lines=self.output_batch_size) as writer:
+            writer.write_line("Id|Title|Year|Rating|Votes|Watched")
+            writer.write_rows(movies[:page_size])
+            if len(movies) > page_size:
+                writer.write_line("Next Page|" + encode_page_token(movies[page_size - 1].movie_id, search_text))
+        return True, CMD_EXECUTION_SUCCESS
+
+    """
+        Writes the suggested movies to out. Same semantics as Mp2Client.suggest_movies.
+    """
+
+    async def suggest_movies(self, customer, out=None, cowatch=False):
+        try:
+            async with self.pool.connection() as conn:
+                try:
+                    cursor = conn.cursor(row_factory=args_row(Movie))
+                    if cowatch:
+                        await cursor.execute(queries.COWATCH_SUGGESTIONS,
+                                             {"customer_id": customer.customer_id, "watched_movie_ids": None,
+                                              "limit": self.cowatch_limit})
+                        output_movie = await cursor.fetchall()
+                    else:
+                        await cursor.execute(queries.SUGGEST_MOVIES, {"customer_id": customer.customer_id,
+                                                                      "watched_movie_ids": None})
+                        output_movie = sorted(await cursor.fetchall(), key=lambda movie: movie.movie_id)
+                    await conn.commit()
+
+                    with RowWriter(stream=out) as writer:
+                        writer.write_line("Id|Title|Year|Rating|Votes")
+                        writer.write_rows(output_movie)
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg.DatabaseError) as error:
+                    await conn.rollback()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg.DatabaseError) as error:
+            return False, CMD_EXECUTION_FAILED
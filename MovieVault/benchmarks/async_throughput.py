@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+from async_mp2 import AsyncMp2Client
+from customer import Customer
+from mp2 import Mp2Client
+
+"""
+    Compares the command throughput of Mp2Client and AsyncMp2Client with many concurrent customer sessions.
+    Every session runs the same read-only workload: show_plans, show_subscription, search_for_movies
+    and suggest_movies. The synchronous client serves sessions from a thread pool, the asynchronous
+    client from a single event loop; both draw connections from pools of the configured size.
+
+    Run from the MovieVault directory:
+        python -m benchmarks.async_throughput --sessions 64 --rounds 5 --keyword "dark knight"
+"""
+
+
+def load_customers(client, sessions):
+    with client.pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select customerid, planid from customers order by customerid limit %s;", (sessions,))
+        customers = [Customer(customer_id=customer_id, plan_id=plan_id) for customer_id, plan_id in cursor.fetchall()]
+        cursor.close()
+        conn.commit()
+    return customers
+
+
+def run_sync(client, customer, rounds, keyword):
+    for _ in range(rounds):
+        client.show_plans()
+        client.show_subscription(customer=customer)
+        client.search_for_movies(customer=customer, search_text=keyword)
+        client.suggest_movies(customer=customer)
+    return rounds * 4
+
+
+async def run_async(client, customer, rounds, keyword):
+    out = io.StringIO()
+    for _ in range(rounds):
+        await client.show_plans(out=out)
+        await client.show_subscription(customer=customer, out=out)
+        await client.search_for_movies(customer=customer, search_text=keyword, out=out)
+        await client.suggest_movies(customer=customer, out=out)
+        out.seek(0)
+        out.truncate()
+    return rounds * 4
+
+
+def benchmark_sync(config, customers, rounds, keyword):
+    client = Mp2Client(config_filename=config)
+    client.connect()
+    started = time.perf_counter()
+    # output of every thread goes to the same sink, only throughput is measured
+    with redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=len(customers)) as executor:
+        commands = sum(executor.map(lambda customer: run_sync(client, customer, rounds, keyword), customers))
+    elapsed = time.perf_counter() - started
+    client.disconnect()
+    return commands, elapsed
+
+
+async def benchmark_async(config, customers, rounds, keyword):
+    client = AsyncMp2Client(config_filename=config)
+    await client.connect()
+    started = time.perf_counter()
+    commands = sum(await asyncio.gather(*[run_async(client, customer, rounds, keyword) for customer in customers]))
+    elapsed = time.perf_counter() - started
+    await client.disconnect()
+    return commands, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="concurrent throughput of Mp2Client and AsyncMp2Client")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--sessions", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--keyword", default="the")
+    args = parser.parse_args()
+
+    loader = Mp2Client(config_filename=args.config)
+    loader.connect()
+    customers = load_customers(loader, args.sessions)
+    loader.disconnect()
+
+    print("client|sessions|commands|seconds|commands per second")
+    commands, elapsed = benchmark_sync(args.config, customers, args.rounds, args.keyword)
+    print("Mp2Client|%d|%d|%.2f|%.1f" % (len(customers), commands, elapsed, commands / elapsed))
+    commands, elapsed = asyncio.run(benchmark_async(args.config, customers, args.rounds, args.keyword))
+    print("AsyncMp2Client|%d|%d|%.2f|%.1f" % (len(customers), commands, elapsed, commands / elapsed))
+
+
+if __name__ == '__main__':
+    main()
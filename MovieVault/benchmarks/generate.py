@@ -0,0 +1,157 @@
+import argparse
+import io
+import random
+import sys
+import time
+
+import psycopg2
+
+from config import read_config
+
+"""
+    Fills movies, genres, plans, customers and watched with a reproducible synthetic dataset.
+    - The same seed and sizes always produce the same rows.
+    - Movie popularity is skewed: numVotes falls off with the movie number, and customers pick movies with
+      a Zipf-like bias towards popular ones. Watch history lengths are heavy tailed as well.
+    - Rows are streamed to PostgreSQL with COPY in chunks, so memory use does not grow with the scale.
+    - User triggers on the filled tables are disabled during the load; clients listening for changes are
+      sent a single "*" notification afterwards, and precomputed suggestion lists are marked dirty.
+      Run refresh_suggestions --full afterwards to pick up new genres.
+
+    Run from the MovieVault directory, e.g. for one million movies:
+        python -m benchmarks.generate --movies 1000000 --customers 100000 --reset
+"""
+
+GENRES = ["Drama", "Comedy", "Documentary", "Action", "Romance", "Thriller", "Crime", "Horror", "Adventure",
+          "Family", "Mystery", "Biography", "Fantasy", "History", "Music", "Sci-Fi", "Animation", "Musical",
+          "War", "Western", "Sport", "Adult", "Film-Noir", "News", "Reality-TV", "Talk-Show", "Game-Show", "Short"]
+
+WORDS = ["the", "dark", "knight", "love", "night", "man", "last", "day", "story", "world", "city", "girl",
+         "house", "life", "war", "king", "lost", "secret", "return", "blood", "dead", "black", "game", "home",
+         "time", "star", "road", "end", "first", "great", "little", "american", "death", "lady", "summer",
+         "ghost", "island", "river", "heart", "fire", "shadow", "queen", "golden", "silent", "wild", "red",
+         "empire", "dream", "battle", "journey", "stranger", "rising", "falls", "beyond", "part", "one", "two"]
+
+PLANS = [("Basic", "720P", 2, 30), ("Advanced", "1080P", 4, 50), ("Premium", "4K", 10, 90)]
+
+TABLES = ["watched", "genres", "movies", "customers", "plans"]
+
+"""
+    Yields the rows of one table as COPY text format lines.
+"""
+
+
+def movie_lines(rng, movies, id_width):
+    for number in range(1, movies + 1):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 5))).title()
+        start_year = 0 if rng.random() < 0.02 else rng.randint(1920, 2023)
+        votes = int(2500000 / number ** 0.9 * rng.lognormvariate(0, 0.5))
+        rating = 0.0 if votes == 0 else round(rng.uniform(1.0, 10.0), 1)
+        yield "tt%0*d\t%s\t%d\t%.1f\t%d\n" % (id_width, number, title, start_year, rating, votes)
+
+
+def genre_lines(rng, movies, id_width):
+    # popular genres come first in GENRES
+    weights = [1.0 / (rank + 1) for rank in range(len(GENRES))]
+    for number in range(1, movies + 1):
+        for genre in set(rng.choices(GENRES, weights=weights, k=rng.randint(1, 3))):
+            yield "tt%0*d\t%s\n" % (id_width, number, genre)
+
+
+def customer_lines(rng, customers):
+    for number in range(1, customers + 1):
+        yield "%d\tcustomer%d@mp2.com\tpass123\tCustomer\t%d\t0\t%d\n" % (number, number, number, rng.randint(1, len(PLANS)))
+
+
+def watched_lines(rng, customers, movies, id_width, skew, mean_watched, max_watched):
+    for number in range(1, customers + 1):
+        # pareto distributed history length: most customers watch little, a few watch a lot
+        history = min(max_watched, movies, int(mean_watched * (rng.paretovariate(1.5) - 1) / 2) + 1)
+        watched = set()
+        while len(watched) < history:
+            # u ** skew concentrates picks on low, i.e. popular, movie numbers
+            watched.add(int(movies * rng.random() ** skew) + 1)
+        for movie_number in sorted(watched):
+            yield "%d\ttt%0*d\n" % (number, id_width, movie_number)
+
+
+def copy_lines(cursor, table, columns, lines, chunk_rows=100000):
+    copied = 0
+    started = time.perf_counter()
+    buffer = io.StringIO()
+    for line in lines:
+        buffer.write(line)
+        copied += 1
+        if copied % chunk_rows == 0:
+            buffer.seek(0)
+            cursor.copy_expert("copy %s (%s) from stdin" % (table, columns), buffer)
+            buffer = io.StringIO()
+    buffer.seek(0)
+    cursor.copy_expert("copy %s (%s) from stdin" % (table, columns), buffer)
+    elapsed = time.perf_counter() - started
+    print("%s|%d rows|%.1f s|%.0f rows/s" % (table, copied, elapsed, copied / elapsed if elapsed else 0.0),
+          file=sys.stderr)
+    return copied
+
+
+def generate(conn, movies, customers, seed, skew=3.0, mean_watched=40, max_watched=5000, reset=False):
+    id_width = max(7, len(str(movies)))
+    cursor = conn.cursor()
+
+    if reset:
+        cursor.execute("truncate %s restart identity cascade;" % ", ".join(TABLES))
+    for table in TABLES:
+        cursor.execute("alter table %s disable trigger user;" % table)
+
+    cursor.execute("insert into plans (planName, resolution, maxParallelSessions, monthlyFee) values %s;" %
+                   ", ".join(cursor.mogrify("(%s, %s, %s, %s)", plan).decode() for plan in PLANS))
+
+    # every table gets its own generator, so changing one size keeps the rows of the other tables stable
+    copy_lines(cursor, "movies", "movieId, originalTitle, startYear, averageRating, numVotes",
+               movie_lines(random.Random("%d-movies" % seed), movies, id_width))
+    copy_lines(cursor, "genres", "movieId, genre",
+               genre_lines(random.Random("%d-genres" % seed), movies, id_width))
+    copy_lines(cursor, "customers", "customerId, email, password, firstName, lastName, sessionCount, planId",
+               customer_lines(random.Random("%d-customers" % seed), customers))
+    cursor.execute("select setval(pg_get_serial_sequence('customers', 'customerid'), %s);", (max(1, customers),))
+    copy_lines(cursor, "watched", "customerId, movieId",
+               watched_lines(random.Random("%d-watched" % seed), customers, movies, id_width,
+                             skew, mean_watched, max_watched))
+
+    for table in TABLES:
+        cursor.execute("alter table %s enable trigger user;" % table)
+    cursor.execute("select pg_notify('movies_changed', '*'), pg_notify('plans_changed', '*');")
+    # the disabled triggers did not mark precomputed suggestion lists dirty
+    cursor.execute("select to_regclass('suggestion_ranking_lists');")
+    if cursor.fetchone()[0]:
+        cursor.execute("update suggestion_ranking_lists "
+                       "set dirtySince = coalesce(dirtySince, now()), changeCount = changeCount + 1;")
+    conn.commit()
+
+    cursor.execute("analyze;")
+    conn.commit()
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="generate a synthetic MovieVault dataset")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--movies", type=int, default=10000)
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=352)
+    parser.add_argument("--skew", type=float, default=3.0, help="popularity skew of watched movies")
+    parser.add_argument("--mean-watched", type=int, default=40)
+    parser.add_argument("--max-watched", type=int, default=5000)
+    parser.add_argument("--reset", action="store_true", help="truncate the tables before loading")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**read_config(filename=args.config, section="postgresql"))
+    try:
+        generate(conn, args.movies, args.customers, args.seed, skew=args.skew, mean_watched=args.mean_watched,
+                 max_watched=args.max_watched, reset=args.reset)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import io
+import random
+import time
+from contextlib import redirect_stdout
+
+from customer import Customer
+from latency import LatencyRecorder
+from mp2 import Mp2Client
+from benchmarks.results import build_result, write_result
+
+"""
+    Times Mp2Client commands on a dataset made by benchmarks.generate and writes the results as JSON.
+    - Every command runs iterations times for customers and arguments drawn from a seeded generator,
+      so two runs on the same dataset execute the same commands.
+    - Latency percentiles come from latency.LatencyRecorder; printed output is discarded.
+    - Statements per command come from the client's instrumentation (metrics.py), which must be enabled.
+    - watch and subscribe run inside a transaction that is rolled back, so the dataset does not change
+      between runs. Their latency includes one savepoint, which is not counted as a statement.
+    - sign_in is followed by an untimed sign_out.
+
+    Run from the MovieVault directory:
+        python -m benchmarks.harness --iterations 200 --label baseline --output baseline.json
+"""
+
+COMMANDS = ["sign_in", "show_plans", "show_subscription", "search_for_movies", "suggest_movies", "watch", "subscribe"]
+
+ROLLED_BACK_COMMANDS = {"watch", "subscribe"}
+
+
+class RollBack(Exception):
+    pass
+
+
+def load_dataset(client, sample_size):
+    with client.pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select (select count(*) from movies), (select count(*) from customers), "
+                       "(select count(*) from watched), current_setting('server_version_num')::int;")
+        movies, customers, watched, server_version = cursor.fetchone()
+        cursor.execute("select customerid, email, planid from customers order by customerid limit %s;", (sample_size,))
+        customer_rows = cursor.fetchall()
+        cursor.execute("select movieid from movies order by movieid limit %s;", (sample_size,))
+        movie_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("select planid from plans order by planid;")
+        plan_ids = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        conn.commit()
+
+    dataset = {"movies": movies, "customers": customers, "watched": watched}
+    return dataset, server_version, customer_rows, movie_ids, plan_ids
+
+
+"""
+    Returns a function that runs one command with arguments drawn from rng.
+"""
+
+
+def command_runner(client, name, rng, customer_rows, movie_ids, plan_ids, keywords, password, watch_batch):
+    def random_customer():
+        customer_id, email, plan_id = rng.choice(customer_rows)
+        return Customer(customer_id=customer_id, email=email, plan_id=plan_id)
+
+    if name == "sign_in":
+        def run():
+            customer_id, email, plan_id = rng.choice(customer_rows)
+            return client.sign_in(email=email, password=password)
+    elif name == "show_plans":
+        def run():
+            return client.show_plans()
+    elif name == "show_subscription":
+        def run():
+            return client.show_subscription(customer=random_customer())
+    elif name == "search_for_movies":
+        def run():
+            return client.search_for_movies(customer=random_customer(), search_text=rng.choice(keywords))
+    elif name == "suggest_movies":
+        def run():
+            return client.suggest_movies(customer=random_customer())
+    elif name == "watch":
+        def run():
+            return client.watch(customer=random_customer(), movie_ids=rng.sample(movie_ids, min(watch_batch, len(movie_ids))))
+    elif name == "subscribe":
+        def run():
+            return client.subscribe(customer=random_customer(), plan_id=rng.choice(plan_ids))
+    else:
+        raise Exception('Unknown benchmark command {0}'.format(name))
+    return run
+
+
+def run_command(client, name, run, recorder, error_counts):
+    result = None
+    started = time.perf_counter()
+    try:
+        if name in ROLLED_BACK_COMMANDS:
+            with client.transaction():
+                result = run()
+                raise RollBack()
+        else:
+            result = run()
+    except RollBack:
+        pass
+    elapsed = time.perf_counter() - started
+    recorder.record(name, elapsed)
+
+    # sign_in returns (customer or None, message), every other command (status, message)
+    if not result or not result[0]:
+        error_counts[name] = error_counts.get(name, 0) + 1
+    if name == "sign_in" and result and result[0]:
+        client.sign_out(customer=result[0])
+
+
+def run_benchmark(config, commands, iterations, warmup, seed, keywords, password="pass123", watch_batch=10,
+                  sample_size=10000):
+    client = Mp2Client(config_filename=config)
+    if not client.metrics.enabled:
+        raise Exception('The harness needs metrics enabled in {0}'.format(config))
+    client.connect()
+
+    recorder = LatencyRecorder()
+    query_counts = {}
+    error_counts = {}
+    try:
+        dataset, server_version, customer_rows, movie_ids, plan_ids = load_dataset(client, sample_size)
+        with redirect_stdout(io.StringIO()) as sink:
+            for name in commands:
+                # each command has its own generator, so selecting fewer commands does not change the others
+                rng = random.Random("%d-%s" % (seed, name))
+                run = command_runner(client, name, rng, customer_rows, movie_ids, plan_ids, keywords, password,
+                                     watch_batch)
+                for _ in range(warmup):
+                    run_command(client, name, run, LatencyRecorder(), {})
+                client.metrics.reset()
+                for _ in range(iterations):
+                    run_command(client, name, run, recorder, error_counts)
+                    sink.seek(0)
+                    sink.truncate()
+                command_metrics = client.metrics.snapshot()["commands"].get(name)
+                query_counts[name] = command_metrics["statements"] if command_metrics else 0
+    finally:
+        client.disconnect()
+
+    parameters = {"commands": commands, "iterations": iterations, "warmup": warmup, "seed": seed,
+                  "keywords": keywords, "watch_batch": watch_batch, "config": config}
+    return recorder.summary(), query_counts, error_counts, dataset, parameters, server_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="time Mp2Client commands and write the results as JSON")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--commands", nargs="+", default=COMMANDS, choices=COMMANDS)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=352)
+    parser.add_argument("--keywords", nargs="+", default=["dark", "the knight", "love story", "xyz"])
+    parser.add_argument("--password", default="pass123")
+    parser.add_argument("--watch-batch", type=int, default=10, help="movie ids per watch command")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="result file, the summary is only printed if omitted")
+    args = parser.parse_args()
+
+    summary, query_counts, error_counts, dataset, parameters, server_version = run_benchmark(
+        args.config, args.commands, args.iterations, args.warmup, args.seed, args.keywords,
+        password=args.password, watch_batch=args.watch_batch)
+    result = build_result(args.label, summary, query_counts, error_counts, dataset, parameters,
+                          server_version=server_version)
+
+    print("Command|Count|Errors|Queries/Call|p50 ms|p95 ms|p99 ms|Max ms")
+    for name, command in sorted(result["commands"].items()):
+        print("%s|%d|%d|%.1f|%.2f|%.2f|%.2f|%.2f" % (name, command["count"], command["errors"],
+                                                     command["queries_per_call"], command["p50_ms"],
+                                                     command["p95_ms"], command["p99_ms"], command["max_ms"]))
+    if args.output:
+        write_result(result, args.output)
+
+
+if __name__ == '__main__':
+    main()
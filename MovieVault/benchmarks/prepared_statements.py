@@ -0,0 +1,125 @@
+import argparse
+import io
+import random
+import re
+import statistics
+import time
+from contextlib import redirect_stdout
+
+from customer import Customer
+from mp2 import Mp2Client
+import prepared
+
+"""
+    Compares watch and suggest_movies with and without server-side prepared statements.
+    - Both modes run the same seeded sequence of commands. watch runs in a transaction that is rolled back,
+      so the dataset does not change.
+    - Besides the command latency, the planning time PostgreSQL reports for the suggestion statement is
+      shown, once for the plain statement and once for the prepared one after it has been run repeatedly.
+
+    Run from the MovieVault directory:
+        python -m benchmarks.prepared_statements --iterations 500 --watch-batch 20
+"""
+
+PLANNING_TIME = re.compile(r"Planning Time: ([0-9.]+) ms")
+
+
+class RollBack(Exception):
+    pass
+
+
+def open_client(config, use_prepared):
+    client = Mp2Client(config_filename=config)
+    if use_prepared:
+        client.pool.conn_params["connection_factory"] = prepared.PreparedConnection
+    else:
+        client.pool.conn_params.pop("connection_factory", None)
+    client.connect()
+    return client
+
+
+def load_arguments(client, sample_size):
+    with client.pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select customerid from customers order by customerid limit %s;", (sample_size,))
+        customer_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("select movieid from movies order by movieid limit %s;", (sample_size,))
+        movie_ids = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        conn.commit()
+    return customer_ids, movie_ids
+
+
+def time_commands(client, iterations, seed, customer_ids, movie_ids, watch_batch):
+    rng = random.Random(seed)
+    timings = {"watch": [], "suggest_movies": []}
+    with redirect_stdout(io.StringIO()) as sink:
+        for _ in range(iterations):
+            customer = Customer(customer_id=rng.choice(customer_ids))
+            movie_batch = rng.sample(movie_ids, min(watch_batch, len(movie_ids)))
+
+            started = time.perf_counter()
+            try:
+                with client.transaction():
+                    client.watch(customer=customer, movie_ids=movie_batch)
+                    raise RollBack()
+            except RollBack:
+                pass
+            timings["watch"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            client.suggest_movies(customer=customer)
+            timings["suggest_movies"].append(time.perf_counter() - started)
+            sink.seek(0)
+            sink.truncate()
+    return timings
+
+
+def planning_time(client, customer_id, use_prepared, repeat=10):
+    statement = prepared.SUGGEST_MOVIES
+    params = {"customer_id": customer_id, "watched_movie_ids": None}
+    with client.pool.connection() as conn:
+        cursor = conn.cursor()
+        if use_prepared:
+            # the first executions of a prepared statement are planned like plain ones,
+            # later ones may reuse a generic plan
+            for _ in range(repeat):
+                prepared.execute(cursor, statement, params)
+                cursor.fetchall()
+            query = "explain (analyze, summary) " + statement.execute_sql
+        else:
+            query = "explain (analyze, summary) " + statement.sql.strip().rstrip(";")
+        cursor.execute(query, params)
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+        cursor.close()
+        conn.rollback()
+    match = PLANNING_TIME.search(plan)
+    return float(match.group(1)) if match else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="watch and suggest_movies with and without prepared statements")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--watch-batch", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=352)
+    args = parser.parse_args()
+
+    print("Mode|Command|Calls|Median ms|Mean ms|Total s|Suggest Planning ms")
+    for use_prepared in (False, True):
+        client = open_client(args.config, use_prepared)
+        try:
+            customer_ids, movie_ids = load_arguments(client, 10000)
+            timings = time_commands(client, args.iterations, args.seed, customer_ids, movie_ids, args.watch_batch)
+            planning_ms = planning_time(client, customer_ids[0], use_prepared)
+        finally:
+            client.disconnect()
+
+        mode = "prepared" if use_prepared else "plain"
+        for name, durations in sorted(timings.items()):
+            print("%s|%s|%d|%.3f|%.3f|%.3f|%.3f" % (mode, name, len(durations), statistics.median(durations) * 1000,
+                                                    statistics.mean(durations) * 1000, sum(durations), planning_ms))
+
+
+if __name__ == '__main__':
+    main()
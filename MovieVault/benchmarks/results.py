@@ -0,0 +1,121 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+"""
+    JSON format of benchmark runs, and a comparison of two runs.
+
+    A result file looks like:
+        {
+            "format": 1,
+            "label": "baseline",
+            "created_at": "2026-10-18T12:00:00Z",
+            "environment": {"python": "3.8.10", "platform": "...", "server_version": 120004},
+            "dataset": {"movies": 1000000, "customers": 100000, "watched": 4100000},
+            "parameters": {"iterations": 200, "seed": 352, ...},
+            "commands": {
+                "search_for_movies": {"count": 200, "errors": 0, "queries_per_call": 1.0,
+                                      "p50_ms": 12.1, "p95_ms": 30.2, "p99_ms": 41.0, "max_ms": 52.3, "mean_ms": 14.9},
+                ...
+            }
+        }
+
+    Compare two runs from the MovieVault directory:
+        python -m benchmarks.results baseline.json candidate.json --threshold 0.10
+"""
+
+RESULT_FORMAT = 1
+
+COMPARED_METRICS = ["p50_ms", "p95_ms", "p99_ms", "queries_per_call"]
+
+"""
+    Builds a result dictionary from a LatencyRecorder summary and per command query and error counts.
+"""
+
+
+def build_result(label, latency_summary, query_counts, error_counts, dataset, parameters, server_version=None):
+    commands = {}
+    for name, latency in latency_summary.items():
+        commands[name] = {
+            "count": latency["count"],
+            "errors": error_counts.get(name, 0),
+            "queries_per_call": query_counts.get(name, 0) / latency["count"],
+            "p50_ms": latency["p50"] * 1000,
+            "p95_ms": latency["p95"] * 1000,
+            "p99_ms": latency["p99"] * 1000,
+            "max_ms": latency["max"] * 1000,
+            "mean_ms": latency["total"] * 1000 / latency["count"],
+        }
+
+    return {
+        "format": RESULT_FORMAT,
+        "label": label,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server_version": server_version,
+        },
+        "dataset": dataset,
+        "parameters": parameters,
+        "commands": commands,
+    }
+
+
+def write_result(result, path):
+    with open(path, "w") as result_file:
+        json.dump(result, result_file, indent=2, sort_keys=True, default=str)
+        result_file.write("\n")
+
+
+def read_result(path):
+    with open(path) as result_file:
+        result = json.load(result_file)
+    if result.get("format") != RESULT_FORMAT:
+        raise Exception('Unsupported benchmark result format {0} in {1}'.format(result.get("format"), path))
+    return result
+
+
+"""
+    Compares the commands both runs measured.
+    Returns (command, metric, baseline, candidate, relative change, regressed) rows, where regressed is set
+    if the candidate is more than threshold (a fraction) worse than the baseline.
+"""
+
+
+def compare_results(baseline, candidate, threshold=0.10):
+    rows = []
+    for name in sorted(set(baseline["commands"]) & set(candidate["commands"])):
+        for metric in COMPARED_METRICS:
+            before = baseline["commands"][name][metric]
+            after = candidate["commands"][name][metric]
+            change = (after - before) / before if before else 0.0
+            rows.append((name, metric, before, after, change, change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown reported as regression")
+    args = parser.parse_args()
+
+    baseline = read_result(args.baseline)
+    candidate = read_result(args.candidate)
+    if baseline["dataset"] != candidate["dataset"]:
+        print("warning: the runs used different datasets", file=sys.stderr)
+
+    rows = compare_results(baseline, candidate, threshold=args.threshold)
+    print("Command|Metric|%s|%s|Change|Regression" % (baseline["label"], candidate["label"]))
+    for name, metric, before, after, change, regressed in rows:
+        print("%s|%s|%.2f|%.2f|%+.1f%%|%s" % (name, metric, before, after, change * 100, "yes" if regressed else "no"))
+
+    # a non-zero exit status lets scripts fail on regressions
+    sys.exit(1 if any(row[5] for row in rows) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import gc
+import tracemalloc
+
+from movie import Movie
+from mp2 import Mp2Client
+import queries
+from rows import rows_as
+
+"""
+    Measures the memory held by large result sets as plain tuples and as Movie objects.
+    - search: the rows search_for_movies reads for each keyword, with the watched flag.
+    - catalogue: every movie, as the numpy suggestion engine holds it.
+    Each result set is read completely before tracemalloc starts, so only the Python objects built by fetchall
+    are counted. "Held" is what the fetched list keeps alive, "peak" includes the tuples that are dropped
+    once converted.
+
+    Run from the MovieVault directory:
+        python -m benchmarks.row_memory --customer-id 1 a the
+"""
+
+CATALOGUE = "select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes from movies m;"
+
+
+def measure(cursor, query, params, factory):
+    with rows_as(cursor, factory):
+        cursor.execute(query, params)
+        gc.collect()
+        tracemalloc.start()
+        rows = cursor.fetchall()
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    count = len(rows)
+    del rows
+    return count, held, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="result set memory as tuples and as Movie objects")
+    parser.add_argument("keywords", nargs="*", default=["a"])
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--customer-id", type=int, default=1)
+    args = parser.parse_args()
+
+    client = Mp2Client(config_filename=args.config)
+    client.pool.open()
+
+    result_sets = [("search " + keyword, queries.SEARCH_MOVIES.format(match="m.originaltitle ILIKE %s"),
+                    (args.customer_id, "%" + keyword + "%")) for keyword in args.keywords]
+    result_sets.append(("catalogue", CATALOGUE, None))
+
+    print("Result|Rows|Tuple Held MB|Movie Held MB|Saved %|Tuple Peak MB|Movie Peak MB|Tuple B/row|Movie B/row")
+    with client.pool.connection() as conn:
+        cursor = conn.cursor()
+        for label, query, params in result_sets:
+            rows, tuple_held, tuple_peak = measure(cursor, query, params, None)
+            rows, movie_held, movie_peak = measure(cursor, query, params, Movie.from_row)
+            saved = 100.0 * (tuple_held - movie_held) / tuple_held if tuple_held else 0.0
+            print("%s|%d|%.2f|%.2f|%.1f|%.2f|%.2f|%.0f|%.0f" % (
+                label, rows, tuple_held / 1e6, movie_held / 1e6, saved, tuple_peak / 1e6, movie_peak / 1e6,
+                tuple_held / rows if rows else 0.0, movie_held / rows if rows else 0.0))
+        cursor.close()
+        conn.rollback()
+    client.pool.close()
+
+
+if __name__ == '__main__':
+    main()
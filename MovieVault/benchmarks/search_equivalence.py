@@ -0,0 +1,80 @@
+import argparse
+import random
+import sys
+
+from mp2 import Mp2Client
+from search import NgramSearchEngine, ScanSearchEngine
+
+"""
+    Checks that the ngram search engine matches exactly the movies the scan engine's ILIKE matches.
+    - Search texts are the fixed cases below, which exercise the ILIKE wildcards, escapes and a trailing
+      backslash, plus a seeded sample of substrings of real titles with some characters replaced by them.
+    - The ngram engine is built on the current dataset with max_candidates unlimited, so every text is
+      answered from the index.
+    Exits with status 1 if any search text matches different movies.
+
+    Run from the MovieVault directory:
+        python -m benchmarks.search_equivalence --sample 500 --seed 352
+"""
+
+CASES = ["", "a", "the", "THE dark", "%", "_", "__", "%%", "a%b", "a_c", "100%", "\\", "\\\\", "a\\",
+         "the\\", "\\%", "\\_", "50\\%", "a\\_b", "\\a", "'", "\"", "...", "é", "Ü"]
+
+
+def sample_cases(titles, sample, seed):
+    rng = random.Random(seed)
+    cases = []
+    for title in rng.sample(titles, min(sample, len(titles))):
+        start = rng.randrange(len(title))
+        text = list(title[start:start + rng.randint(1, 8)])
+        for position in range(len(text)):
+            if rng.random() < 0.1:
+                text[position] = rng.choice("%_\\")
+        cases.append("".join(text))
+    return cases
+
+
+def scan_movie_ids(cursor, search_text):
+    match_clause, match_params = ScanSearchEngine().match_clause(search_text)
+    cursor.execute("select m.movieid from movies m where " + match_clause + ";", match_params)
+    return set(row[0] for row in cursor.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare ngram search results with the ILIKE scan")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--gram-size", type=int, default=3)
+    parser.add_argument("--sample", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=352)
+    args = parser.parse_args()
+
+    client = Mp2Client(config_filename=args.config)
+    client.connect()
+
+    engine = NgramSearchEngine(gram_size=args.gram_size, max_candidates=sys.maxsize)
+    engine.pool = client.pool
+    engine.rebuild()
+
+    mismatches = 0
+    with client.pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select m.originaltitle from movies m where m.originaltitle <> '';")
+        titles = [row[0] for row in cursor.fetchall()]
+        cases = CASES + sample_cases(titles, args.sample, args.seed)
+        for search_text in cases:
+            expected = scan_movie_ids(cursor, search_text)
+            actual = set(engine.search(search_text))
+            if actual != expected:
+                mismatches += 1
+                print("%r: scan only %s, ngram only %s" % (search_text, sorted(expected - actual)[:10],
+                                                         sorted(actual - expected)[:10]))
+        conn.rollback()
+        cursor.close()
+    client.disconnect()
+
+    print("%d search texts compared, %d mismatches" % (len(cases), mismatches))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import io
+import statistics
+import time
+from contextlib import redirect_stdout
+
+from customer import Customer
+from mp2 import Mp2Client
+
+"""
+    Measures search_for_movies latency for keywords with growing result counts.
+    The watched flag comes from the customer's in-memory watched set, so latency should follow the scan cost
+    rather than grow by one round trip per result row.
+    The search result cache is disabled unless --cache is given, since it would serve every repeat after the
+    first. With --cache, the first (miss) timing is the one that reads the database.
+
+    Run from the MovieVault directory:
+        python -m benchmarks.search_latency --customer-id 1 a the dark knight
+"""
+
+
+def time_search(client, customer, keyword, repeat):
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        output = io.StringIO()
+        started = time.perf_counter()
+        with redirect_stdout(output):
+            status, message = client.search_for_movies(customer=customer, search_text=keyword)
+        timings.append(time.perf_counter() - started)
+        if not status:
+            raise RuntimeError("search_for_movies %r failed: %s" % (keyword, message))
+        # the first line is the header
+        rows = output.getvalue().count("\n") - 1
+    return rows, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="search_for_movies latency by result count")
+    parser.add_argument("keywords", nargs="+")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--customer-id", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cache", action="store_true", help="keep the search result cache enabled")
+    args = parser.parse_args()
+
+    client = Mp2Client(config_filename=args.config)
+    if not args.cache:
+        client.search_cache = None
+    client.connect()
+    customer = Customer(customer_id=args.customer_id)
+
+    print("keyword|rows|first ms|median ms|ms per 1k rows")
+    for keyword in args.keywords:
+        rows, timings = time_search(client, customer, keyword, args.repeat)
+        median_ms = statistics.median(timings) * 1000
+        per_1k = median_ms * 1000 / rows if rows else 0.0
+        print("%s|%d|%.2f|%.2f|%.2f" % (keyword, rows, timings[0] * 1000, median_ms, per_1k))
+
+    client.disconnect()
+
+
+if __name__ == '__main__':
+    main()
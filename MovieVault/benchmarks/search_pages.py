@@ -0,0 +1,52 @@
+import argparse
+import statistics
+import time
+
+from customer import Customer
+from mp2 import Mp2Client
+
+"""
+    Walks through every page of a paginated search and times each page.
+    Pages continue with a keyset seek on movieid, so the last pages should take as long as the first ones
+    instead of growing with the number of skipped rows as OFFSET would.
+
+    Run from the MovieVault directory:
+        python -m benchmarks.search_pages --page-size 50 --max-pages 200 a
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="latency of every page of a paginated search")
+    parser.add_argument("keywords", nargs="+")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--customer-id", type=int, default=1)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--max-pages", type=int, default=200)
+    args = parser.parse_args()
+
+    client = Mp2Client(config_filename=args.config)
+    client.connect()
+    customer = Customer(customer_id=args.customer_id)
+    search_text = " ".join(args.keywords)
+
+    timings = []
+    page_token = None
+    while len(timings) < args.max_pages:
+        started = time.perf_counter()
+        movies, page_token = client.search_page(customer, search_text, args.page_size, page_token)
+        timings.append(time.perf_counter() - started)
+        if page_token is None:
+            break
+    client.disconnect()
+
+    print("Page|ms")
+    for number, elapsed in enumerate(timings, start=1):
+        print("%d|%.3f" % (number, elapsed * 1000))
+    tenth = max(1, len(timings) // 10)
+    print("Pages|First 10%% Median ms|Last 10%% Median ms")
+    print("%d|%.3f|%.3f" % (len(timings), statistics.median(timings[:tenth]) * 1000,
+                            statistics.median(timings[-tenth:]) * 1000))
+
+
+if __name__ == '__main__':
+    main()
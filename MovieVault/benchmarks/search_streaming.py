@@ -0,0 +1,60 @@
+import argparse
+import io
+import sys
+from contextlib import redirect_stdout
+
+from customer import Customer
+from mp2 import Mp2Client
+
+"""
+    Runs one search_for_movies with output streaming on and one with it off, and checks that both succeed
+    and print the same rows. The search cache is disabled, so both searches read from the database.
+    Exits with status 1 if either search fails or their output differs.
+
+    Run from the MovieVault directory:
+        python -m benchmarks.search_streaming --batch-size 2 dark knight
+"""
+
+
+def run_search(client, customer, search_text, streaming):
+    client.output_streaming = streaming
+    output = io.StringIO()
+    with redirect_stdout(output):
+        status, message = client.search_for_movies(customer, search_text)
+    return status, message, output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="search_for_movies with and without output streaming")
+    parser.add_argument("keywords", nargs="+")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--customer-id", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=2,
+                        help="rows per round trip of the server-side cursor; small values fetch several batches")
+    args = parser.parse_args()
+
+    client = Mp2Client(config_filename=args.config)
+    client.search_cache = None
+    client.output_batch_size = args.batch_size
+    client.connect()
+    customer = Customer(customer_id=args.customer_id)
+    search_text = " ".join(args.keywords)
+
+    try:
+        results = {streaming: run_search(client, customer, search_text, streaming) for streaming in (True, False)}
+    finally:
+        client.disconnect()
+
+    failed = False
+    for streaming, (status, message, output) in results.items():
+        rows = output.count("\n") - 1
+        print("streaming=%s|%s|%d rows" % (streaming, "OK" if status else message, rows))
+        failed = failed or not status
+    if results[True][2] != results[False][2]:
+        print("streamed and buffered output differ")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import sys
+import threading
+import time
+
+from mp2 import Mp2Client
+
+"""
+    Checks that concurrent sign-ins never exceed maxParallelSessions.
+    Hundreds of threads spread over several clients (each with its own connection pool) sign in to
+    the same customer at once. Exactly maxParallelSessions of them must succeed, and sessionCount and the
+    number of session leases must both equal the number of successful sign-ins. Every session is then
+    signed out and both must return to zero.
+
+    The customer must exist and have no open sessions. Run from the MovieVault directory:
+        python -m benchmarks.session_stress --email customer1@mp2.com --password pass123 --threads 400
+"""
+
+
+def session_state(client, email):
+    with client.pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select c.sessioncount, p.maxparallelsessions, "
+                       "(select count(*) from customer_sessions s where s.customerid = c.customerid) "
+                       "from customers c, plans p where c.email = %s and p.planid = c.planid;", (email,))
+        state = cursor.fetchone()
+        cursor.close()
+        conn.commit()
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="concurrent sign_in overshoot check")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--threads", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    clients = [Mp2Client(config_filename=args.config) for _ in range(args.clients)]
+    for client in clients:
+        client.connect()
+
+    failed = False
+    try:
+        session_count, max_sessions, leases = session_state(clients[0], args.email)
+        if session_count or leases:
+            raise Exception('{0} already has {1} sessions and {2} leases'.format(args.email, session_count, leases))
+
+        print("Round|Threads|Signed In|Max Sessions|Session Count|Leases|Seconds|Result")
+        for round_number in range(1, args.rounds + 1):
+            barrier = threading.Barrier(args.threads)
+            signed_in = []
+            signed_in_lock = threading.Lock()
+
+            def sign_in(client):
+                barrier.wait()
+                customer, message = client.sign_in(email=args.email, password=args.password)
+                if customer:
+                    with signed_in_lock:
+                        signed_in.append((client, customer))
+
+            threads = [threading.Thread(target=sign_in, args=(clients[number % len(clients)],))
+                       for number in range(args.threads)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            session_count, max_sessions, leases = session_state(clients[0], args.email)
+            correct = len(signed_in) == max_sessions == session_count == leases
+            failed = failed or not correct
+            print("%d|%d|%d|%d|%d|%d|%.3f|%s" % (round_number, args.threads, len(signed_in), max_sessions,
+                                                 session_count, leases, elapsed, "ok" if correct else "OVERSHOOT"))
+
+            for client, customer in signed_in:
+                client.sign_out(customer=customer)
+            session_count, max_sessions, leases = session_state(clients[0], args.email)
+            if session_count or leases:
+                failed = True
+                print("sign_out left %d sessions and %d leases" % (session_count, leases))
+    finally:
+        for client in clients:
+            client.disconnect()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from mp2 import Mp2Client
+from suggestions import NumpySuggestionEngine, SqlSuggestionEngine
+
+"""
+    Compares the numpy suggestion engine with the sql engine on the current dataset, e.g. one built with
+        python -m benchmarks.generate --movies 1000000 --customers 100000 --reset
+    - Reports how long the numpy engine takes to load the catalogue, and the latency of both engines for
+      a seeded sample of customers.
+    - Checks that both engines suggest the same movies. Results that differ only in movies tied on
+      numVotes are counted as ties, since PostgreSQL picks among tied movies arbitrarily.
+    Exits with status 1 if any customer gets different suggestions.
+
+    Run from the MovieVault directory:
+        python -m benchmarks.suggest_numpy --sample 200 --seed 352
+"""
+
+
+def time_suggest(engine, cursor, customer_ids):
+    results = {}
+    timings = []
+    for customer_id in customer_ids:
+        started = time.perf_counter()
+        results[customer_id] = set(engine.suggest(cursor, customer_id))
+        timings.append(time.perf_counter() - started)
+    cursor.connection.rollback()
+    return results, timings
+
+
+def by_movie_id(movies):
+    return sorted(movies, key=lambda movie: movie.movie_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="numpy and sql suggestion engines side by side")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--sample", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=352)
+    args = parser.parse_args()
+
+    client = Mp2Client(config_filename=args.config)
+    client.connect()
+
+    sql_engine = SqlSuggestionEngine()
+    numpy_engine = NumpySuggestionEngine()
+    numpy_engine.pool = client.pool
+    started = time.perf_counter()
+    movies = numpy_engine.refresh(full=True)
+    load_seconds = time.perf_counter() - started
+
+    with client.pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select distinct w.customerid from watched w order by w.customerid;")
+        customer_ids = [row[0] for row in cursor.fetchall()]
+        customer_ids = random.Random(args.seed).sample(customer_ids, min(args.sample, len(customer_ids)))
+        conn.rollback()
+
+        # one untimed call each, so neither engine pays for a cold cache
+        for engine in (sql_engine, numpy_engine):
+            time_suggest(engine, cursor, customer_ids[:1])
+        expected, sql_timings = time_suggest(sql_engine, cursor, customer_ids)
+        actual, numpy_timings = time_suggest(numpy_engine, cursor, customer_ids)
+        cursor.close()
+    client.disconnect()
+
+    print("Movies|Load s")
+    print("%d|%.2f" % (movies, load_seconds))
+    print("Engine|Calls|Median ms|p95 ms|Mean ms")
+    for name, timings in (("sql", sql_timings), ("numpy", numpy_timings)):
+        timings = sorted(timings)
+        print("%s|%d|%.3f|%.3f|%.3f" % (name, len(timings), statistics.median(timings) * 1000,
+                                        timings[int(0.95 * (len(timings) - 1))] * 1000,
+                                        statistics.mean(timings) * 1000))
+
+    matches = ties = mismatches = 0
+    for customer_id in customer_ids:
+        if actual[customer_id] == expected[customer_id]:
+            matches += 1
+        elif (sorted(movie.votes or 0 for movie in actual[customer_id]) ==
+              sorted(movie.votes or 0 for movie in expected[customer_id])):
+            ties += 1
+        else:
+            mismatches += 1
+            print("customer %d: sql only %s, numpy only %s" % (customer_id,
+                                                               by_movie_id(expected[customer_id] - actual[customer_id]),
+                                                               by_movie_id(actual[customer_id] - expected[customer_id])))
+    print("%d customers compared, %d matches, %d ties, %d mismatches" % (len(customer_ids), matches, ties,
+                                                                         mismatches))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import io
+import random
+import sys
+from contextlib import redirect_stdout
+
+from customer import Customer
+from mp2 import Mp2Client
+
+"""
+    Compares suggest_movies output with the original per-genre implementation for a seeded sample of customers.
+    Customers without watched movies are skipped, the original implementation could not serve them.
+    Movies tied on numVotes may be picked in a different order by the two implementations.
+    Exits with status 1 if any customer gets a different suggestion list.
+
+    Run from the MovieVault directory:
+        python -m benchmarks.suggest_regression --sample 100 --seed 352
+"""
+
+
+def legacy_suggestions(cursor, customer_id):
+    search_genre_query = "select distinct g.genre from watched w, movies m, genres g where w.customerid= %s and  w.movieid = m.movieid and g.movieid = m.movieid;"
+    step1_query = "select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes from movies m, genres g where m.movieid = g.movieid and g.genre = %s and m.movieid not in (select w.movieid from watched w where w.customerid = %s) order by m.numvotes desc limit 1;"
+    step2_query = "select * from movies m where m.startyear >= 2010 and m.movieid not in (select w.movieid from watched w where w.customerid = %s) order by m.numvotes desc, m.averagerating desc limit 10;"
+    search_average_watched_movie_query = "select avg(m.numvotes) from watched w, movies m where w.customerid = %s and m.movieid = w.movieid;"
+    step3_query = "select * from movies m where m.numvotes > %s and m.movieid not in (select w.movieid from watched w where w.customerid =%s) order by m.numvotes desc limit 10;"
+
+    output_movie = set()
+    cursor.execute(search_genre_query, (customer_id,))
+    for genre in cursor.fetchall():
+        cursor.execute(step1_query, (genre, customer_id,))
+        output_movie.add(cursor.fetchone())
+
+    cursor.execute(step2_query, (customer_id,))
+    output_movie.update(cursor.fetchall())
+
+    cursor.execute(search_average_watched_movie_query, (customer_id,))
+    average_votes = cursor.fetchall()
+    cursor.execute(step3_query, (float(average_votes[0][0]), customer_id,))
+    output_movie.update(cursor.fetchall())
+
+    lines = ["Id|Title|Year|Rating|Votes"]
+    for movie in sorted(output_movie, key=lambda movie: movie[0]):
+        lines.append("|".join(str(column) for column in movie))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare suggest_movies with the original implementation")
+    parser.add_argument("--config", default="database.cfg")
+    parser.add_argument("--sample", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=352)
+    args = parser.parse_args()
+
+    client = Mp2Client(config_filename=args.config)
+    client.connect()
+
+    with client.pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select distinct w.customerid from watched w order by w.customerid;")
+        customer_ids = [row[0] for row in cursor.fetchall()]
+        customer_ids = random.Random(args.seed).sample(customer_ids, min(args.sample, len(customer_ids)))
+
+        mismatches = 0
+        for customer_id in customer_ids:
+            expected = legacy_suggestions(cursor, customer_id)
+            conn.rollback()
+
+            output = io.StringIO()
+            with redirect_stdout(output):
+                status, message = client.suggest_movies(customer=Customer(customer_id=customer_id))
+            actual = output.getvalue().splitlines()
+
+            if not status:
+                mismatches += 1
+                print("customer %d: %s" % (customer_id, message))
+            elif actual != expected:
+                mismatches += 1
+                print("customer %d: expected %s, got %s" % (customer_id, expected[1:], actual[1:]))
+        cursor.close()
+
+    client.disconnect()
+    print("%d customers compared, %d mismatches" % (len(customer_ids), mismatches))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
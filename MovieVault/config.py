@@ -1,7 +1,7 @@
 from configparser import ConfigParser
 
 
-def read_config(filename="database.cfg", section="postgresql"):
+def read_config(filename="database.cfg", section="postgresql", required=True):
     # create a parser
     parser = ConfigParser()
     # read config file
@@ -13,7 +13,41 @@ def read_config(filename="database.cfg", section="postgresql"):
         params = parser.items(section)
         for param in params:
             db[param[0]] = param[1]
-    else:
+    elif required:
         raise Exception('Section {0} not found in the {1} file'.format(section, filename))
 
     return db
+
+
+"""
+    Returns {section name: params} for every section whose name starts with prefix, in file order.
+"""
+
+
+def read_config_sections(filename="database.cfg", prefix="replica."):
+    parser = ConfigParser()
+    parser.read(filename)
+    return {section: dict(parser.items(section)) for section in parser.sections() if section.startswith(prefix)}
+
+
+"""
+    Helpers for reading typed options out of a section returned by read_config.
+    Missing or empty options fall back to the given default.
+"""
+
+
+def get_int(params, key, default):
+    value = params.get(key, "")
+    return int(value) if value.strip() else default
+
+
+def get_float(params, key, default):
+    value = params.get(key, "")
+    return float(value) if value.strip() else default
+
+
+def get_bool(params, key, default):
+    value = params.get(key, "").strip().lower()
+    if not value:
+        return default
+    return value in ("1", "yes", "true", "on")
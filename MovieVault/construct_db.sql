@@ -56,6 +56,7 @@ create table if not exists customers (
 	lastName text,
 	sessionCount int,
 	planId int,
+	watchedVersion bigint not null default 0,
 	primary key (customerId),
 	foreign key (planId) references plans(planId) on delete cascade,
 	unique (email)
@@ -67,6 +68,13 @@ create table if not exists watched (
 	foreign key (customerId) references customers(customerId) on delete cascade,
 	foreign key (movieId) references movies(movieId) on delete cascade
 );
+/* filled by cowatch.py: the movies most often watched together with each movie, best first */
+create table if not exists movie_neighbors (
+	movieId text,
+	neighborIds text[] not null,
+	scores real[] not null,
+	primary key (movieId)
+);
 
 /* these inserted values are for testing purposes, you can play with the database as much as you want. */ 
 insert into plans(planName, resolution, maxParallelSessions, monthlyFee) 
@@ -0,0 +1,250 @@
+import argparse
+import csv
+import io
+import time
+
+import numpy as np
+import psycopg2
+import scipy.sparse
+
+from config import read_config
+from loader import report
+
+POSTGRESQL_CONFIG_FILE_NAME = "database.cfg"
+
+"""
+    Offline job that precomputes the co-watch neighbours served by suggest_movies --cowatch.
+    - watched is read as a sparse customer-by-movie matrix X. Customers with more than max_history watched
+      movies contribute a fixed pseudo-random sample of max_history of them, so a few heavy watchers neither
+      dominate the scores nor blow up the product.
+    - X^T X counts, for every pair of movies, the customers who watched both. It is computed for a block of
+      movies at a time and only the top neighbours of each movie are kept, so memory is bounded by X
+      (about 16 bytes per watched row) plus one block of the product. Blocks are cut so the product holds
+      at most block_nnz entries (about 8 bytes each): a movie's row of the product has at most as many
+      entries as the watch histories of its watchers have movies. A movie above block_nnz on its own is
+      a block by itself.
+    - Neighbours are scored by cosine similarity, co-watch count / sqrt(count i * count j). Pairs watched
+      together by fewer than min_support customers are dropped.
+    - Results go into a new table that replaces movie_neighbors in one short transaction, so clients keep
+      reading the previous lists while the job runs.
+"""
+
+# customers and movies as dense matrix positions; movies are numbered in movieid order
+READ_WATCHED = """
+    copy (
+        select w.customerid, n.position
+        from (select w.customerid, w.movieid,
+                  row_number() over (partition by w.customerid order by md5(w.movieid || %(seed)s)) as sample
+              from watched w) w
+            join (select m.movieid, row_number() over (order by m.movieid) - 1 as position from movies m) n
+                on n.movieid = w.movieid
+        where %(max_history)s = 0 or w.sample <= %(max_history)s
+    ) to stdout"""
+
+BUILD_DDL = [
+    "drop table if exists movie_neighbors_build;",
+    """create table movie_neighbors_build (
+        movieId text,
+        neighborIds text[] not null,
+        scores real[] not null
+    );""",
+]
+
+SWAP_DDL = [
+    "alter table movie_neighbors_build add constraint movie_neighbors_build_pkey primary key (movieId);",
+    "drop table if exists movie_neighbors;",
+    "alter table movie_neighbors_build rename to movie_neighbors;",
+    "alter index movie_neighbors_build_pkey rename to movie_neighbors_pkey;",
+    "analyze movie_neighbors;",
+]
+
+COPY_NEIGHBORS = "copy movie_neighbors_build (movieId, neighborIds, scores) from stdin with (format csv)"
+
+
+"""
+    File-like COPY target that parses "customer<TAB>position" lines as they arrive, chunk_bytes at a time,
+    into int32 arrays instead of keeping the text.
+"""
+
+
+class PairReader(io.RawIOBase):
+    def __init__(self, chunk_bytes=1 << 24):
+        self.chunk_bytes = chunk_bytes
+        self.chunks = []
+        self.rows = 0
+        self._pending = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pending += data
+        if len(self._pending) >= self.chunk_bytes:
+            self._parse(self._pending.rfind(b"\n") + 1)
+        return len(data)
+
+    def pairs(self):
+        self._parse(len(self._pending))
+        if not self.chunks:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        values = np.concatenate(self.chunks)
+        self.chunks = []
+        return values[0::2], values[1::2]
+
+    def _parse(self, end):
+        if end <= 0:
+            return
+        values = np.array(bytes(self._pending[:end]).split(), dtype=np.int64).astype(np.int32)
+        del self._pending[:end]
+        self.chunks.append(values)
+        self.rows += len(values) // 2
+
+
+def read_movie_ids(cursor):
+    cursor.execute("select m.movieid from movies m order by m.movieid;")
+    return [row[0] for row in cursor.fetchall()]
+
+
+"""
+    Returns the customer-by-movie matrix of watched as CSR with float32 ones.
+"""
+
+
+def read_watched(cursor, movie_count, max_history, seed):
+    started = time.perf_counter()
+    reader = PairReader()
+    cursor.copy_expert(cursor.mogrify(READ_WATCHED, {"max_history": max_history, "seed": str(seed)}).decode(),
+                       reader)
+    customers, movies = reader.pairs()
+    # customer ids become dense row numbers
+    customer_ids, rows = np.unique(customers, return_inverse=True)
+    del customers
+    matrix = scipy.sparse.csr_matrix((np.ones(len(movies), dtype=np.float32), (rows.astype(np.int32), movies)),
+                                     shape=(len(customer_ids), movie_count))
+    elapsed = time.perf_counter() - started
+    report("watched|%d rows|%d customers|%.1f s" % (matrix.nnz, len(customer_ids), elapsed))
+    return matrix
+
+
+def array_literal(values):
+    return "{" + ",".join('"%s"' % value.replace("\\", "\\\\").replace('"', '\\"') for value in values) + "}"
+
+
+"""
+    Yields (start, end) movie position ranges whose rows of X^T X have at most block_nnz entries in total,
+    estimated from the length of every customer's history.
+"""
+
+
+def product_blocks(matrix, by_movie, block_nnz):
+    history = np.diff(matrix.indptr).astype(np.float64)
+    # upper bound of the entries in each movie's row: the histories of its watchers, summed
+    estimates = np.cumsum(by_movie @ history)
+    movie_count = matrix.shape[1]
+    block_start = 0
+    while block_start < movie_count:
+        before = estimates[block_start - 1] if block_start else 0.0
+        block_end = int(np.searchsorted(estimates, before + block_nnz, side="right"))
+        block_end = min(max(block_end, block_start + 1), movie_count)
+        yield block_start, block_end
+        block_start = block_end
+
+
+"""
+    Yields (movie position, neighbour positions, scores) for every movie with at least one neighbour,
+    neighbours best first.
+"""
+
+
+def top_neighbors(matrix, neighbors, min_support, block_nnz):
+    watchers = np.asarray(matrix.sum(axis=0)).ravel().astype(np.float64)
+    by_movie = matrix.T.tocsr()
+    for block_start, block_end in product_blocks(matrix, by_movie, block_nnz):
+        # co-watch counts of the block's movies with every movie
+        counts = (by_movie[block_start:block_end] @ matrix).tocsr()
+        for offset in range(block_end - block_start):
+            movie = block_start + offset
+            start, end = counts.indptr[offset], counts.indptr[offset + 1]
+            candidates = counts.indices[start:end]
+            support = counts.data[start:end]
+            keep = (candidates != movie) & (support >= min_support)
+            candidates, support = candidates[keep], support[keep]
+            if not len(candidates):
+                continue
+            scores = support / np.sqrt(watchers[movie] * watchers[candidates])
+            if len(scores) > neighbors:
+                # every candidate tied with the last kept one is sorted, so ties break by position
+                threshold = -np.partition(-scores, neighbors - 1)[neighbors - 1]
+                best = scores >= threshold
+                candidates, scores = candidates[best], scores[best]
+            order = np.lexsort((candidates, -scores))[:neighbors]
+            yield movie, candidates[order], scores[order]
+
+
+def write_neighbors(cursor, movie_ids, neighbor_lists, chunk_rows=50000):
+    written = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for movie, candidates, scores in neighbor_lists:
+        writer.writerow([movie_ids[movie], array_literal(movie_ids[candidate] for candidate in candidates),
+                         "{" + ",".join("%.6g" % score for score in scores) + "}"])
+        written += 1
+        if written % chunk_rows == 0:
+            buffer.seek(0)
+            cursor.copy_expert(COPY_NEIGHBORS, buffer)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="\n")
+            report("movie_neighbors|%d movies" % written)
+    buffer.seek(0)
+    cursor.copy_expert(COPY_NEIGHBORS, buffer)
+    return written
+
+
+def build(conn, neighbors=20, max_history=500, min_support=2, block_nnz=20000000, seed=352):
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    for statement in BUILD_DDL:
+        cursor.execute(statement)
+    conn.commit()
+
+    # movie positions must agree between both reads
+    cursor.execute("set transaction isolation level repeatable read;")
+    movie_ids = read_movie_ids(cursor)
+    matrix = read_watched(cursor, len(movie_ids), max_history, seed)
+    conn.commit()
+
+    written = write_neighbors(cursor, movie_ids, top_neighbors(matrix, neighbors, min_support, block_nnz))
+    conn.commit()
+    for statement in SWAP_DDL:
+        cursor.execute(statement)
+    conn.commit()
+    cursor.close()
+
+    report("Movies With Neighbors|Seconds")
+    report("%d|%.1f" % (written, time.perf_counter() - started))
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="precompute co-watched movie neighbours for suggest_movies --cowatch")
+    parser.add_argument("--config", default=POSTGRESQL_CONFIG_FILE_NAME)
+    parser.add_argument("--neighbors", type=int, default=20, help="neighbours kept per movie")
+    parser.add_argument("--max-history", type=int, default=500,
+                        help="watched movies sampled per customer, 0 to use every one")
+    parser.add_argument("--min-support", type=int, default=2,
+                        help="customers who must have watched both movies of a pair")
+    parser.add_argument("--block-nnz", type=int, default=20000000,
+                        help="entries per block of the co-watch product, about 8 bytes each")
+    parser.add_argument("--seed", type=int, default=352)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**read_config(filename=args.config, section="postgresql"))
+    try:
+        build(conn, neighbors=args.neighbors, max_history=args.max_history, min_support=args.min_support,
+              block_nnz=args.block_nnz, seed=args.seed)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
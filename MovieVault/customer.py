@@ -1,11 +1,30 @@
+"""
+    Signed in customer. Built by sign_in from a (customerid, email, firstname, lastname, sessioncount, planid,
+    sessionid) row; __slots__ keeps every instance free of a per-instance __dict__.
+    watched is the WatchedSet of the session, loaded by Mp2Client on first use if it is None. write_lsn is the
+    primary's WAL position after the session's last write, which replicas must replay before serving its reads.
+"""
+
+
 class Customer:
-    def __init__(self, customer_id=0, email="", first_name="", last_name="", session_count="", plan_id=0):
+    __slots__ = ("customer_id", "email", "first_name", "last_name", "session_count", "plan_id", "session_id",
+                 "watched", "write_lsn")
+
+    def __init__(self, customer_id=0, email="", first_name="", last_name="", session_count="", plan_id=0, session_id=None):
         self.customer_id = customer_id
         self.email = email
         self.first_name = first_name
         self.last_name = last_name
         self.session_count = session_count
         self.plan_id = plan_id
+        # lease of this signed in session in customer_sessions
+        self.session_id = session_id
+        self.watched = None
+        self.write_lsn = 0
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
 
     def __str__(self):
         return '%s %s (%s)' % (self.first_name, self.last_name, self.email)
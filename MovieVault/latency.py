@@ -0,0 +1,46 @@
+import math
+
+"""
+    Returns the nearest-rank percentile (fraction between 0 and 1) of an ascending list of values.
+"""
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(math.ceil(fraction * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+"""
+    Collects durations in seconds per command name and summarizes them.
+"""
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def total_count(self):
+        return sum(len(durations) for durations in self.samples.values())
+
+    """
+        Returns {name: {"count", "total", "p50", "p95", "p99", "max"}} with durations in seconds.
+    """
+
+    def summary(self):
+        summary = {}
+        for name, durations in sorted(self.samples.items()):
+            durations = sorted(durations)
+            summary[name] = {
+                "count": len(durations),
+                "total": sum(durations),
+                "p50": percentile(durations, 0.50),
+                "p95": percentile(durations, 0.95),
+                "p99": percentile(durations, 0.99),
+                "max": durations[-1],
+            }
+        return summary
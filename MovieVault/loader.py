@@ -0,0 +1,280 @@
+import argparse
+import gzip
+import io
+import sys
+import threading
+import time
+import zipfile
+
+import psycopg2
+
+from config import read_config
+
+POSTGRESQL_CONFIG_FILE_NAME = "database.cfg"
+
+"""
+    Bulk loader for the IMDb title.basics and title.ratings files (https://datasets.imdbws.com).
+    - Each file is streamed into an unlogged staging table with COPY, both files in parallel on their own
+      connections. Files may be plain .tsv, .tsv.gz, or members of a .zip archive.
+    - movies and genres are then merged from the staging tables in one transaction. Only new rows and rows
+      whose values changed are written, so re-importing a newer dump touches just the differences.
+      Movies missing from the files are left alone, since watched and the other tables refer to them.
+    - With defer_indexes (the default when movies is empty) the secondary indexes of movies and genres and
+      the foreign keys of genres are dropped during the merge and created again afterwards.
+    - Triggers on movies and genres are disabled during the merge. Listening clients get a single "*"
+      notification afterwards and precomputed suggestion lists are marked dirty.
+    - Progress and rows per second are printed to stderr.
+"""
+
+STAGE_DDL = [
+    """create unlogged table if not exists imdb_title_basics_stage (
+        tconst text, titleType text, primaryTitle text, originalTitle text, isAdult text,
+        startYear text, endYear text, runtimeMinutes text, genres text
+    );""",
+    """create unlogged table if not exists imdb_title_ratings_stage (
+        tconst text, averageRating text, numVotes text
+    );""",
+]
+
+# IMDb files are tab separated and do not escape quotes or backslashes; \N marks missing values
+COPY_STAGE = "copy %s from stdin with (format csv, delimiter E'\\t', quote E'\\x01', null '\\N', header true)"
+
+MERGE_MOVIES = """
+    insert into movies (movieId, originalTitle, startYear, averageRating, numVotes)
+    select b.tconst, b.originaltitle, coalesce(b.startyear::int, 0),
+        coalesce(r.averagerating::decimal, 0), coalesce(r.numvotes::int, 0)
+    from imdb_title_basics_stage b left join imdb_title_ratings_stage r on r.tconst = b.tconst
+    where b.titletype = any(%s)
+    on conflict (movieId) do update set originalTitle = excluded.originalTitle, startYear = excluded.startYear,
+        averageRating = excluded.averageRating, numVotes = excluded.numVotes
+    where (movies.originalTitle, movies.startYear, movies.averageRating, movies.numVotes)
+        is distinct from (excluded.originalTitle, excluded.startYear, excluded.averageRating, excluded.numVotes);"""
+
+STAGE_GENRES = """
+    create temporary table imdb_genres_stage on commit drop as
+    select b.tconst as movieid, unnest(string_to_array(b.genres, ',')) as genre
+    from imdb_title_basics_stage b
+    where b.titletype = any(%s) and b.genres is not null;"""
+
+INSERT_GENRES = """
+    insert into genres (movieId, genre)
+    select distinct s.movieid, s.genre from imdb_genres_stage s
+    on conflict do nothing;"""
+
+# genres of imported movies that the files no longer list
+DELETE_GENRES = """
+    delete from genres g
+    using imdb_title_basics_stage b
+    where b.tconst = g.movieid and b.titletype = any(%s)
+        and not exists (select 1 from imdb_genres_stage s where s.movieid = g.movieid and s.genre = g.genre);"""
+
+TARGET_TABLES = ["movies", "genres"]
+
+
+"""
+    Binary stream wrapper that reports the bytes read so far every interval seconds.
+"""
+
+
+class ProgressReader(io.RawIOBase):
+    def __init__(self, stream, label, interval=5.0):
+        self.stream = stream
+        self.label = label
+        self.interval = interval
+        self.bytes_read = 0
+        self.started = time.perf_counter()
+        self._reported = self.started
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        now = time.perf_counter()
+        if now - self._reported >= self.interval:
+            self._reported = now
+            report("%s|%.1f MB read|%.1f MB/s" % (self.label, self.bytes_read / 1e6,
+                                                    self.bytes_read / 1e6 / (now - self.started)))
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def report(line):
+    print(line, file=sys.stderr, flush=True)
+
+
+"""
+    Opens an IMDb file as a binary stream of uncompressed TSV. For a .zip archive, the member whose name
+    starts with member_prefix (e.g. "title.basics") is opened.
+"""
+
+
+def open_source(path, member_prefix):
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        for name in archive.namelist():
+            if name.rsplit("/", 1)[-1].startswith(member_prefix):
+                stream = archive.open(name)
+                return gzip.GzipFile(fileobj=stream) if name.endswith(".gz") else stream
+        raise Exception('No {0} file in {1}'.format(member_prefix, path))
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def load_stage(conn_params, table, path, member_prefix, results):
+    started = time.perf_counter()
+    conn = psycopg2.connect(**conn_params)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("truncate %s;" % table)
+        with open_source(path, member_prefix) as stream:
+            cursor.copy_expert(COPY_STAGE % table, ProgressReader(stream, table))
+        rows = cursor.rowcount
+        # created after the load, so COPY does not maintain it row by row
+        cursor.execute("alter table %s add primary key (tconst);" % table)
+        cursor.execute("analyze %s;" % table)
+        conn.commit()
+        cursor.close()
+    except Exception as error:
+        results[table] = error
+        return
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - started
+    results[table] = rows
+    report("%s|%d rows|%.1f s|%.0f rows/s" % (table, rows, elapsed, rows / elapsed if elapsed else 0.0))
+
+
+def deferrable_objects(cursor):
+    cursor.execute("""
+        select i.indexname, i.indexdef from pg_indexes i
+        where i.schemaname = current_schema() and i.tablename = any(%s)
+            and not exists (select 1 from pg_constraint c where c.conname = i.indexname);""", (TARGET_TABLES,))
+    indexes = cursor.fetchall()
+    cursor.execute("""
+        select c.conrelid::regclass::text, c.conname, pg_get_constraintdef(c.oid) from pg_constraint c
+        where c.contype = 'f' and c.conrelid = 'genres'::regclass;""")
+    foreign_keys = cursor.fetchall()
+    return indexes, foreign_keys
+
+
+def timed(label, cursor, query, params=None):
+    started = time.perf_counter()
+    cursor.execute(query, params)
+    elapsed = time.perf_counter() - started
+    rows = max(0, cursor.rowcount)
+    report("%s|%d rows|%.1f s|%.0f rows/s" % (label, rows, elapsed, rows / elapsed if elapsed else 0.0))
+    return rows
+
+
+def merge(conn, title_types, defer_indexes=None):
+    cursor = conn.cursor()
+    if defer_indexes is None:
+        cursor.execute("select not exists (select 1 from movies);")
+        defer_indexes = cursor.fetchone()[0]
+
+    indexes, foreign_keys = deferrable_objects(cursor) if defer_indexes else ([], [])
+    for table, name, _ in foreign_keys:
+        cursor.execute("alter table %s drop constraint %s;" % (table, name))
+    for name, _ in indexes:
+        cursor.execute("drop index %s;" % name)
+    for table in TARGET_TABLES:
+        cursor.execute("alter table %s disable trigger user;" % table)
+
+    changed_movies = timed("movies", cursor, MERGE_MOVIES, (title_types,))
+    cursor.execute(STAGE_GENRES, (title_types,))
+    added_genres = timed("genres added", cursor, INSERT_GENRES)
+    removed_genres = timed("genres removed", cursor, DELETE_GENRES, (title_types,))
+
+    for table in TARGET_TABLES:
+        cursor.execute("alter table %s enable trigger user;" % table)
+    for name, definition in indexes:
+        timed("index " + name, cursor, definition)
+    for table, name, definition in foreign_keys:
+        timed("constraint " + name, cursor, "alter table %s add constraint %s %s;" % (table, name, definition))
+
+    if changed_movies or added_genres or removed_genres:
+        cursor.execute("select pg_notify('movies_changed', '*');")
+        # the disabled triggers did not mark precomputed suggestion lists dirty
+        cursor.execute("select to_regclass('suggestion_ranking_lists');")
+        if cursor.fetchone()[0]:
+            cursor.execute("update suggestion_ranking_lists "
+                           "set dirtySince = coalesce(dirtySince, now()), changeCount = changeCount + 1;")
+    conn.commit()
+
+    cursor.execute("analyze movies;")
+    cursor.execute("analyze genres;")
+    conn.commit()
+    cursor.close()
+    return changed_movies, added_genres, removed_genres
+
+
+def load(conn_params, basics_path, ratings_path, title_types, defer_indexes=None, keep_stage=False):
+    started = time.perf_counter()
+    conn = psycopg2.connect(**conn_params)
+    try:
+        cursor = conn.cursor()
+        for statement in STAGE_DDL:
+            cursor.execute(statement)
+        # primary keys are added again after each load
+        cursor.execute("alter table imdb_title_basics_stage drop constraint if exists imdb_title_basics_stage_pkey;")
+        cursor.execute("alter table imdb_title_ratings_stage drop constraint if exists imdb_title_ratings_stage_pkey;")
+        conn.commit()
+
+        results = {}
+        loaders = [threading.Thread(target=load_stage, args=(conn_params, table, path, prefix, results))
+                   for table, path, prefix in (("imdb_title_basics_stage", basics_path, "title.basics"),
+                                               ("imdb_title_ratings_stage", ratings_path, "title.ratings"))]
+        for thread in loaders:
+            thread.start()
+        for thread in loaders:
+            thread.join()
+        for result in results.values():
+            if isinstance(result, Exception):
+                raise result
+
+        changed_movies, added_genres, removed_genres = merge(conn, title_types, defer_indexes=defer_indexes)
+
+        if not keep_stage:
+            cursor.execute("drop table imdb_title_basics_stage, imdb_title_ratings_stage;")
+            conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+    report("Changed Movies|Added Genres|Removed Genres|Seconds")
+    report("%d|%d|%d|%.1f" % (changed_movies, added_genres, removed_genres, time.perf_counter() - started))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load IMDb title.basics and title.ratings into movies and genres")
+    parser.add_argument("source", nargs="?", help="zip archive holding both files")
+    parser.add_argument("--basics", help="title.basics file (.tsv, .tsv.gz or .zip)")
+    parser.add_argument("--ratings", help="title.ratings file (.tsv, .tsv.gz or .zip)")
+    parser.add_argument("--config", default=POSTGRESQL_CONFIG_FILE_NAME)
+    parser.add_argument("--title-types", default="movie", help="comma separated IMDb titleType values to import")
+    defer = parser.add_mutually_exclusive_group()
+    defer.add_argument("--defer-indexes", dest="defer_indexes", action="store_true", default=None,
+                       help="drop and recreate secondary indexes and foreign keys around the merge")
+    defer.add_argument("--keep-indexes", dest="defer_indexes", action="store_false")
+    parser.add_argument("--keep-stage", action="store_true", help="keep the staging tables after the load")
+    args = parser.parse_args()
+
+    basics_path = args.basics or args.source
+    ratings_path = args.ratings or args.source
+    if not basics_path or not ratings_path:
+        parser.error("give a zip archive or both --basics and --ratings")
+
+    load(read_config(filename=args.config, section="postgresql"), basics_path, ratings_path,
+         [title_type.strip() for title_type in args.title_types.split(",") if title_type.strip()],
+         defer_indexes=args.defer_indexes, keep_stage=args.keep_stage)
+
+
+if __name__ == '__main__':
+    main()
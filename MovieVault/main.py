@@ -1,9 +1,16 @@
+import argparse
+import io
+import sys
+import time
+
+from latency import LatencyRecorder
 from mp2 import Mp2Client, tokenize_command
 from validators import *
 
 AUTH_CUSTOMER = None
 ANON_CUSTOMER = "ANONYMOUS"
 POSTGRESQL_CONFIG_FILE_NAME = "database.cfg"
+BATCH_OUTPUT_BUFFER_SIZE = 1 << 20
 
 
 def print_success_msg(message):
@@ -23,198 +30,351 @@ def print_customer_info(customer):
         print(ANON_CUSTOMER, end=" > ")
 
 
-def main():
-    global AUTH_CUSTOMER, POSTGRESQL_CONFIG_FILE_NAME
+def watch_from_file(client, customer, path):
+    # "-" reads movie ids from stdin until EOF
+    if path == "-":
+        return client.watch_from_stream(customer=customer, stream=sys.stdin)
 
-    client = Mp2Client(config_filename=POSTGRESQL_CONFIG_FILE_NAME)
-    client.help()
+    try:
+        with open(path) as stream:
+            return client.watch_from_stream(customer=customer, stream=stream)
+    except OSError:
+        return False, messages.CMD_EXECUTION_FAILED
 
-    while True:
-        # print customer information if signed in
-        print_customer_info(customer=AUTH_CUSTOMER)
 
-        # get new command from user
-        cmd_text = input()
-        cmd_tokens = tokenize_command(cmd_text)
-        cmd = cmd_tokens[0]
+"""
+    Validates and executes one tokenized command, printing its output and messages.
+    Returns False if the command quits the program, True otherwise.
+"""
+
 
-        if cmd == "help":
-            client.help()
+def execute_command(client, cmd_tokens):
+    global AUTH_CUSTOMER
 
-        elif cmd == "sign_up":
-            # validate command
-            validation_result, validation_message = sign_up_validator(AUTH_CUSTOMER, cmd_tokens)
+    cmd = cmd_tokens[0]
 
-            if validation_result:
-                client.connect()
-                _, arg_email, arg_password, arg_first_name, arg_last_name, arg_plan_id = cmd_tokens
+    if cmd == "help":
+        client.help()
 
-                # sign up
-                exec_status, exec_message = client.sign_up(email=arg_email, password=arg_password,
-                                                            first_name=arg_first_name, last_name=arg_last_name,
-                                                            plan_id=arg_plan_id)
+    elif cmd == "sign_up":
+        # validate command
+        validation_result, validation_message = sign_up_validator(AUTH_CUSTOMER, cmd_tokens)
 
-                client.disconnect()
+        if validation_result:
+            _, arg_email, arg_password, arg_first_name, arg_last_name, arg_plan_id = cmd_tokens
 
-                # print message
-                if exec_status:
-                    print_success_msg(exec_message)
-                else:
-                    print_error_msg(exec_message)
+            # sign up
+            exec_status, exec_message = client.sign_up(email=arg_email, password=arg_password,
+                                                        first_name=arg_first_name, last_name=arg_last_name,
+                                                        plan_id=arg_plan_id)
 
+            # print message
+            if exec_status:
+                print_success_msg(exec_message)
             else:
-                print_error_msg(validation_message)
+                print_error_msg(exec_message)
 
-        elif cmd == "sign_in":
-            # validate command
-            validation_result, validation_message = sign_in_validator(AUTH_CUSTOMER, cmd_tokens)
+        else:
+            print_error_msg(validation_message)
 
-            if validation_result:
-                _, arg_email, arg_password = cmd_tokens
+    elif cmd == "sign_in":
+        # validate command
+        validation_result, validation_message = sign_in_validator(AUTH_CUSTOMER, cmd_tokens)
 
-                client.connect()
-                customer, exec_message = client.sign_in(email=arg_email, password=arg_password)
+        if validation_result:
+            _, arg_email, arg_password = cmd_tokens
 
-                if customer:
-                    AUTH_CUSTOMER = customer
-                    print_success_msg(exec_message)
+            customer, exec_message = client.sign_in(email=arg_email, password=arg_password)
 
-                else:
-                    print_error_msg(exec_message)
+            if customer:
+                AUTH_CUSTOMER = customer
+                print_success_msg(exec_message)
 
             else:
-                print_error_msg(validation_message)
+                print_error_msg(exec_message)
 
-        elif cmd == "sign_out":
+        else:
+            print_error_msg(validation_message)
 
-            # validate command
-            validation_result, validation_message = sign_out_validator(AUTH_CUSTOMER, cmd_tokens)
+    elif cmd == "sign_out":
 
-            if validation_result:
-                exec_status, exec_message = client.sign_out(customer=AUTH_CUSTOMER)
+        # validate command
+        validation_result, validation_message = sign_out_validator(AUTH_CUSTOMER, cmd_tokens)
 
-                if exec_status:
-                    AUTH_CUSTOMER = None
-                    client.disconnect()
-                    print_success_msg(exec_message)
+        if validation_result:
+            exec_status, exec_message = client.sign_out(customer=AUTH_CUSTOMER)
 
-                else:
-                    print_error_msg(exec_message)
+            if exec_status:
+                AUTH_CUSTOMER = None
+                print_success_msg(exec_message)
 
             else:
-                print_error_msg(validation_message)
+                print_error_msg(exec_message)
 
-        elif cmd == "quit":
+        else:
+            print_error_msg(validation_message)
 
-            # validate command
-            validation_result, validation_message = quit_validator(cmd_tokens)
+    elif cmd == "quit":
 
-            if validation_result:
+        # validate command
+        validation_result, validation_message = quit_validator(cmd_tokens)
 
-                exec_status, exec_message = client.quit(customer=AUTH_CUSTOMER)
+        if validation_result:
 
-                if exec_status:
-                    break
-                else:
-                    print_error_msg(exec_message)
+            exec_status, exec_message = client.quit(customer=AUTH_CUSTOMER)
 
+            if exec_status:
+                return False
             else:
-                print_error_msg(validation_message)
+                print_error_msg(exec_message)
 
-        elif cmd == "show_plans":
-            # validate command
-            validation_result, validation_message = show_plans_validator(AUTH_CUSTOMER, cmd_tokens)
+        else:
+            print_error_msg(validation_message)
 
-            if validation_result:
-                exec_status, exec_message = client.show_plans()
+    elif cmd == "show_plans":
+        # validate command
+        validation_result, validation_message = show_plans_validator(AUTH_CUSTOMER, cmd_tokens)
 
-                if not exec_status:
-                    print_error_msg(exec_message)
+        if validation_result:
+            exec_status, exec_message = client.show_plans()
 
-            else:
-                print_error_msg(validation_message)
+            if not exec_status:
+                print_error_msg(exec_message)
 
-        elif cmd == "show_subscription":
-            # validate command
-            validation_result, validation_message = show_subscription_validator(AUTH_CUSTOMER, cmd_tokens)
+        else:
+            print_error_msg(validation_message)
 
-            if validation_result:
-                exec_status, exec_message = client.show_subscription(customer=AUTH_CUSTOMER)
+    elif cmd == "show_subscription":
+        # validate command
+        validation_result, validation_message = show_subscription_validator(AUTH_CUSTOMER, cmd_tokens)
 
-                if not exec_status:
-                    print_error_msg(exec_message)
+        if validation_result:
+            exec_status, exec_message = client.show_subscription(customer=AUTH_CUSTOMER)
 
-            else:
-                print_error_msg(validation_message)
+            if not exec_status:
+                print_error_msg(exec_message)
+
+        else:
+            print_error_msg(validation_message)
 
-        elif cmd == "watch":
+    elif cmd == "watch":
 
-            # validate command
-            validation_result, validation_message = watch_validator(AUTH_CUSTOMER, cmd_tokens)
+        # validate command
+        validation_result, validation_message = watch_validator(AUTH_CUSTOMER, cmd_tokens)
 
-            if validation_result:
+        if validation_result:
+            if cmd_tokens[1] == "--file" and len(cmd_tokens) == 3:
+                exec_status, exec_message = watch_from_file(client, AUTH_CUSTOMER, cmd_tokens[2])
+            else:
                 exec_status, exec_message = client.watch(customer=AUTH_CUSTOMER, movie_ids=cmd_tokens[1:])
 
-                if exec_status:
-                    print_success_msg(exec_message)
-                else:
-                    print_error_msg(exec_message)
-
+            if exec_status:
+                print_success_msg(exec_message)
             else:
-                print_error_msg(validation_message)
+                print_error_msg(exec_message)
 
-        elif cmd == "subscribe":
-            # validate command
-            validation_result, validation_message = subscribe_validator(AUTH_CUSTOMER, cmd_tokens)
+        else:
+            print_error_msg(validation_message)
 
-            if validation_result:
-                _, arg_plan_id = cmd_tokens
+    elif cmd == "subscribe":
+        # validate command
+        validation_result, validation_message = subscribe_validator(AUTH_CUSTOMER, cmd_tokens)
 
-                customer, exec_message = client.subscribe(customer=AUTH_CUSTOMER, plan_id=arg_plan_id)
+        if validation_result:
+            _, arg_plan_id = cmd_tokens
 
-                if customer:
-                    AUTH_CUSTOMER = customer
-                    print_success_msg(exec_message)
+            customer, exec_message = client.subscribe(customer=AUTH_CUSTOMER, plan_id=arg_plan_id)
 
-                else:
-                    print_error_msg(exec_message)
+            if customer:
+                AUTH_CUSTOMER = customer
+                print_success_msg(exec_message)
 
             else:
-                print_error_msg(validation_message)
+                print_error_msg(exec_message)
+
+        else:
+            print_error_msg(validation_message)
+
+    elif cmd == "search_for_movies":
+        # validate command
+        validation_result, validation_message = search_for_movies_validator(AUTH_CUSTOMER, cmd_tokens)
+
+        if validation_result:
+            arg_search_text, arg_page_size, arg_page_token = search_for_movies_args(cmd_tokens)
+
+            exec_status, exec_message = client.search_for_movies(customer=AUTH_CUSTOMER, search_text=arg_search_text,
+                                                                 page_size=arg_page_size, page_token=arg_page_token)
+
+            if not exec_status:
+                print_error_msg(exec_message)
 
-        elif cmd == "search_for_movies":
-            # validate command
-            validation_result, validation_message = search_for_movies_validator(AUTH_CUSTOMER, cmd_tokens)
+        else:
+            print_error_msg(validation_message)
+
+    elif cmd == "suggest_movies":
+        # validate command
+        validation_result, validation_message = suggest_movies_validator(AUTH_CUSTOMER, cmd_tokens)
+
+        if validation_result:
+            exec_status, exec_message = client.suggest_movies(customer=AUTH_CUSTOMER, cowatch=len(cmd_tokens) == 2)
+
+            if not exec_status:
+                print_error_msg(exec_message)
+
+        else:
+            print_error_msg(validation_message)
+
+    elif cmd == "refresh_suggestions":
+        # validate command
+        validation_result, validation_message = refresh_suggestions_validator(AUTH_CUSTOMER, cmd_tokens)
+
+        if validation_result:
+            exec_status, exec_message = client.refresh_suggestions(full=len(cmd_tokens) == 2)
 
-            if validation_result:
-                arg_search_text = " ".join(cmd_tokens[1:])
+            if not exec_status:
+                print_error_msg(exec_message)
+
+        else:
+            print_error_msg(validation_message)
 
-                exec_status, exec_message = client.search_for_movies(customer=AUTH_CUSTOMER, search_text=arg_search_text)
+    elif cmd == "show_suggestion_status":
+        # validate command
+        validation_result, validation_message = show_suggestion_status_validator(AUTH_CUSTOMER, cmd_tokens)
 
-                if not exec_status:
-                    print_error_msg(exec_message)
+        if validation_result:
+            exec_status, exec_message = client.show_suggestion_status()
 
+            if not exec_status:
+                print_error_msg(exec_message)
+
+        else:
+            print_error_msg(validation_message)
+
+    elif cmd == "stats":
+        # validate command
+        validation_result, validation_message = stats_validator(AUTH_CUSTOMER, cmd_tokens)
+
+        if validation_result:
+            exec_status, exec_message = client.stats(prometheus=len(cmd_tokens) == 2)
+
+            if not exec_status:
+                print_error_msg(exec_message)
+
+        else:
+            print_error_msg(validation_message)
+
+    elif cmd == "":
+        pass
+
+    else:
+        print_error_msg(messages.CMD_UNDEFINED)
+
+    return True
+
+
+"""
+    Executes the commands read from stream, one per line, without prompts or the help banner.
+    - Output is collected in a large buffer and written in bulk.
+    - If transaction_size > 1, every transaction_size consecutive commands run in one transaction.
+    - Stops at the first successful quit or at the end of the stream, signing the customer out.
+    - Prints commands per second and per-command latency percentiles to stderr at the end.
+"""
+
+
+def run_batch(client, stream, transaction_size=1):
+    global AUTH_CUSTOMER
+
+    latencies = LatencyRecorder()
+    stdout = sys.stdout
+    sys.stdout = io.TextIOWrapper(io.BufferedWriter(io.FileIO(stdout.fileno(), "w", closefd=False),
+                                                    buffer_size=BATCH_OUTPUT_BUFFER_SIZE),
+                                  encoding=stdout.encoding, line_buffering=False)
+
+    started = time.perf_counter()
+    try:
+        running = True
+        while running:
+            cmd_texts = [line.rstrip("\r\n") for _, line in zip(range(max(1, transaction_size)), stream)]
+            if not cmd_texts:
+                break
+
+            if transaction_size > 1:
+                with client.transaction():
+                    running = run_batch_commands(client, cmd_texts, latencies)
             else:
-                print_error_msg(validation_message)
+                running = run_batch_commands(client, cmd_texts, latencies)
 
-        elif cmd == "suggest_movies":
-            # validate command
-            validation_result, validation_message = suggest_movies_validator(AUTH_CUSTOMER, cmd_tokens)
+        if running and AUTH_CUSTOMER:
+            client.quit(customer=AUTH_CUSTOMER)
+            AUTH_CUSTOMER = None
+    finally:
+        elapsed = time.perf_counter() - started
+        sys.stdout.flush()
+        sys.stdout = stdout
 
-            if validation_result:
-                exec_status, exec_message = client.suggest_movies(customer=AUTH_CUSTOMER)
+    print_batch_summary(latencies, elapsed)
 
-                if not exec_status:
-                    print_error_msg(exec_message)
 
+def run_batch_commands(client, cmd_texts, latencies):
+    for cmd_text in cmd_texts:
+        cmd_tokens = tokenize_command(cmd_text)
+        command_started = time.perf_counter()
+        running = execute_command(client, cmd_tokens)
+        latencies.record(cmd_tokens[0] or "<empty>", time.perf_counter() - command_started)
+        if not running:
+            return False
+    return True
+
+
+def print_batch_summary(latencies, elapsed):
+    commands = latencies.total_count()
+    print("Commands|Seconds|Commands per Second", file=sys.stderr)
+    print("%d|%.3f|%.1f" % (commands, elapsed, commands / elapsed if elapsed > 0 else 0.0), file=sys.stderr)
+    print("Command|Count|p50 ms|p95 ms|p99 ms|Max ms", file=sys.stderr)
+    for name, summary in latencies.summary().items():
+        print("%s|%d|%.3f|%.3f|%.3f|%.3f" % (name, summary["count"], summary["p50"] * 1000, summary["p95"] * 1000,
+                                            summary["p99"] * 1000, summary["max"] * 1000), file=sys.stderr)
+
+
+def main():
+    global AUTH_CUSTOMER, POSTGRESQL_CONFIG_FILE_NAME
+
+    parser = argparse.ArgumentParser(description="MovieVault command shell")
+    parser.add_argument("--config", default=POSTGRESQL_CONFIG_FILE_NAME)
+    parser.add_argument("--batch", nargs="?", const="-", metavar="FILE",
+                        help="execute the commands in FILE (or stdin) without prompts")
+    parser.add_argument("--transaction-size", type=int, default=1,
+                        help="number of consecutive batch commands grouped into one transaction")
+    args = parser.parse_args()
+    POSTGRESQL_CONFIG_FILE_NAME = args.config
+
+    client = Mp2Client(config_filename=POSTGRESQL_CONFIG_FILE_NAME)
+    client.connect()
+
+    if args.batch is not None:
+        try:
+            if args.batch == "-":
+                run_batch(client, sys.stdin, transaction_size=args.transaction_size)
             else:
-                print_error_msg(validation_message)
+                with open(args.batch) as stream:
+                    run_batch(client, stream, transaction_size=args.transaction_size)
+        finally:
+            client.disconnect()
+        return
 
-        elif cmd == "":
-            pass
+    client.help()
 
-        else:
-            print_error_msg(messages.CMD_UNDEFINED)
+    while True:
+        # print customer information if signed in
+        print_customer_info(customer=AUTH_CUSTOMER)
+
+        # get new command from user
+        cmd_text = input()
+        cmd_tokens = tokenize_command(cmd_text)
+
+        if not execute_command(client, cmd_tokens):
+            client.disconnect()
+            break
 
 
 if __name__ == '__main__':
@@ -11,6 +11,9 @@ USER_ALREADY_SIGNED_IN = "You are already signed in to the platform."
 USER_SIGNIN_FAILED = "E-mail or password is wrong."
 USER_ALL_SESSIONS_ARE_USED = "You are out of sessions for signing in."
 
+SEARCH_PAGE_SIZE_INVALID = "Page size must be a positive integer."
+SEARCH_PAGE_TOKEN_INVALID = "Page token is invalid or belongs to another search."
+
 
 SUBSCRIBE_PLAN_NOT_FOUND = "Plan is not found."
 SUBSCRIBE_MAX_PARALLEL_SESSIONS_UNAVAILABLE = "New plan's max parallel sessions must be greater than or equal to current plan's max parallel sessions."
\ No newline at end of file
@@ -0,0 +1,337 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from rows import RowFactoryCursor
+
+"""
+    In-process instrumentation of Mp2Client commands and the SQL statements they run.
+    - command() times one command and collects what its statements did: statement count, rows fetched,
+      rows written and the class of the error that made it fail, if any.
+    - Statements are recorded by the cursor class returned by cursor_factory, which the connection pool passes
+      to psycopg2.connect. Statements run outside of a command (engine start-up, background refreshes) are
+      recorded per statement only.
+    - Aggregates are plain counters and fixed histogram buckets, so recording costs a few clock reads and
+      one short lock per statement and per command.
+    - prometheus_text() renders every aggregate in the Prometheus text exposition format.
+    - If a slow_query_log (profiling.SlowQueryLog) is given, every statement is also passed to it,
+      even when recording is disabled.
+"""
+
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+STATEMENT_LABEL_LENGTH = 60
+
+# the command the current thread is running, if any
+_context = threading.local()
+
+
+class _CommandRun:
+    __slots__ = ("name", "statements", "rows_fetched", "rows_written", "error")
+
+    def __init__(self, name):
+        self.name = name
+        self.statements = 0
+        self.rows_fetched = 0
+        self.rows_written = 0
+        self.error = None
+
+
+class _Aggregate:
+    __slots__ = ("calls", "seconds", "max_seconds", "statements", "rows_fetched", "rows_written", "errors", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.statements = 0
+        self.rows_fetched = 0
+        self.rows_written = 0
+        self.errors = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds, statements, rows_fetched, rows_written, error):
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.statements += statements
+        self.rows_fetched += rows_fetched
+        self.rows_written += rows_written
+        if error:
+            self.errors[error] = self.errors.get(error, 0) + 1
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "max_seconds": self.max_seconds,
+            "statements": self.statements,
+            "rows_fetched": self.rows_fetched,
+            "rows_written": self.rows_written,
+            "errors": dict(self.errors),
+        }
+
+
+"""
+    Returns a short, stable label for a SQL statement: its whitespace collapsed and cut to
+    STATEMENT_LABEL_LENGTH characters. Parameters are bound separately, so labels do not grow with the data.
+"""
+
+
+def statement_label(query):
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    elif not isinstance(query, str):
+        # psycopg2.sql.Composable
+        query = repr(query)
+    return " ".join(query.split())[:STATEMENT_LABEL_LENGTH]
+
+
+class MetricsRecorder:
+    def __init__(self, enabled=True, slow_query_log=None):
+        self.enabled = enabled
+        self.slow_query_log = slow_query_log
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._commands = {}
+        self._statements = {}
+        # cursors of this class report to this recorder
+        self.cursor_factory = type("InstrumentedCursor", (InstrumentedCursor,), {"metrics": self})
+
+    """
+        Context manager that records one command. Nested commands (quit signing out, for example)
+        are counted as part of the outermost one.
+    """
+
+    @contextmanager
+    def command(self, name):
+        if not (self.enabled or self.slow_query_log) or getattr(_context, "run", None) is not None:
+            yield
+            return
+
+        run = _CommandRun(name)
+        _context.run = run
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as error:
+            run.error = type(error).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _context.run = None
+            if self.enabled:
+                self._record_command(name, elapsed, run)
+
+    def _record_command(self, name, elapsed, run):
+        with self._lock:
+            aggregate = self._commands.get(name)
+            if aggregate is None:
+                aggregate = self._commands[name] = _Aggregate()
+            aggregate.add(elapsed, run.statements, run.rows_fetched, run.rows_written, run.error)
+
+    """
+        Marks the running command as failed with the class of the given exception.
+    """
+
+    def record_error(self, error):
+        run = getattr(_context, "run", None)
+        if run is not None:
+            run.error = type(error).__name__
+
+    """
+        Passes a finished statement to the slow-query log, if there is one.
+    """
+
+    def observe_statement(self, cursor, query, vars, seconds):
+        if self.slow_query_log is None:
+            return
+        run = getattr(_context, "run", None)
+        self.slow_query_log.observe(cursor, query, vars, seconds, command=run.name if run is not None else None)
+
+    def record_rows_written(self, rows):
+        run = getattr(_context, "run", None)
+        if run is not None:
+            run.rows_written += rows
+
+    def record_rows_fetched(self, rows):
+        run = getattr(_context, "run", None)
+        if run is not None:
+            run.rows_fetched += rows
+
+    def record_statement(self, query, seconds, rows_written, error):
+        if not self.enabled:
+            return
+        run = getattr(_context, "run", None)
+        if run is not None:
+            run.statements += 1
+            run.rows_written += rows_written
+            if error:
+                run.error = error
+
+        label = statement_label(query)
+        with self._lock:
+            aggregate = self._statements.get(label)
+            if aggregate is None:
+                aggregate = self._statements[label] = _Aggregate()
+            aggregate.add(seconds, 1, 0, rows_written, error)
+
+    """
+        Returns {"commands": {name: aggregate}, "statements": {label: aggregate}}, where every aggregate is
+        a dictionary of calls, seconds, max_seconds, statements, rows_fetched, rows_written and errors by class.
+    """
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "commands": {name: aggregate.as_dict() for name, aggregate in self._commands.items()},
+                "statements": {label: aggregate.as_dict() for label, aggregate in self._statements.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._commands = {}
+            self._statements = {}
+
+    """
+        Renders the aggregates, and the given {name: value} gauges, in the Prometheus text format.
+    """
+
+    def prometheus_text(self, gauges=None):
+        with self._lock:
+            commands = [(name, aggregate.as_dict(), list(aggregate.buckets))
+                        for name, aggregate in sorted(self._commands.items())]
+            statements = [(label, aggregate.as_dict(), list(aggregate.buckets))
+                          for label, aggregate in sorted(self._statements.items())]
+
+        lines = []
+        self._render(lines, "movievault_command", "command", commands)
+        self._render(lines, "movievault_statement", "statement", statements)
+        for name, value in sorted((gauges or {}).items()):
+            lines.append("# TYPE movievault_%s gauge" % name)
+            lines.append("movievault_%s %s" % (name, _number(value)))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render(lines, prefix, label_name, aggregates):
+        if not aggregates:
+            return
+
+        lines.append("# HELP %s_seconds Wall time in seconds." % prefix)
+        lines.append("# TYPE %s_seconds histogram" % prefix)
+        for name, values, buckets in aggregates:
+            label = '%s="%s"' % (label_name, _escape(name))
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                cumulative += count
+                lines.append('%s_seconds_bucket{%s,le="%s"} %d' % (prefix, label, _number(bound), cumulative))
+            lines.append('%s_seconds_bucket{%s,le="+Inf"} %d' % (prefix, label, values["calls"]))
+            lines.append("%s_seconds_sum{%s} %s" % (prefix, label, _number(values["seconds"])))
+            lines.append("%s_seconds_count{%s} %d" % (prefix, label, values["calls"]))
+
+        for counter in ("statements", "rows_fetched", "rows_written"):
+            if prefix.endswith("statement") and counter != "rows_written":
+                continue
+            lines.append("# TYPE %s_%s_total counter" % (prefix, counter))
+            for name, values, _ in aggregates:
+                lines.append('%s_%s_total{%s="%s"} %d' % (prefix, counter, label_name, _escape(name), values[counter]))
+
+        lines.append("# TYPE %s_errors_total counter" % prefix)
+        for name, values, _ in aggregates:
+            for error, count in sorted(values["errors"].items()):
+                lines.append('%s_errors_total{%s="%s",error="%s"} %d' % (prefix, label_name, _escape(name),
+                                                                          _escape(error), count))
+
+
+"""
+    psycopg2 cursor that reports every statement, and the rows read through it, to its class's recorder.
+    Rows are built with the row factory of RowFactoryCursor.
+    Use MetricsRecorder.cursor_factory rather than this class.
+"""
+
+
+class InstrumentedCursor(RowFactoryCursor):
+    metrics = None
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except Exception as error:
+            self.metrics.record_statement(query, time.perf_counter() - started, 0, type(error).__name__)
+            raise
+        elapsed = time.perf_counter() - started
+        # statements without a result set report the rows they changed in rowcount
+        written = self.rowcount if self.description is None and self.rowcount > 0 else 0
+        self.metrics.record_statement(query, elapsed, written, None)
+        if self.name is None:
+            self.metrics.observe_statement(self, query, vars, elapsed)
+        elif self.metrics.slow_query_log is not None:
+            # named cursors run the statement while rows are read, see __iter__
+            self._observed = (query, vars, started)
+        return result
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            result = super().executemany(query, vars_list)
+        except Exception as error:
+            self.metrics.record_statement(query, time.perf_counter() - started, 0, type(error).__name__)
+            raise
+        self.metrics.record_statement(query, time.perf_counter() - started, max(0, self.rowcount), None)
+        return result
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self.metrics.record_rows_fetched(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.metrics.record_rows_fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self.metrics.record_rows_fetched(len(rows))
+        return rows
+
+    def __iter__(self):
+        # counted once the iteration ends, instead of once per row
+        rows = 0
+        try:
+            for row in super().__iter__():
+                rows += 1
+                yield row
+        finally:
+            self.metrics.record_rows_fetched(rows)
+            observed = getattr(self, "_observed", None)
+            if observed is not None:
+                self._observed = None
+                query, vars, started = observed
+                self.metrics.observe_statement(self, query, vars, time.perf_counter() - started)
+
+
+"""
+    Decorator for Mp2Client methods: runs the method as a command named after it in self.metrics.
+"""
+
+
+def instrumented(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.command(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
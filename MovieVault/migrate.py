@@ -0,0 +1,30 @@
+import argparse
+
+from mp2 import Mp2Client
+
+POSTGRESQL_CONFIG_FILE_NAME = "database.cfg"
+
+"""
+    Creates the tables, indexes and triggers that the components configured in the configuration file need,
+    on top of the schema from construct_db.sql. Every statement is idempotent, so the script can be run again
+    after changing the search, suggestion or plan cache settings.
+    The statements lock movies, genres, plans and customers, so run it in a maintenance window rather than
+    while clients are serving commands. Clients do not run it on start.
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MovieVault schema migration")
+    parser.add_argument("--config", default=POSTGRESQL_CONFIG_FILE_NAME)
+    args = parser.parse_args()
+
+    client = Mp2Client(config_filename=args.config)
+    client.pool.open()
+    try:
+        client.install_schema()
+    finally:
+        client.pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+    Movie row of search and suggestion results, built from a (movieid, originaltitle, startyear, averagerating,
+    numvotes) row, optionally followed by the watched flag of search results.
+    - Iterating a movie yields its columns in that order, as printed by search_for_movies and suggest_movies.
+      The watched flag is only yielded if it was read.
+    - Movies are equal if all their columns are; they hash by movie id.
+    - __slots__ keeps large result sets and the in-memory catalogue of the numpy suggestion engine small.
+"""
+
+
+class Movie:
+    __slots__ = ("movie_id", "title", "year", "rating", "votes", "watched")
+
+    def __init__(self, movie_id, title, year, rating, votes, watched=None):
+        self.movie_id = movie_id
+        self.title = title
+        self.year = year
+        self.rating = rating
+        self.votes = votes
+        self.watched = watched
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def __iter__(self):
+        if self.watched is None:
+            return iter((self.movie_id, self.title, self.year, self.rating, self.votes))
+        return iter((self.movie_id, self.title, self.year, self.rating, self.votes, self.watched))
+
+    def __eq__(self, other):
+        if not isinstance(other, Movie):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(self.movie_id)
+
+    def __repr__(self):
+        return 'Movie(%s)' % ', '.join(repr(column) for column in self)
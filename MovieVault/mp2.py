@@ -1,9 +1,31 @@
+import threading
+from contextlib import contextmanager
+from itertools import islice
+
 from customer import Customer
 
 import psycopg2
 
-from config import read_config
+from config import get_bool, get_int, read_config
 from messages import *
+from metrics import MetricsRecorder, instrumented
+from movie import Movie
+from notifications import ChangeListener
+from output import RowWriter
+from pagination import decode_page_token, encode_page_token
+from plan_cache import PlanCache
+from pool import ConnectionPool
+from profiling import SlowQueryLog
+from routing import READ_FROM_PRIMARY, ReplicaRouter
+import prepared
+import queries
+from rows import RowFactoryCursor
+from search import create_search_engine
+from search_cache import SearchResultCache, row_size
+from sessions import SessionLeaseManager
+from suggestions import create_suggestion_engine
+from watch_queue import WatchQueue
+from watched import WatchedSet
 
 """
     Splits given command string by spaces and trims each token.
@@ -16,25 +38,315 @@ def tokenize_command(command):
     return [t.strip() for t in tokens]
 
 
+"""
+    Lazily yields whitespace separated movie ids from a text stream, one line at a time.
+"""
+
+
+def iter_movie_ids(stream):
+    for line in stream:
+        for movie_id in line.split():
+            yield movie_id
+
+
+"""
+    Splits given iterable into lists of at most chunk_size items without materializing it.
+"""
+
+
+def chunked(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
 class Mp2Client:
     def __init__(self, config_filename):
         self.db_conn_params = read_config(filename=config_filename, section="postgresql")
-        self.conn = None
+        self.metrics_params = read_config(filename=config_filename, section="metrics", required=False)
+        self.profiling_params = read_config(filename=config_filename, section="profiling", required=False)
+        self.metrics = MetricsRecorder(enabled=get_bool(self.metrics_params, "enabled", True),
+                                       slow_query_log=SlowQueryLog.from_config(self.profiling_params))
+        self.pool_params = read_config(filename=config_filename, section="pool", required=False)
+        self.prepared_params = read_config(filename=config_filename, section="prepared", required=False)
+        pool_conn_params = dict(self.db_conn_params)
+        # pooled connections report their statements to self.metrics and the slow-query log
+        # pooled cursors build model objects with their row_factory either way
+        if self.metrics.enabled or self.metrics.slow_query_log:
+            pool_conn_params["cursor_factory"] = self.metrics.cursor_factory
+        else:
+            pool_conn_params["cursor_factory"] = RowFactoryCursor
+        # pooled connections prepare the statements of the prepared module on first use
+        if get_bool(self.prepared_params, "enabled", True):
+            pool_conn_params["connection_factory"] = prepared.PreparedConnection
+        self.pool = ConnectionPool.from_config(pool_conn_params, self.pool_params)
+        # read-only commands go to the [replica.<name>] sections, if there are any
+        self.routing_params = read_config(filename=config_filename, section="routing", required=False)
+        self.router = ReplicaRouter.from_config(config_filename, self.pool, pool_conn_params, self.pool_params,
+                                                self.routing_params)
+        self.watch_params = read_config(filename=config_filename, section="watch", required=False)
+        self.watch_chunk_size = get_int(self.watch_params, "chunksize", 1000)
+        self.watch_queue = WatchQueue.from_config(self.watch_params)
+        self.search_params = read_config(filename=config_filename, section="search", required=False)
+        self.search_engine = create_search_engine(self.search_params)
+        # with replicas, cache misses are read from a server that has replayed the last invalidation
+        self.search_cache = SearchResultCache.from_config(self.search_params, track_lsn=self.router is not None)
+        self.suggestion_params = read_config(filename=config_filename, section="suggestions", required=False)
+        self.suggestion_engine = create_suggestion_engine(self.suggestion_params)
+        self.cowatch_limit = get_int(self.suggestion_params, "cowatchlimit", 20)
+        self.plan_params = read_config(filename=config_filename, section="plans", required=False)
+        self.plan_cache = PlanCache.from_config(self.plan_params)
+        self.session_params = read_config(filename=config_filename, section="sessions", required=False)
+        self.session_leases = SessionLeaseManager.from_config(self.session_params)
+        self.listener = ChangeListener(self.db_conn_params)
+        self.output_params = read_config(filename=config_filename, section="output", required=False)
+        self.output_streaming = get_bool(self.output_params, "streaming", True)
+        self.output_batch_size = get_int(self.output_params, "batchsize", 2000)
+        self._pinned = threading.local()
 
     """
-        Connects to PostgreSQL database and returns connection object.
+        Opens the connection pool, and the replica pools if replicas are configured. Command methods check
+        connections out of the pool and return them when done.
+        Also starts the session lease manager, the plan cache, the search result cache, the configured search
+        and suggestion engines and the write-behind watch queue, and listens for the change notifications they
+        need. Their tables, indexes and triggers must already exist, see install_schema.
     """
 
     def connect(self):
-        self.conn = psycopg2.connect(**self.db_conn_params)
-        self.conn.autocommit = False
+        self.pool.open()
+        if self.router is not None:
+            self.router.open()
+
+        self.session_leases.start(self.pool, self.listener)
+        self.plan_cache.start(self.pool, self.listener)
+        self.search_engine.start(self.pool, self.listener)
+        if self.search_cache is not None:
+            self.search_cache.start(self.pool, self.listener)
+        self.suggestion_engine.start(self.pool, self.listener)
+        if self.watch_queue is not None:
+            self.watch_queue.start(self.pool, self.listener)
+        self.listener.start()
 
     """
-        Disconnects from PostgreSQL database.
+        Creates the tables, indexes and triggers of the configured components on the primary. Run once by
+        migrate.py after construct_db.sql and again whenever the configured engines change, never at client
+        start: the statements lock movies, genres and customers while they run.
+    """
+
+    def install_schema(self):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            self.session_leases.install(cursor)
+            self.plan_cache.install(cursor)
+            self.search_engine.install(cursor)
+            if self.search_cache is not None:
+                self.search_cache.install(cursor)
+            self.suggestion_engine.install(cursor)
+            if self.watch_queue is not None:
+                self.watch_queue.install(cursor)
+            cursor.execute(queries.MOVIE_NEIGHBORS_DDL)
+            cursor.execute(queries.WATCHED_VERSION_DDL)
+            conn.commit()
+            cursor.close()
+
+    """
+        Writes the queued watches, stops background listeners and the lease heartbeat, and closes every
+        pooled connection.
     """
 
     def disconnect(self):
-        self.conn.close()
+        if self.watch_queue is not None:
+            self.watch_queue.stop()
+        self.listener.stop()
+        self.session_leases.stop()
+        self.plan_cache.stop()
+        self.search_engine.stop()
+        if self.search_cache is not None:
+            self.search_cache.stop()
+        self.suggestion_engine.stop()
+        self.pool.close()
+        if self.router is not None:
+            self.router.close()
+
+    """
+        Returns connection pool counters (hits, misses, waits, wait_time, ...).
+    """
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    """
+        Returns plan cache counters (hits, misses, invalidations, ...).
+    """
+
+    def plan_cache_stats(self):
+        return self.plan_cache.stats()
+
+    """
+        Returns search result cache counters (hits, misses, hit_rate, evictions, bytes, ...), or an empty dict
+        if the cache is disabled.
+    """
+
+    def search_cache_stats(self):
+        return self.search_cache.stats() if self.search_cache is not None else {}
+
+    """
+        Returns write-behind watch queue counters (depth, flushes, rows_per_flush, flush_seconds, ...), or an
+        empty dict if write-behind is disabled.
+    """
+
+    def watch_queue_stats(self):
+        return self.watch_queue.stats() if self.watch_queue is not None else {}
+
+    """
+        Returns read routing counters (primary_reads, lag_fallbacks, replica_<name>_reads, ...), or an empty dict
+        if no replica is configured.
+    """
+
+    def routing_stats(self):
+        return self.router.stats() if self.router is not None else {}
+
+    """
+        Runs every command called inside the with block on one connection and in one transaction.
+        - Each command runs in its own savepoint, so a failing command only undoes its own changes.
+        - The transaction is committed when the block ends, or rolled back if the block raises.
+    """
+
+    @contextmanager
+    def transaction(self):
+        with self.pool.connection() as conn:
+            self._pinned.conn = conn
+            self._pinned.writers = []
+            try:
+                yield
+                conn.commit()
+                writers, self._pinned.conn = self._pinned.writers, None
+                for customer in writers:
+                    self._track_write(conn, customer)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._pinned.conn = None
+                self._pinned.writers = []
+
+    """
+        Checks out the connection a command runs on: the transaction connection inside transaction(),
+        a pooled connection otherwise. Read-only commands pass read_only and get a replica connection if
+        replicas are configured and one has caught up with the customer's last write and with min_lsn.
+        Savepoints use an uninstrumented cursor, so they are not counted as statements of the command.
+    """
+
+    @contextmanager
+    def _connection(self, read_only=False, customer=None, min_lsn=0):
+        conn = getattr(self._pinned, "conn", None)
+        if conn is None and read_only and self.router is not None:
+            with self.router.connection(max(customer.write_lsn if customer is not None else 0, min_lsn)) as conn:
+                yield conn
+            return
+        if conn is None:
+            with self.pool.connection() as conn:
+                yield conn
+            return
+
+        cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        cursor.execute("savepoint mp2_command;")
+        cursor.close()
+        yield conn
+
+    def _commit(self, conn):
+        if getattr(self._pinned, "conn", None) is not conn:
+            conn.commit()
+            return
+        cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        cursor.execute("release savepoint mp2_command;")
+        cursor.close()
+
+    """
+        Stores the primary's WAL position on the customer after a write was committed on conn, so replicas
+        serve the customer's next reads only once they have replayed it. Inside transaction() this happens
+        when the transaction commits.
+    """
+
+    def _track_write(self, conn, customer):
+        if self.router is None:
+            return
+        if getattr(self._pinned, "conn", None) is conn:
+            self._pinned.writers.append(customer)
+            return
+        try:
+            customer.write_lsn = self.router.current_lsn(conn)
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.metrics.record_error(error)
+            # the write is committed; the customer reads from the primary until a later write is tracked
+            customer.write_lsn = READ_FROM_PRIMARY
+
+    def _rollback(self, conn):
+        if getattr(self._pinned, "conn", None) is not conn:
+            conn.rollback()
+            return
+        cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        cursor.execute("rollback to savepoint mp2_command; release savepoint mp2_command;")
+        cursor.close()
+
+    """
+        Returns the cursor that large results are read from: a named server-side cursor that fetches
+        output_batch_size rows at a time in streaming mode, a regular client-side cursor otherwise.
+    """
+
+    def _result_cursor(self, conn, name):
+        if not self.output_streaming:
+            return conn.cursor()
+        cursor = conn.cursor(name=name)
+        cursor.itersize = self.output_batch_size
+        return cursor
+
+    """
+        Closes a cursor on the error path. A named cursor that is no longer valid, e.g. because its transaction
+        already ended, raises on close; that error is not the one the command failed with.
+    """
+
+    @staticmethod
+    def _close_cursor(cursor):
+        try:
+            cursor.close()
+        except (psycopg2.ProgrammingError, psycopg2.InterfaceError):
+            pass
+
+    """
+        Returns the customer's watched set. One round trip compares its version with customers.watchedVersion;
+        the watched movie ids are only read again if they differ, e.g. after a watch in another session.
+        Watches still in the write-behind queue are added on top.
+    """
+
+    def _watched(self, cursor, customer):
+        # read before the database, so a batch written in between is seen by one of the two
+        pending_movie_ids = self.watch_queue.pending(customer.customer_id) if self.watch_queue is not None else []
+        known_version = customer.watched.version if customer.watched is not None else None
+        prepared.execute(cursor, prepared.WATCHED_SET, {"customer_id": customer.customer_id,
+                                                        "version": known_version})
+        watched_set_records = cursor.fetchall()
+        if not watched_set_records:
+            return WatchedSet(pending_movie_ids)
+        version, movie_ids = watched_set_records[0]
+        if movie_ids is not None:
+            customer.watched = WatchedSet(movie_ids, version)
+        customer.watched.include(pending_movie_ids)
+        return customer.watched
+
+    """
+        Waits until the write-behind watch queue is written. Returns False if that did not happen in time.
+    """
+
+    def _flush_watches(self):
+        if self.watch_queue is None or self.watch_queue.flush():
+            return True
+        self.metrics.record_error(Exception('Watch queue was not flushed in {0} seconds'.format(
+            self.watch_queue.timeout)))
+        return False
 
     """
         Prints list of available commands of the software.
@@ -51,8 +363,13 @@ class Mp2Client:
         print("> show_subscription")
         print("> subscribe <plan_id>")
         print("> watch <movie_id_1> <movie_id_2> <movie_id_3> ... <movie_id_n>")
+        print("> watch --file <path>  (use - to read movie ids from stdin)")
         print("> search_for_movies <keyword_1> <keyword_2> <keyword_3> ... <keyword_n>")
-        print("> suggest_movies")
+        print("> search_for_movies --page <page_size> [--after <page_token>] <keyword_1> ... <keyword_n>")
+        print("> suggest_movies [--cowatch]")
+        print("> refresh_suggestions [--full]")
+        print("> show_suggestion_status")
+        print("> stats [--prometheus]")
         print("> quit")
 
     """
@@ -62,27 +379,32 @@ class Mp2Client:
         - If any exception occurs; rollback, do nothing on the database and return tuple (False, CMD_EXECUTION_FAILED).
     """
 
+    @instrumented
     def sign_up(self, email, password, first_name, last_name, plan_id): #
 
-        sign_up_customer_query = "insert into customers (email, password, firstname, lastname, sessioncount, planid) values (%s,%s,%s,%s,%s,%s);"
-        check_customer_query = "select * from customers c where c.email = %s;"
-
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(check_customer_query, (email,))
-            customer_records = cursor.fetchall()
-            # if there exists any user with same email address, don't sign up
-            if customer_records:
-                cursor.close
-                return False, CMD_EXECUTION_FAILED
-            else:
-                cursor.execute(sign_up_customer_query, (email, password, first_name, last_name, 0, plan_id))
-                self.conn.commit()
-                cursor.close()
-                return True, CMD_EXECUTION_SUCCESS
+            with self._connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    prepared.execute(cursor, prepared.CHECK_CUSTOMER, (email,))
+                    customer_records = cursor.fetchall()
+                    # if there exists any user with same email address, don't sign up
+                    if customer_records:
+                        cursor.close
+                        return False, CMD_EXECUTION_FAILED
+                    else:
+                        cursor.execute(queries.SIGN_UP_CUSTOMER, (email, password, first_name, last_name, 0, plan_id))
+                        self._commit(conn)
+                        cursor.close()
+                        return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg2.DatabaseError) as error:
+                    self.metrics.record_error(error)
+                    self._rollback(conn)
+                    cursor.close()
+                    return False, CMD_EXECUTION_FAILED
         except (Exception, psycopg2.DatabaseError) as error:
-            self.conn.rollback()
-            cursor.close()
+            # no connection could be checked out, or rolling back on a broken one failed
+            self.metrics.record_error(error)
             return False, CMD_EXECUTION_FAILED
 
     """
@@ -92,80 +414,106 @@ class Mp2Client:
         - If sessionCount < maxParallelSessions, commit changes (increment sessionCount) and return tuple (customer, CMD_EXECUTION_SUCCESS).
         - If sessionCount >= maxParallelSessions, return tuple (None, USER_ALL_SESSIONS_ARE_USED).
         - If any exception occurs; rollback, do nothing on the database and return tuple (None, USER_SIGNIN_FAILED).
+        - The limit check, the increment and taking the session lease happen in one statement, so concurrent
+          sign-ins cannot exceed maxParallelSessions. The lease is renewed in the background until sign out.
+        - The customer's watched movie ids are loaded into customer.watched in the same transaction.
     """
 
+    @instrumented
     def sign_in(self, email, password): #
 
-        customer_query = "select * from customers c where c.email= %s and c.password =%s;"
-        plan_query = "select * from plans p where p.planid = %s;"
-        update_customer_query = "update customers c set sessioncount = %s where c.email=%s and c.password=%s;"
-
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(customer_query, (email, password,))
-            customer_records = cursor.fetchall()
-            if len(customer_records) == 1:
-                cursor.execute(plan_query, (customer_records[0][6],))
-                plan_records = cursor.fetchall()
-                max_session_count_for_the_plan = plan_records[0][3]
-                if customer_records[0][5] < max_session_count_for_the_plan:
-                    cursor.execute(update_customer_query, (customer_records[0][5] + 1, email, password,))
-                    customer_object = Customer(customer_records[0][0], customer_records[0][1], customer_records[0][3],
-                                               customer_records[0][4], customer_records[0][5] + 1, customer_records[0][6])
-                    self.conn.commit()
+            with self._connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    cursor.row_factory = Customer.from_row
+                    # checks the plan limit, increments sessionCount and takes a lease in one round trip
+                    prepared.execute(cursor, prepared.SIGN_IN_LEASE, {"email": email, "password": password,
+                                                           "lease_seconds": self.session_leases.lease})
+                    customer_records = cursor.fetchall()
+                    if len(customer_records) == 1:
+                        customer_object = customer_records[0]
+                        if customer_object.session_id is not None:
+                            cursor.row_factory = None
+                            self._watched(cursor, customer_object)
+                            self._commit(conn)
+                            self._track_write(conn, customer_object)
+                            self.session_leases.track(customer_object.session_id)
+                            cursor.close()
+                            return customer_object, CMD_EXECUTION_SUCCESS
+                        else:
+                            self._rollback(conn)
+                            cursor.close()
+                            return None, USER_ALL_SESSIONS_ARE_USED
+                except (Exception, psycopg2.DatabaseError) as error:
+                    self.metrics.record_error(error)
+                    self._rollback(conn)
                     cursor.close()
-                    return customer_object, CMD_EXECUTION_SUCCESS
-                else:
-                    self.conn.rollback()
-                    cursor.close()
-                    return None, USER_ALL_SESSIONS_ARE_USED
+                    return None, USER_SIGNIN_FAILED
+                # if e-mail or password is wrong
+                self._rollback(conn)
+                cursor.close()
+                return None, USER_SIGNIN_FAILED
         except (Exception, psycopg2.DatabaseError) as error:
-            self.conn.rollback()
-            cursor.close()
+            self.metrics.record_error(error)
             return None, USER_SIGNIN_FAILED
-        # if e-mail or password is wrong
-        self.conn.rollback()
-        cursor.close()
-        return None, USER_SIGNIN_FAILED
 
     """
         Signs out from given customer's account.
         - Return type is a tuple, 1st element is a boolean and 2nd element is the response message from messages.py.
-        - Decrement sessionCount of the customer in the database.
+        - Queued watches are written first; if that fails, return tuple (False, CMD_EXECUTION_FAILED) and stay signed in.
+        - End the customer's session lease and decrement sessionCount of the customer in the database.
+        - If the lease has already expired and been reclaimed, sessionCount is left alone.
         - If the operation is successful, commit changes and return tuple (True, CMD_EXECUTION_SUCCESS).
         - If any exception occurs; rollback, do nothing on the database and return tuple (False, CMD_EXECUTION_FAILED).
     """
 
+    @instrumented
     def sign_out(self, customer): #
-
-        update_customer_query = "update customers set sessioncount = %s where customerid=%s;"
+        if not self._flush_watches():
+            return False, CMD_EXECUTION_FAILED
 
         try:
-            cursor = self.conn.cursor()
-            session_count = int(customer.session_count) - 1
-            customer.session_count = customer.session_count - 1
-            cursor.execute(update_customer_query, (session_count, customer.customer_id,))
-            self.conn.commit()
-            cursor.close()
-            return True, CMD_EXECUTION_SUCCESS
+            with self._connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    # ends the lease and decrements sessionCount on the server, in one round trip
+                    prepared.execute(cursor, prepared.SIGN_OUT_LEASE, (customer.session_id,))
+                    session_count_records = cursor.fetchall()
+                    self._commit(conn)
+                    self._track_write(conn, customer)
+                    self.session_leases.untrack(customer.session_id)
+                    if session_count_records:
+                        customer.session_count = session_count_records[0][0]
+                    customer.session_id = None
+                    cursor.close()
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg2.DatabaseError) as error:
+                    self.metrics.record_error(error)
+                    self._rollback(conn)
+                    cursor.close()
+                    return False, CMD_EXECUTION_FAILED
         except (Exception, psycopg2.DatabaseError) as error:
-            self.conn.rollback()
-            cursor.close()
+            self.metrics.record_error(error)
             return False, CMD_EXECUTION_FAILED
 
     """
         Quits from program.
         - Return type is a tuple, 1st element is a boolean and 2nd element is the response message from messages.py.
-        - Remember to sign authenticated user out first.
+        - Remember to sign authenticated user out first. Queued watches are written even if nobody is signed in.
         - If the operation is successful, commit changes and return tuple (True, CMD_EXECUTION_SUCCESS).
         - If any exception occurs; rollback, do nothing on the database and return tuple (False, CMD_EXECUTION_FAILED).
     """
 
+    @instrumented
     def quit(self, customer): # check again
         try:
+            if not self._flush_watches():
+                return False, CMD_EXECUTION_FAILED
             self.sign_out(customer)
             return True, CMD_EXECUTION_SUCCESS
         except (Exception, psycopg2.DatabaseError) as error:
+            self.metrics.record_error(error)
             return False, CMD_EXECUTION_FAILED
 
     """
@@ -181,33 +529,24 @@ class Mp2Client:
         3|Premium|4K|10|90
     """
 
+    @instrumented
     def show_plans(self): #
 
-        show_all_plans_query = "select * from plans p;"
-
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(show_all_plans_query)
-            all_plans_records = cursor.fetchall()
+            # plans are served from the in-process plan cache
+            all_plans_records = self.plan_cache.all()
 
             if not all_plans_records:
-                cursor.close()
                 return False, CMD_EXECUTION_FAILED
 
-            if len(all_plans_records) > 0:
-                print("#|Name|Resolution|Max Sessions|Monthly Fee")
-                for plan in all_plans_records:
-                    print(str(plan[0]) + "|" + str(plan[1]) + "|" + str(plan[2]) + "|" + str(plan[3]) + "|" + str(plan[4]))
-                self.conn.commit()
-                cursor.close()
-                return True, CMD_EXECUTION_SUCCESS
+            print("#|Name|Resolution|Max Sessions|Monthly Fee")
+            for plan in all_plans_records:
+                print(str(plan.plan_id) + "|" + str(plan.name) + "|" + str(plan.resolution) + "|" +
+                      str(plan.max_parallel_sessions) + "|" + str(plan.monthly_fee))
+            return True, CMD_EXECUTION_SUCCESS
         except (Exception, psycopg2.DatabaseError) as error:
-            self.conn.rollback()
-            cursor.close()
+            self.metrics.record_error(error)
             return False, CMD_EXECUTION_FAILED
-        self.conn.rollback()
-        cursor.close()
-        return False, CMD_EXECUTION_FAILED
 
     """
         Retrieves authenticated user's plan and prints it. 
@@ -220,26 +559,19 @@ class Mp2Client:
         1|Basic|720P|2|30
     """
 
+    @instrumented
     def show_subscription(self, customer): #
 
-        show_subscription_query = "select * from plans p where p.planid =%s;"
-
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(show_subscription_query, (customer.plan_id,))
-            plan_records = cursor.fetchall()
-            if len(plan_records) == 1:
+            plan = self.plan_cache.get(customer.plan_id)
+            if plan:
                 print("#|Name|Resolution|Max Sessions|Monthly Fee")
-                print(str(plan_records[0][0])+"|"+str(plan_records[0][1])+"|"+str(plan_records[0][2])+"|"+str(plan_records[0][3])+"|"+str(plan_records[0][4]))
-                self.conn.commit()
-                cursor.close()
+                print(str(plan.plan_id)+"|"+str(plan.name)+"|"+str(plan.resolution)+"|"+
+                      str(plan.max_parallel_sessions)+"|"+str(plan.monthly_fee))
                 return True, CMD_EXECUTION_SUCCESS
         except (Exception, psycopg2.DatabaseError) as error:
-            self.conn.rollback()
-            cursor.close()
+            self.metrics.record_error(error)
             return False, CMD_EXECUTION_FAILED
-        self.conn.rollback()
-        cursor.close()
         return False, CMD_EXECUTION_FAILED
 
     """
@@ -249,36 +581,101 @@ class Mp2Client:
         - If the operation is successful, commit changes and return tuple (True, CMD_EXECUTION_SUCCESS).
         - If any one of the movie ids is incorrect; rollback, do nothing on the database and return tuple (False, CMD_EXECUTION_FAILED).
         - If any exception occurs; rollback, do nothing on the database and return tuple (False, CMD_EXECUTION_FAILED).
+        - With write-behind enabled, the validated pairs are queued and written by a background flusher within
+          flushinterval seconds; if the queue stays full, return tuple (False, CMD_EXECUTION_FAILED).
     """
 
+    @instrumented
     def watch(self, customer, movie_ids): #
+        # inside transaction() the watches have to be part of the transaction
+        if self.watch_queue is not None and getattr(self._pinned, "conn", None) is None:
+            return self._queue_watch(customer, movie_ids)
+        return self._watch_chunks(customer, chunked(movie_ids, self.watch_chunk_size))
 
-        insert_watched_movie_query = "insert into watched (customerid, movieid) values(%s, %s);"
-        check_a_movie_exists_query = "select * from movies m where m.movieid = %s;"
-        check_a_movie_watched_before_query = "select * from watched w where w.customerid = %s and w.movieid = %s;"
+    """
+        Same as watch, but reads whitespace separated movie ids from the given text stream (a file or stdin).
+        - Ids are sent to the database in chunks of watch_chunk_size, so the whole list is never held in memory.
+        - All chunks are inserted in a single transaction; if any id is incorrect nothing is inserted.
+    """
+
+    @instrumented
+    def watch_from_stream(self, customer, stream):
+        return self._watch_chunks(customer, chunked(iter_movie_ids(stream), self.watch_chunk_size))
+
+    """
+        Write-behind watch: validates every movie id, all or nothing, and queues the pairs for the flusher.
+        Waits while the queue is full, without holding a connection.
+    """
+
+    def _queue_watch(self, customer, movie_ids):
+        movie_ids = list(dict.fromkeys(movie_ids))
 
         try:
-            cursor = self.conn.cursor()
-            for movie_id in movie_ids:
-                cursor.execute(check_a_movie_exists_query, (movie_id,))
-                movie_exists_records = cursor.fetchall()
-                if len(movie_exists_records) > 0:
-                    cursor.execute(check_a_movie_watched_before_query, (customer.customer_id, movie_id,))
-                    watched_movie_exists_records = cursor.fetchall()
-                    if len(watched_movie_exists_records) == 0:
-                        cursor.execute(insert_watched_movie_query, (customer.customer_id, movie_id,))
-                    else:
-                        continue
-                else:
-                    self.conn.rollback()
+            with self._connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    for movie_id_chunk in chunked(movie_ids, self.watch_chunk_size):
+                        prepared.execute(cursor, prepared.COUNT_KNOWN_MOVIES, (movie_id_chunk,))
+                        if cursor.fetchone()[0] != len(movie_id_chunk):
+                            self._rollback(conn)
+                            cursor.close()
+                            return False, CMD_EXECUTION_FAILED
+                    self._commit(conn)
+                    cursor.close()
+                except (Exception, psycopg2.DatabaseError) as error:
+                    self.metrics.record_error(error)
+                    self._rollback(conn)
                     cursor.close()
                     return False, CMD_EXECUTION_FAILED
-            self.conn.commit()
-            cursor.close()
-            return True, CMD_EXECUTION_SUCCESS
         except (Exception, psycopg2.DatabaseError) as error:
-            self.conn.rollback()
-            cursor.close()
+            self.metrics.record_error(error)
+            return False, CMD_EXECUTION_FAILED
+
+        try:
+            self.watch_queue.add(customer.customer_id, movie_ids)
+        except Exception as error:
+            self.metrics.record_error(error)
+            return False, CMD_EXECUTION_FAILED
+        if customer.watched is not None:
+            customer.watched.include(movie_ids)
+        return True, CMD_EXECUTION_SUCCESS
+
+    def _watch_chunks(self, customer, movie_id_chunks):
+        watched = customer.watched if customer.watched is not None else WatchedSet()
+
+        try:
+            with self._connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    for movie_ids in movie_id_chunks:
+                        prepared.execute(cursor, prepared.WATCH_MOVIES, (movie_ids, customer.customer_id,
+                                                                         customer.customer_id))
+                        unknown_movie_count, inserted_movie_count, watched_version = cursor.fetchone()
+                        if unknown_movie_count > 0:
+                            self._rollback(conn)
+                            watched.invalidate()
+                            cursor.close()
+                            return False, CMD_EXECUTION_FAILED
+                        self.metrics.record_rows_written(inserted_movie_count)
+                        # the session's watched set follows its own watches without reading them back
+                        if watched_version is not None:
+                            watched.add(movie_ids, watched_version)
+                    self._commit(conn)
+                    self._track_write(conn, customer)
+                    # the enclosing transaction() may still be rolled back
+                    if getattr(self._pinned, "conn", None) is conn:
+                        watched.invalidate()
+                    cursor.close()
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg2.DatabaseError) as error:
+                    self.metrics.record_error(error)
+                    self._rollback(conn)
+                    watched.invalidate()
+                    cursor.close()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.metrics.record_error(error)
+            watched.invalidate()
             return False, CMD_EXECUTION_FAILED
 
     """
@@ -290,48 +687,56 @@ class Mp2Client:
         - If any exception occurs; rollback, do nothing on the database and return tuple (None, CMD_EXECUTION_FAILED).
     """
 
+    @instrumented
     def subscribe(self, customer, plan_id): #
 
-        plan_query = "select * from plans p where p.planid = %s;"
-        update_customer_query = "update customers c set planid = %s where c.customerid = %s"
-
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(plan_query, (plan_id,))
-            plan_records = cursor.fetchone()
-            if plan_records:
-                new_plan = plan_records
-            else:
-                self.conn.rollback()
-                cursor.close()
-                return None, SUBSCRIBE_PLAN_NOT_FOUND
+            with self._connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    plan_records = self.plan_cache.get(plan_id, cursor=cursor)
+                    if plan_records:
+                        new_plan = plan_records
+                    else:
+                        self._rollback(conn)
+                        cursor.close()
+                        return None, SUBSCRIBE_PLAN_NOT_FOUND
 
-            cursor.execute(plan_query, (customer.plan_id,))
-            old_plan_records = cursor.fetchone()
+                    old_plan_records = self.plan_cache.get(customer.plan_id, cursor=cursor)
 
-            if new_plan[3] >= old_plan_records[3]:
-                cursor.execute(update_customer_query, (plan_id, customer.customer_id))
-                customer.plan_id = plan_id
-                self.conn.commit()
-                cursor.close()
-                return customer, CMD_EXECUTION_SUCCESS
-            else:
-                self.conn.rollback()
-                cursor.close()
-                return None, SUBSCRIBE_MAX_PARALLEL_SESSIONS_UNAVAILABLE
+                    if new_plan.max_parallel_sessions >= old_plan_records.max_parallel_sessions:
+                        prepared.execute(cursor, prepared.SUBSCRIBE_CUSTOMER, (plan_id, customer.customer_id))
+                        customer.plan_id = plan_id
+                        self._commit(conn)
+                        self._track_write(conn, customer)
+                        cursor.close()
+                        return customer, CMD_EXECUTION_SUCCESS
+                    else:
+                        self._rollback(conn)
+                        cursor.close()
+                        return None, SUBSCRIBE_MAX_PARALLEL_SESSIONS_UNAVAILABLE
 
-        except(Exception, psycopg2.DatabaseError) as error:
-            self.conn.rollback()
-            cursor.close()
+                except(Exception, psycopg2.DatabaseError) as error:
+                    self.metrics.record_error(error)
+                    self._rollback(conn)
+                    cursor.close()
+                    return False, CMD_EXECUTION_FAILED
+                self._rollback(conn)
+                cursor.close()
+                return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.metrics.record_error(error)
             return False, CMD_EXECUTION_FAILED
-        self.conn.rollback()
-        cursor.close()
-        return False, CMD_EXECUTION_FAILED
 
     """
         Searches for movies with given search_text.
         - Return type is a tuple, 1st element is a boolean and 2nd element is the response message from messages.py.
         - Print all movies whose titles contain given search_text IN CASE-INSENSITIVE MANNER.
+        - If page_size is given; print only the next page_size movies after page_token (see search_page), followed by
+          a "Next Page|<token>" line unless it is the last page.
+        - If page_token is malformed or belongs to another search text; return tuple (False, SEARCH_PAGE_TOKEN_INVALID).
+        - The Watched column comes from the customer's watched set, so the search itself does not read watched.
+          Full results are kept in the search result cache without it; a repeated search only checks the watched set.
         - If the operation is successful; print movies found and return tuple (True, CMD_EXECUTION_SUCCESS).
         - If any exception occurs; return tuple (False, CMD_EXECUTION_FAILED).
         
@@ -350,31 +755,120 @@ class Mp2Client:
         "tt6274696"|"The Dark Knight Returns: An Epic Fan Film"|2016|6.7|38|0
     """
 
-    def search_for_movies(self, customer, search_text): #
-        # TODO: Implement this function
-        search_movies_query = "select * from movies m where m.originaltitle ILIKE %s order by m.movieid; "
-        search_watched_movies_query = "select * from watched w where w.customerid = %s and w.movieid = %s;"
+    @instrumented
+    def search_for_movies(self, customer, search_text, page_size=None, page_token=None): #
 
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute(search_movies_query, ('%' + search_text + '%',))
-            movies_records = cursor.fetchall()
-            print("Id|Title|Year|Rating|Votes|Watched")
-            for movie in movies_records:
-                cursor.execute(search_watched_movies_query, (customer.customer_id, movie[0],))
-                watched_movies_records = cursor.fetchall()
-                if len(watched_movies_records) > 0:
-                    print(str(movie[0]) + "|" + str(movie[1]) + "|" + str(movie[2]) + "|" + str(movie[3]) + "|" + str(movie[4]) + "|1")
-                else:
-                    print(str(movie[0]) + "|" + str(movie[1]) + "|" + str(movie[2]) + "|" + str(movie[3]) + "|" + str(movie[4]) + "|0")
-            self.conn.commit()
-            cursor.close()
+        if page_size is not None:
+            try:
+                movies, next_page_token = self.search_page(customer, search_text, page_size, page_token)
+            except ValueError as error:
+                self.metrics.record_error(error)
+                return False, SEARCH_PAGE_TOKEN_INVALID
+            except (Exception, psycopg2.DatabaseError) as error:
+                self.metrics.record_error(error)
+                return False, CMD_EXECUTION_FAILED
+            with RowWriter(buffer_lines=self.output_batch_size) as writer:
+                writer.write_line("Id|Title|Year|Rating|Votes|Watched")
+                writer.write_rows(movies)
+                if next_page_token:
+                    writer.write_line("Next Page|" + next_page_token)
             return True, CMD_EXECUTION_SUCCESS
+
+        cached_rows, cache_generation, cache_lsn = None, None, 0
+        if self.search_cache is not None:
+            cached_rows, cache_generation = self.search_cache.get(search_text)
+            # a miss is read from a replica only once it has replayed the change that emptied the cache,
+            # so the rows stored under this generation are not older than the invalidation
+            cache_lsn = self.search_cache.invalidated_lsn if cached_rows is None else 0
+
+        try:
+            with self._connection(read_only=True, customer=customer, min_lsn=cache_lsn) as conn:
+                try:
+                    cursor = conn.cursor()
+                    watched = self._watched(cursor, customer)
+                    cursor.close()
+
+                    if cached_rows is not None:
+                        with RowWriter(buffer_lines=self.output_batch_size) as writer:
+                            writer.write_line("Id|Title|Year|Rating|Votes|Watched")
+                            for row in cached_rows:
+                                writer.write_row(Movie(*row, watched=1 if row[0] in watched else 0))
+                        self._commit(conn)
+                        return True, CMD_EXECUTION_SUCCESS
+
+                    cursor = self._result_cursor(conn, "search_for_movies")
+                    cursor.row_factory = Movie.from_row
+                    # the configured search engine decides which movies match
+                    match_clause, match_params = self.search_engine.match_clause(search_text)
+                    cursor.execute(queries.SEARCH_MOVIE_ROWS.format(match=match_clause), match_params)
+                    # rows are collected for the cache until the result gets too large to be cached
+                    collected_rows = [] if self.search_cache is not None else None
+                    collected_bytes = 0
+                    with RowWriter(buffer_lines=self.output_batch_size) as writer:
+                        writer.write_line("Id|Title|Year|Rating|Votes|Watched")
+                        # iterating a named cursor fetches output_batch_size rows per round trip
+                        for movie in cursor:
+                            movie.watched = 1 if movie.movie_id in watched else 0
+                            writer.write_row(movie)
+                            if collected_rows is not None:
+                                row = (movie.movie_id, movie.title, movie.year, movie.rating, movie.votes)
+                                collected_rows.append(row)
+                                collected_bytes += row_size(row)
+                                if collected_bytes > self.search_cache.max_entry_bytes:
+                                    collected_rows = None
+                    # a named cursor is gone once its transaction ends, so it is closed first
+                    cursor.close()
+                    self._commit(conn)
+                    if collected_rows is not None:
+                        self.search_cache.put(search_text, collected_rows, cache_generation, size=collected_bytes)
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg2.DatabaseError) as error:
+                    self.metrics.record_error(error)
+                    self._close_cursor(cursor)
+                    self._rollback(conn)
+                    return False, CMD_EXECUTION_FAILED
         except (Exception, psycopg2.DatabaseError) as error:
-            self.conn.rollback()
-            cursor.close()
+            self.metrics.record_error(error)
             return False, CMD_EXECUTION_FAILED
 
+    """
+        Returns one page of the movies search_for_movies finds, as a tuple (movies, next_page_token).
+        - movies holds at most page_size Movie objects ordered by movie id, starting right after the last movie of
+          the page page_token was returned with, or at the first match if page_token is None.
+        - next_page_token continues the search with the following page; it is None on the last page.
+        - Pages are read with a keyset seek on movieid instead of OFFSET, so page N costs as much as page 1.
+        - Watched comes from the customer's watched set, so watches still in the write-behind queue are included.
+        - Raises ValueError if page_token is malformed or was issued for another search text.
+    """
+
+    @instrumented
+    def search_page(self, customer, search_text, page_size, page_token=None):
+        last_movie_id = decode_page_token(page_token, search_text) if page_token else ""
+        match_clause, match_params = self.search_engine.match_clause(search_text)
+
+        with self._connection(read_only=True, customer=customer) as conn:
+            cursor = conn.cursor()
+            try:
+                watched = self._watched(cursor, customer)
+                cursor.row_factory = Movie.from_row
+                # one extra row tells whether another page follows
+                cursor.execute(queries.SEARCH_MOVIE_ROWS_PAGE.format(match=match_clause),
+                               match_params + (last_movie_id, page_size + 1))
+                movies = cursor.fetchall()
+                self._commit(conn)
+                for movie in movies:
+                    movie.watched = 1 if movie.movie_id in watched else 0
+            except Exception:
+                self._rollback(conn)
+                raise
+            finally:
+                cursor.close()
+
+        if len(movies) <= page_size:
+            return movies, None
+        movies = movies[:page_size]
+        return movies, encode_page_token(movies[-1].movie_id, search_text)
+
     """
         Suggests combination of these movies:
             1- Find customer's genres. For each genre, find movies with most numVotes among the movies that the customer didn't watch.
@@ -390,52 +884,154 @@ class Mp2Client:
         - Return type is a tuple, 1st element is a boolean and 2nd element is the response message from messages.py.    
         - Output format and return format are same with search_for_movies.
         - Order these movies by their movie id, in ascending order at the end.
+        - If cowatch is set; suggest the cowatch_limit movies most often watched together with the customer's movies
+          instead, best first, from the neighbour lists precomputed by cowatch.py.
         - If the operation is successful; print movies suggested and return tuple (True, CMD_EXECUTION_SUCCESS).
         - If any exception occurs; return tuple (False, CMD_EXECUTION_FAILED).
     """
 
-    def suggest_movies(self, customer):#
+    @instrumented
+    def suggest_movies(self, customer, cowatch=False):#
+
+        try:
+            with self._connection(read_only=True, customer=customer) as conn:
+                try:
+                    cursor = conn.cursor()
+                    # the watched movies are passed to the suggestion queries as one array
+                    watched_movie_ids = self._watched(cursor, customer).movie_ids()
+                    if cowatch:
+                        # already ordered by score
+                        cursor.row_factory = Movie.from_row
+                        prepared.execute(cursor, prepared.COWATCH_SUGGESTIONS,
+                                         {"customer_id": customer.customer_id, "watched_movie_ids": watched_movie_ids,
+                                          "limit": self.cowatch_limit})
+                        output_movie = cursor.fetchall()
+                    else:
+                        # the configured suggestion engine returns the deduplicated movies of all three steps
+                        output_movie = self.suggestion_engine.suggest(cursor, customer.customer_id, watched_movie_ids)
+                        output_movie = sorted(output_movie, key=lambda movie: movie.movie_id, reverse=False)
+                    with RowWriter(buffer_lines=self.output_batch_size) as writer:
+                        writer.write_line("Id|Title|Year|Rating|Votes")
+                        writer.write_rows(output_movie)
+
+                    self._commit(conn)
+                    cursor.close()
+                    return True, CMD_EXECUTION_SUCCESS
+                except (Exception, psycopg2.DatabaseError) as error:
+                    self.metrics.record_error(error)
+                    self._rollback(conn)
+                    cursor.close()
+                    return False, CMD_EXECUTION_FAILED
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.metrics.record_error(error)
+            return False, CMD_EXECUTION_FAILED
 
-        search_genre_query = "select distinct g.genre from watched w, movies m, genres g where w.customerid= %s and  w.movieid = m.movieid and g.movieid = m.movieid;"
-        step1_query = "select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes from movies m, genres g where m.movieid = g.movieid and g.genre = %s and m.movieid not in (select w.movieid from watched w where w.customerid = %s) order by m.numvotes desc limit 1;"
-        step2_query = "select * from movies m where m.startyear >= 2010 and m.movieid not in (select w.movieid from watched w where w.customerid = %s) order by m.numvotes desc, m.averagerating desc limit 10;"
-        search_average_watched_movie_query = "select avg(m.numvotes) from watched w, movies m where w.customerid = %s and m.movieid = w.movieid;"
-        step3_query ="select * from movies m where m.numvotes > %s and m.movieid not in (select w.movieid from watched w where w.customerid =%s) order by m.numvotes desc limit 10;"
+    """
+        Rebuilds the precomputed suggestion rankings that changed since the last refresh, or all of them if full is set.
+        - Return type is a tuple, 1st element is a boolean and 2nd element is the response message from messages.py.
+        - If the operation is successful; print the number of refreshed ranking lists and return tuple (True, CMD_EXECUTION_SUCCESS).
+        - If any exception occurs; return tuple (False, CMD_EXECUTION_FAILED).
+    """
 
+    @instrumented
+    def refresh_suggestions(self, full=False):
         try:
-            output_movie = set()
+            refreshed_lists = self.suggestion_engine.refresh(full=full)
+            print("Refreshed Lists")
+            print(str(refreshed_lists))
+            return True, CMD_EXECUTION_SUCCESS
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.metrics.record_error(error)
+            return False, CMD_EXECUTION_FAILED
 
-            cursor = self.conn.cursor()
-            cursor.execute(search_genre_query, (customer.customer_id,))
-            genre_records = cursor.fetchall()
+    """
+        Prints staleness metrics of the precomputed suggestion rankings.
+        - Return type is a tuple, 1st element is a boolean and 2nd element is the response message from messages.py.
+        - If the operation is successful; print the metrics and return tuple (True, CMD_EXECUTION_SUCCESS).
+        - If any exception occurs; return tuple (False, CMD_EXECUTION_FAILED).
 
-            for genre in genre_records:
-                cursor.execute(step1_query, (genre, customer.customer_id,))
-                movie_record = cursor.fetchone()
-                output_movie.add(movie_record)
+        Output should be like:
+        Engine|Lists|Dirty Lists|Unbuilt Lists|Oldest Change Age|Last Refresh
+        materialized|30|2|0|41.5|2023-06-01 12:00:00+00:00
+    """
 
-            cursor.execute(step2_query, (customer.customer_id,))
-            top_10_movies_records = cursor.fetchall()
-            for movie in top_10_movies_records:
-                output_movie.add(movie)
+    @instrumented
+    def show_suggestion_status(self):
+        try:
+            staleness = self.suggestion_engine.staleness()
+            print("Engine|Lists|Dirty Lists|Unbuilt Lists|Oldest Change Age|Last Refresh")
+            print(str(self.suggestion_engine.name) + "|" + str(staleness.get("lists", 0)) + "|" +
+                  str(staleness.get("dirty_lists", 0)) + "|" + str(staleness.get("unbuilt_lists", 0)) + "|" +
+                  str(staleness.get("oldest_change_age", 0.0)) + "|" + str(staleness.get("newest_refresh")))
+            return True, CMD_EXECUTION_SUCCESS
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.metrics.record_error(error)
+            return False, CMD_EXECUTION_FAILED
 
-            cursor.execute(search_average_watched_movie_query, (customer.customer_id,))
-            average_votes = cursor.fetchall()
+    """
+        Prints the instrumentation recorded since the client started.
+        - Return type is a tuple, 1st element is a boolean and 2nd element is the response message from messages.py.
+        - Prints one line per command, or every metric in the Prometheus text format if prometheus is set.
+          The Prometheus dump also includes the connection pool, plan cache, search cache, watch queue and read
+          routing counters. The plain output ends with the search cache, watch queue and read routing counters
+          if they are enabled.
+        - If the operation is successful; print the metrics and return tuple (True, CMD_EXECUTION_SUCCESS).
+        - If any exception occurs; return tuple (False, CMD_EXECUTION_FAILED).
 
-            cursor.execute(step3_query, (float(average_votes[0][0]), customer.customer_id,))
-            top_10_movies_high_average_records = cursor.fetchall()
-            for movie in top_10_movies_high_average_records:
-                output_movie.add(movie)
+        Output should be like:
+        Command|Calls|Errors|Statements|Rows Fetched|Rows Written|Mean ms|Max ms
+        search_for_movies|12|0|12|381|0|4.210|9.877
+        watch|3|1|3|2|7|1.554|2.031
+    """
 
-            output_movie = sorted(output_movie, key=lambda movie: movie[0], reverse=False)
-            print("Id|Title|Year|Rating|Votes")
-            for movie in output_movie:
-                print(str(movie[0]) + "|" + str(movie[1]) + "|" + str(movie[2]) + "|" + str(movie[3]) + "|"+ str(movie[4]))
+    def stats(self, prometheus=False):
+        try:
+            if prometheus:
+                gauges = {}
+                for key, value in self.pool.stats().items():
+                    gauges["pool_" + key] = value
+                for key, value in self.plan_cache.stats().items():
+                    gauges["plan_cache_" + key] = value
+                for key, value in self.search_cache_stats().items():
+                    gauges["search_cache_" + key] = value
+                for key, value in self.watch_queue_stats().items():
+                    gauges["watch_queue_" + key] = value
+                for key, value in self.routing_stats().items():
+                    gauges["routing_" + key] = value
+                print(self.metrics.prometheus_text(gauges=gauges), end="")
+                return True, CMD_EXECUTION_SUCCESS
 
-            self.conn.commit()
-            cursor.close()
+            commands = self.metrics.snapshot()["commands"]
+            print("Command|Calls|Errors|Statements|Rows Fetched|Rows Written|Mean ms|Max ms")
+            for name, command in sorted(commands.items()):
+                print("%s|%d|%d|%d|%d|%d|%.3f|%.3f" % (name, command["calls"], sum(command["errors"].values()),
+                                                       command["statements"], command["rows_fetched"],
+                                                       command["rows_written"],
+                                                       command["seconds"] * 1000 / command["calls"],
+                                                       command["max_seconds"] * 1000))
+            if self.search_cache is not None:
+                cache = self.search_cache.stats()
+                print("Search Cache|Hits|Misses|Hit Rate|Evictions|Invalidations|Entries|MB|Max MB")
+                print("search_for_movies|%d|%d|%.3f|%d|%d|%d|%.2f|%.2f" % (
+                    cache["hits"], cache["misses"], cache["hit_rate"], cache["evictions"], cache["invalidations"],
+                    cache["entries"], cache["bytes"] / 1e6, cache["max_bytes"] / 1e6))
+            if self.watch_queue is not None:
+                queue = self.watch_queue.stats()
+                mean_flush_ms = queue["flush_seconds"] * 1000 / queue["flushes"] if queue["flushes"] else 0.0
+                print("Watch Queue|Depth|Max Depth|Full Waits|Flushes|Failed Flushes|Rows/Flush|Mean Flush ms|"
+                      "Max Flush ms")
+                print("watch|%d|%d|%d|%d|%d|%.1f|%.3f|%.3f" % (
+                    queue["depth"], queue["max_depth"], queue["full_waits"], queue["flushes"],
+                    queue["failed_flushes"], queue["rows_per_flush"], mean_flush_ms, queue["max_flush_seconds"] * 1000))
+            if self.router is not None:
+                routing = self.router.stats()
+                print("Read Target|Reads|Connections In Use")
+                print("primary|%d|%d" % (routing["primary_reads"], self.pool.stats()["in_use"]))
+                for replica in self.router.replicas:
+                    print("replica.%s|%d|%d" % (replica.name, routing["replica_" + replica.name + "_reads"],
+                                                routing["replica_" + replica.name + "_in_use"]))
+                print("Lag Fallbacks|Unavailable Fallbacks")
+                print("%d|%d" % (routing["lag_fallbacks"], routing["unavailable_fallbacks"]))
             return True, CMD_EXECUTION_SUCCESS
         except (Exception, psycopg2.DatabaseError) as error:
-            self.conn.rollback()
-            cursor.close
             return False, CMD_EXECUTION_FAILED
@@ -0,0 +1,142 @@
+import select
+import threading
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+"""
+    Payload sent when every row of a table may have changed (TRUNCATE, missed notifications, bulk loads).
+"""
+ALL_ROWS = "*"
+
+"""
+    Trigger function that publishes the key column of every changed row on a notification channel.
+    Trigger arguments are the channel name and the key column name.
+"""
+NOTIFY_FUNCTION_DDL = """
+    create or replace function movievault_notify_change() returns trigger as $$
+    declare
+        row_key text;
+    begin
+        if tg_level = 'STATEMENT' then
+            row_key := '*';
+        elsif tg_op = 'DELETE' then
+            row_key := to_jsonb(old) ->> tg_argv[1];
+        else
+            row_key := to_jsonb(new) ->> tg_argv[1];
+        end if;
+        perform pg_notify(tg_argv[0], coalesce(row_key, '*'));
+        return null;
+    end;
+    $$ language plpgsql;"""
+
+"""
+    Installs triggers that notify channel with the key_column of each inserted, updated or deleted row of table,
+    and with ALL_ROWS when the table is truncated. Safe to run repeatedly.
+"""
+
+
+def install_notify_trigger(cursor, table, channel, key_column):
+    cursor.execute(NOTIFY_FUNCTION_DDL)
+    cursor.execute("drop trigger if exists %s_notify_rows on %s;" % (channel, table))
+    cursor.execute("create trigger %s_notify_rows after insert or update or delete on %s "
+                   "for each row execute procedure movievault_notify_change('%s', '%s');"
+                   % (channel, table, channel, key_column))
+    cursor.execute("drop trigger if exists %s_notify_truncate on %s;" % (channel, table))
+    cursor.execute("create trigger %s_notify_truncate after truncate on %s "
+                   "for each statement execute procedure movievault_notify_change('%s', '%s');"
+                   % (channel, table, channel, key_column))
+
+
+"""
+    Listens to PostgreSQL notification channels on a dedicated connection in a background thread.
+    - Callbacks receive the list of payloads that arrived on their channel since the last poll.
+    - Every callback receives [ALL_ROWS] once the channels are first listened to, since components load their
+      state before the listener starts and changes committed in between are not notified to anyone.
+      The same happens after reconnecting, since notifications sent in the meantime are lost.
+    - start does nothing until at least one channel has been subscribed to.
+"""
+
+
+class ChangeListener:
+    def __init__(self, conn_params, poll_interval=1.0, retry_interval=5.0):
+        self.conn_params = conn_params
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._listening = set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._callbacks.setdefault(channel, []).append(callback)
+
+    def start(self):
+        if self.running or not self._channels():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="movievault-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # the first connection catches up on changes made before it, like a reconnect
+        reconnecting = True
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.conn_params)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                self._listening = set()
+                self._listen(conn)
+                if reconnecting:
+                    self._dispatch({channel: [ALL_ROWS] for channel in self._channels()})
+                reconnecting = False
+
+                while not self._stopping.is_set():
+                    self._listen(conn)
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    payloads = {}
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        payloads.setdefault(notify.channel, []).append(notify.payload)
+                    self._dispatch(payloads)
+            except (Exception, psycopg2.DatabaseError) as error:
+                reconnecting = True
+                self._stopping.wait(self.retry_interval)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _channels(self):
+        with self._lock:
+            return list(self._callbacks)
+
+    def _listen(self, conn):
+        channels = [channel for channel in self._channels() if channel not in self._listening]
+        if channels:
+            cursor = conn.cursor()
+            for channel in channels:
+                cursor.execute("LISTEN %s;" % channel)
+                self._listening.add(channel)
+            cursor.close()
+
+    def _dispatch(self, payloads):
+        for channel, channel_payloads in payloads.items():
+            with self._lock:
+                callbacks = list(self._callbacks.get(channel, ()))
+            for callback in callbacks:
+                callback(channel_payloads)
@@ -0,0 +1,40 @@
+import sys
+
+"""
+    Buffered writer for pipe separated command output.
+    - Lines are collected and written to the stream in one call every buffer_lines lines and on flush,
+      instead of one print call per row.
+    - The stream defaults to the sys.stdout in effect when the writer is created.
+"""
+
+
+class RowWriter:
+    def __init__(self, stream=None, buffer_lines=1000):
+        self.stream = stream if stream is not None else sys.stdout
+        self.buffer_lines = max(1, buffer_lines)
+        self.lines_written = 0
+        self._lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def write_line(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= self.buffer_lines:
+            self.flush()
+
+    def write_row(self, row):
+        self.write_line("|".join([str(column) for column in row]))
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self):
+        if self._lines:
+            self.stream.write("\n".join(self._lines) + "\n")
+            self.lines_written += len(self._lines)
+            self._lines = []
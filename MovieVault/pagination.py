@@ -0,0 +1,38 @@
+import base64
+import hashlib
+import json
+
+"""
+    Opaque continuation tokens for paginated searches.
+    - A token holds the movie id of the last movie on a page and a hash of the search text, base64 encoded.
+      The next page starts right after that movie id with a keyset seek on movies.movieId instead of OFFSET,
+      so every page costs the same to fetch.
+    - A token is only accepted for the search text it was issued for.
+"""
+
+
+def search_hash(search_text):
+    return hashlib.sha256(search_text.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_page_token(last_movie_id, search_text):
+    payload = json.dumps({"after": last_movie_id, "search": search_hash(search_text)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+"""
+    Returns the movie id a page token continues after. Raises ValueError if the token is malformed or was
+    issued for another search text.
+"""
+
+
+def decode_page_token(page_token, search_text):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(page_token + "=" * (-len(page_token) % 4)))
+        last_movie_id = payload["after"]
+        issued_for = payload["search"]
+    except (ValueError, KeyError, TypeError) as error:
+        raise ValueError('Malformed page token {0}'.format(page_token)) from error
+    if not isinstance(last_movie_id, str) or issued_for != search_hash(search_text):
+        raise ValueError('Page token {0} was not issued for this search'.format(page_token))
+    return last_movie_id
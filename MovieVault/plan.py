@@ -0,0 +1,25 @@
+"""
+    Subscription plan, built from a (planid, planname, resolution, maxparallelsessions, monthlyfee) row.
+    Iterating a plan yields its columns in that order, as printed by show_plans.
+"""
+
+
+class Plan:
+    __slots__ = ("plan_id", "name", "resolution", "max_parallel_sessions", "monthly_fee")
+
+    def __init__(self, plan_id, name, resolution, max_parallel_sessions, monthly_fee):
+        self.plan_id = plan_id
+        self.name = name
+        self.resolution = resolution
+        self.max_parallel_sessions = max_parallel_sessions
+        self.monthly_fee = monthly_fee
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def __iter__(self):
+        return iter((self.plan_id, self.name, self.resolution, self.max_parallel_sessions, self.monthly_fee))
+
+    def __repr__(self):
+        return 'Plan(%r, %r, %r, %r, %r)' % tuple(self)
@@ -0,0 +1,128 @@
+import threading
+import time
+
+from config import get_float
+from notifications import install_notify_trigger
+from plan import Plan
+import queries
+from rows import rows_as
+
+PLANS_CHANNEL = "plans_changed"
+
+"""
+    In-process copy of the plans table.
+    - The whole table is loaded on the first lookup and served from memory afterwards.
+    - With "notify" invalidation, a trigger on plans notifies the client, which drops the cache on any change.
+      A load that overlaps an invalidation returns what it read but does not store it, since it may predate
+      the change.
+    - The cache is also dropped ttl seconds after it was loaded, in case a notification was missed
+      or "ttl" invalidation is used.
+    - Looking up an unknown plan id reloads the table once, so plans added moments ago are found.
+    - hits counts lookups served from memory, misses counts lookups that had to load the table.
+"""
+
+
+class PlanCache:
+    def __init__(self, invalidation="notify", ttl=300.0):
+        self.invalidation = invalidation
+        self.ttl = ttl
+        self.pool = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._plans = None
+        self._loaded_at = 0.0
+        self._generation = 0
+
+    """
+        Builds a plan cache from the [plans] section of the configuration file.
+    """
+
+    @classmethod
+    def from_config(cls, plan_params):
+        invalidation = plan_params.get("invalidation", "notify").strip().lower()
+        if invalidation not in ("notify", "ttl"):
+            raise Exception('Unknown plan cache invalidation {0}'.format(invalidation))
+        return cls(invalidation=invalidation, ttl=get_float(plan_params, "ttl", 300.0))
+
+    def install(self, cursor):
+        if self.invalidation == "notify":
+            install_notify_trigger(cursor, "plans", PLANS_CHANNEL, "planid")
+
+    def start(self, pool, listener):
+        self.pool = pool
+        if self.invalidation == "notify":
+            listener.subscribe(PLANS_CHANNEL, self._on_plans_changed)
+
+    def stop(self):
+        self.invalidate()
+
+    """
+        Returns the Plan with the given id, or None if there is no such plan. cursor is used if the table
+        has to be loaded.
+    """
+
+    def get(self, plan_id, cursor=None):
+        plan_id = int(plan_id)
+        plans = self._current(cursor)
+        if plan_id not in plans:
+            plans = self._load(cursor)
+        return plans.get(plan_id)
+
+    """
+        Returns every Plan ordered by plan id.
+    """
+
+    def all(self, cursor=None):
+        plans = self._current(cursor)
+        return [plans[plan_id] for plan_id in sorted(plans)]
+
+    def invalidate(self):
+        with self._lock:
+            self._plans = None
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "plans": len(self._plans) if self._plans is not None else 0,
+            }
+
+    def _current(self, cursor):
+        with self._lock:
+            if self._plans is not None and time.monotonic() - self._loaded_at < self.ttl:
+                self.hits += 1
+                return self._plans
+        return self._load(cursor)
+
+    def _load(self, cursor):
+        with self._lock:
+            generation = self._generation
+        if cursor is None:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = Plan.from_row
+                cursor.execute(queries.ALL_PLANS)
+                plan_records = cursor.fetchall()
+                cursor.close()
+                conn.commit()
+        else:
+            with rows_as(cursor, Plan.from_row):
+                cursor.execute(queries.ALL_PLANS)
+                plan_records = cursor.fetchall()
+
+        plans = {plan.plan_id: plan for plan in plan_records}
+        with self._lock:
+            self.misses += 1
+            if generation == self._generation:
+                self._plans = plans
+                self._loaded_at = time.monotonic()
+        return plans
+
+    def _on_plans_changed(self, payloads):
+        self.invalidate()
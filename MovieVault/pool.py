@@ -0,0 +1,234 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import PoolError
+
+from config import get_bool, get_float, get_int
+
+"""
+    Thread-safe pool of reusable PostgreSQL connections.
+    - Connections are opened lazily up to max_size and handed out most-recently-used first.
+    - At least min_idle connections are kept open once the pool is opened.
+    - Connections older than max_lifetime seconds are closed when they are returned or checked out.
+    - If health_check is enabled, connections idle for longer than health_check_idle seconds are pinged before reuse.
+    - hits, misses, waits and wait_time count reused connections, newly opened connections,
+      checkouts that had to wait for a free connection and the total seconds spent waiting.
+"""
+
+
+class ConnectionPool:
+    def __init__(self, conn_params, max_size=10, min_idle=1, max_lifetime=3600.0, health_check=True,
+                 health_check_idle=30.0, timeout=30.0):
+        self.conn_params = conn_params
+        self.max_size = max(1, max_size)
+        self.min_idle = min(max(0, min_idle), self.max_size)
+        self.max_lifetime = max_lifetime
+        self.health_check = health_check
+        self.health_check_idle = health_check_idle
+        self.timeout = timeout
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._created = {}
+        self._size = 0
+        self._closed = True
+
+    """
+        Builds a pool from the [pool] section of the configuration file.
+    """
+
+    @classmethod
+    def from_config(cls, conn_params, pool_params):
+        return cls(conn_params,
+                   max_size=get_int(pool_params, "maxsize", 10),
+                   min_idle=get_int(pool_params, "minidle", 1),
+                   max_lifetime=get_float(pool_params, "maxlifetime", 3600.0),
+                   health_check=get_bool(pool_params, "healthcheck", True),
+                   health_check_idle=get_float(pool_params, "healthcheckidle", 30.0),
+                   timeout=get_float(pool_params, "timeout", 30.0))
+
+    @property
+    def closed(self):
+        return self._closed
+
+    """
+        Opens the pool and fills it up to min_idle connections.
+    """
+
+    def open(self):
+        with self._cond:
+            if not self._closed:
+                return
+            self._closed = False
+
+        while True:
+            with self._cond:
+                if len(self._idle) >= self.min_idle or self._size >= self.max_size:
+                    return
+                self._size += 1
+            conn = self._open_connection()
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    """
+        Closes every idle connection; connections in use are closed when they are returned.
+    """
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+
+        for conn, _ in idle:
+            self._discard(conn)
+
+    """
+        Checks out a connection, waiting up to timeout seconds if every connection is in use.
+        Raises PoolError if the pool is closed or no connection becomes available in time.
+    """
+
+    def getconn(self):
+        wait_started = None
+
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("connection pool is closed")
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        conn = None
+                        break
+
+                    if wait_started is None:
+                        wait_started = time.monotonic()
+                        self.waits += 1
+                    remaining = self.timeout - (time.monotonic() - wait_started)
+                    if remaining <= 0:
+                        self.wait_time += time.monotonic() - wait_started
+                        raise PoolError("timed out waiting for a free connection")
+                    self._cond.wait(remaining)
+
+                if wait_started is not None:
+                    self.wait_time += time.monotonic() - wait_started
+                    wait_started = None
+
+            if conn is None:
+                with self._cond:
+                    self.misses += 1
+                return self._open_connection()
+
+            if self._usable(conn, returned_at):
+                with self._cond:
+                    self.hits += 1
+                return conn
+
+            self._discard(conn)
+
+    """
+        Returns a connection to the pool, rolling back any transaction it left open.
+        Broken, expired or surplus connections are closed instead.
+    """
+
+    def putconn(self, conn):
+        if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+
+        with self._cond:
+            reusable = not self._closed and not conn.closed and not self._expired(conn)
+            if reusable and conn.get_transaction_status() == TRANSACTION_STATUS_IDLE:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+
+        self._discard(conn)
+
+    """
+        Context manager that checks out a connection and always returns it to the pool.
+    """
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    """
+        Returns the pool counters as a dictionary.
+    """
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "wait_time": self.wait_time,
+            }
+
+    def _open_connection(self):
+        try:
+            conn = psycopg2.connect(**self.conn_params)
+            conn.autocommit = False
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._created[conn] = time.monotonic()
+        return conn
+
+    def _expired(self, conn):
+        created_at = self._created.get(conn)
+        return created_at is None or time.monotonic() - created_at > self.max_lifetime
+
+    def _usable(self, conn, returned_at):
+        if conn.closed or self._expired(conn):
+            return False
+        if not self.health_check or time.monotonic() - returned_at < self.health_check_idle:
+            return True
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("select 1;")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+        with self._cond:
+            self._created.pop(conn, None)
+            self._size -= 1
+            self._cond.notify()
@@ -0,0 +1,132 @@
+import re
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+
+import queries
+
+"""
+    Registry of hot statements that are prepared on the server once per pooled connection and then
+    run with EXECUTE, so PostgreSQL parses them once and can reuse their plans.
+    - A statement is prepared on a connection the first time it runs there. Connections opened after a
+      reconnect start with nothing prepared and prepare again.
+    - Only connections of the PreparedConnection class, which the pool uses if prepared statements are
+      enabled, keep track of their statements; on any other connection execute() runs the plain SQL.
+    - If the server no longer knows a statement (DISCARD ALL, a connection pooler in front of PostgreSQL)
+      outside of a transaction, it is prepared again and the call retried. Inside a transaction the error
+      is raised once and the statement is prepared again by the next call.
+    - Statements read through named cursors (search_for_movies) cannot be prepared, since PostgreSQL does
+      not declare cursors over EXECUTE.
+"""
+
+PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+REGISTRY = {}
+
+# EXECUTE text -> statement, so observers of executed queries can show the SQL behind an EXECUTE
+BY_EXECUTE_SQL = {}
+
+
+class PreparedStatement:
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.prepare_sql, self.execute_sql = self._translate(name, sql)
+
+    """
+        Returns the PREPARE statement, with the driver placeholders turned into $n parameters, and the
+        EXECUTE statement that takes the same parameters as sql.
+    """
+
+    @staticmethod
+    def _translate(name, sql):
+        positions = {}
+        arguments = []
+
+        def replace(match):
+            if match.group(0) == "%%":
+                return "%"
+            key = match.group(1)
+            if key is None:
+                arguments.append("%s")
+                return "$%d" % len(arguments)
+            if key not in positions:
+                arguments.append("%%(%s)s" % key)
+                positions[key] = len(arguments)
+            return "$%d" % positions[key]
+
+        body = PLACEHOLDER.sub(replace, sql).strip().rstrip(";")
+        prepare_sql = "prepare %s as %s;" % (name, body)
+        execute_sql = "execute %s (%s);" % (name, ", ".join(arguments)) if arguments else "execute %s;" % name
+        return prepare_sql, execute_sql
+
+
+"""
+    Connection that remembers the names of the statements prepared on it.
+"""
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+"""
+    Adds a statement to the registry and returns it.
+"""
+
+
+def register(name, sql):
+    statement = PreparedStatement(name, sql)
+    REGISTRY[name] = statement
+    BY_EXECUTE_SQL[statement.execute_sql] = statement
+    return statement
+
+
+"""
+    Runs the statement on cursor with params, preparing it on the cursor's connection first if needed.
+"""
+
+
+def execute(cursor, statement, params=None):
+    conn = cursor.connection
+    prepared_statements = getattr(conn, "prepared_statements", None)
+    if prepared_statements is None:
+        return cursor.execute(statement.sql, params)
+
+    idle = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    if statement.name not in prepared_statements:
+        cursor.execute(statement.prepare_sql)
+        prepared_statements.add(statement.name)
+    try:
+        return cursor.execute(statement.execute_sql, params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        prepared_statements.clear()
+        if not idle:
+            raise
+        # nothing but the failed call ran in this transaction
+        conn.rollback()
+        cursor.execute(statement.prepare_sql)
+        prepared_statements.add(statement.name)
+        return cursor.execute(statement.execute_sql, params)
+
+
+CHECK_CUSTOMER = register("mp2_check_customer", queries.CHECK_CUSTOMER)
+
+SIGN_IN_LEASE = register("mp2_sign_in_lease", queries.SIGN_IN_LEASE)
+
+SIGN_OUT_LEASE = register("mp2_sign_out_lease", queries.SIGN_OUT_LEASE)
+
+SUBSCRIBE_CUSTOMER = register("mp2_subscribe_customer", queries.SUBSCRIBE_CUSTOMER)
+
+WATCH_MOVIES = register("mp2_watch_movies", queries.WATCH_MOVIES)
+
+COUNT_KNOWN_MOVIES = register("mp2_count_known_movies", queries.COUNT_KNOWN_MOVIES)
+
+WATCHED_SET = register("mp2_watched_set", queries.WATCHED_SET)
+
+SUGGEST_MOVIES = register("mp2_suggest_movies", queries.SUGGEST_MOVIES)
+
+COWATCH_SUGGESTIONS = register("mp2_cowatch_suggestions", queries.COWATCH_SUGGESTIONS)
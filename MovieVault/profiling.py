@@ -0,0 +1,110 @@
+import logging
+import logging.handlers
+import random
+import time
+
+import psycopg2.extensions
+
+from config import get_bool, get_float, get_int
+import prepared
+
+"""
+    Slow-query log: statements that take longer than threshold seconds are written to a rotating log file,
+    with their exact text after parameter binding and, if explain is set, the plan PostgreSQL chose
+    for them from EXPLAIN (ANALYZE, BUFFERS).
+    - Only a sample_rate fraction of the slow statements is logged, so a burst of slow statements
+      does not double the load on the database.
+    - EXPLAIN ANALYZE runs the statement a second time on the same connection, inside a savepoint that is
+      rolled back, so changes made by insert, update and delete statements are undone. Sequence values it
+      consumes are not given back.
+    - Statements read through a named (server-side) cursor are timed until their last row is read.
+    - A prepared statement is logged as the SQL it was prepared from, bound to its parameters, followed by
+      the EXECUTE that ran it. EXPLAIN runs the EXECUTE, which shows the plan the prepared statement used.
+    - Statements are observed by the instrumented cursors of metrics.MetricsRecorder.
+"""
+
+LOGGER_NAME = "movievault.slow_queries"
+
+
+class SlowQueryLog:
+    def __init__(self, path="slow_queries.log", threshold=0.2, sample_rate=1.0, explain=True,
+                 max_bytes=10485760, backup_count=5):
+        self.path = path
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.explain = explain
+        self.logged = 0
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.setLevel(logging.INFO)
+        # slow queries only go to the slow-query file
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+
+    """
+        Builds a slow-query log from the [profiling] section of the configuration file.
+        Returns None if profiling is not enabled.
+    """
+
+    @classmethod
+    def from_config(cls, profiling_params):
+        if not get_bool(profiling_params, "enabled", False):
+            return None
+        return cls(path=profiling_params.get("logfile", "slow_queries.log"),
+                   threshold=get_float(profiling_params, "thresholdms", 200.0) / 1000,
+                   sample_rate=get_float(profiling_params, "samplerate", 1.0),
+                   explain=get_bool(profiling_params, "explain", True),
+                   max_bytes=get_int(profiling_params, "maxbytes", 10485760),
+                   backup_count=get_int(profiling_params, "backupcount", 5))
+
+    """
+        Logs the statement cursor just ran if it took at least threshold seconds and is sampled.
+    """
+
+    def observe(self, cursor, query, vars, seconds, command=None):
+        if seconds < self.threshold or random.random() >= self.sample_rate:
+            return
+
+        statement = self._bind(cursor, query, vars)
+        lines = ["slow statement: %.1f ms, command %s" % (seconds * 1000, command or "-")]
+        prepared_statement = prepared.BY_EXECUTE_SQL.get(query)
+        if prepared_statement is not None:
+            lines.append(self._bind(cursor, prepared_statement.sql, vars).strip())
+            lines.append("-- run as: " + statement.strip())
+        else:
+            lines.append(statement.strip())
+        if self.explain:
+            lines.extend(self._explain(cursor.connection, statement))
+        self.logger.info("\n".join(lines) + "\n")
+        self.logged += 1
+
+    @staticmethod
+    def _bind(cursor, query, vars):
+        try:
+            return cursor.mogrify(query, vars).decode(errors="replace")
+        except Exception:
+            return "%s\n-- parameters: %r" % (query, vars)
+
+    def _explain(self, conn, statement):
+        if conn.autocommit:
+            return ["-- not explained: connection is in autocommit mode"]
+        if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return ["-- not explained: transaction is aborted"]
+
+        # a plain cursor, so the explained statement is neither counted nor observed again
+        cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        started = time.perf_counter()
+        try:
+            cursor.execute("savepoint mp2_explain;")
+            try:
+                cursor.execute("explain (analyze, buffers) " + statement.strip().rstrip(";"))
+                plan = ["    " + row[0] for row in cursor.fetchall()]
+            except Exception as error:
+                plan = ["-- not explained: %s: %s" % (type(error).__name__, str(error).strip())]
+            cursor.execute("rollback to savepoint mp2_explain; release savepoint mp2_explain;")
+        finally:
+            cursor.close()
+        plan.append("-- explained in %.1f ms" % ((time.perf_counter() - started) * 1000))
+        return plan
@@ -0,0 +1,224 @@
+"""
+    SQL statements shared by Mp2Client and AsyncMp2Client.
+    Parameters use the %s / %(name)s placeholders understood by both psycopg2 and psycopg 3.
+"""
+
+CHECK_CUSTOMER = "select c.customerid from customers c where c.email = %s;"
+
+SIGN_UP_CUSTOMER = "insert into customers (email, password, firstname, lastname, sessioncount, planid) values (%s,%s,%s,%s,%s,%s);"
+
+# checks the plan limit, increments sessioncount and takes a session lease in one statement.
+# returns no row for wrong credentials and a null session id if every session is in use.
+# concurrent sign-ins of one customer wait for the row lock and re-check the limit on the updated row.
+SIGN_IN_LEASE = """
+    with customer as (
+        select c.customerid, c.email, c.firstname, c.lastname, c.planid from customers c
+        where c.email = %(email)s and c.password = %(password)s
+    ),
+    claimed as (
+        update customers c set sessioncount = c.sessioncount + 1
+        from customer cu, plans p
+        where c.customerid = cu.customerid and p.planid = c.planid and c.sessioncount < p.maxparallelsessions
+        returning c.customerid, c.sessioncount
+    ),
+    lease as (
+        insert into customer_sessions (customerid, expiresat)
+        select cl.customerid, now() + %(lease_seconds)s::float8 * interval '1 second' from claimed cl
+        returning sessionid, customerid
+    )
+    select cu.customerid, cu.email, cu.firstname, cu.lastname, cl.sessioncount, cu.planid, l.sessionid
+    from customer cu
+        left join claimed cl on cl.customerid = cu.customerid
+        left join lease l on l.customerid = cu.customerid;"""
+
+# ends a session lease and gives the session back. a lease that was already reclaimed changes nothing.
+SIGN_OUT_LEASE = """
+    with ended as (
+        delete from customer_sessions s where s.sessionid = %s returning s.customerid
+    )
+    update customers c set sessioncount = greatest(c.sessioncount - 1, 0)
+    from ended e where c.customerid = e.customerid
+    returning c.sessioncount;"""
+
+RENEW_SESSION_LEASES = """
+    update customer_sessions s set heartbeatat = now(), expiresat = now() + %s::float8 * interval '1 second'
+    where s.sessionid = any(%s) and s.expiresat >= now()
+    returning s.sessionid;"""
+
+# reclaims the leases of sessions that stopped sending heartbeats, e.g. of a crashed process
+REAP_EXPIRED_SESSIONS = """
+    with expired as (
+        delete from customer_sessions s where s.expiresat < now() returning s.customerid
+    ),
+    counts as (
+        select e.customerid, count(*) as sessions from expired e group by e.customerid
+    ),
+    released as (
+        update customers c set sessioncount = greatest(c.sessioncount - counts.sessions, 0)
+        from counts where c.customerid = counts.customerid
+        returning c.customerid
+    )
+    select count(*) from expired;"""
+
+PLAN = "select p.planid, p.planname, p.resolution, p.maxparallelsessions, p.monthlyfee from plans p where p.planid = %s;"
+
+ALL_PLANS = "select p.planid, p.planname, p.resolution, p.maxparallelsessions, p.monthlyfee from plans p;"
+
+SUBSCRIBE_CUSTOMER = "update customers c set planid = %s where c.customerid = %s"
+
+# validates a whole chunk and inserts only the missing customer-movie pairs in one round trip.
+# nothing is inserted if the returned unknown id count is not zero. the inserted pair count comes second,
+# then the customer's new watchedversion, which is incremented only if pairs were inserted (null otherwise).
+WATCH_MOVIES = """
+    with ids as (select distinct unnest(%s::text[]) as movieid),
+    known as (select m.movieid from movies m, ids i where m.movieid = i.movieid),
+    inserted as (
+        insert into watched (customerid, movieid)
+        select %s::int, k.movieid from known k
+        where (select count(*) from known) = (select count(*) from ids)
+        on conflict do nothing
+        returning movieid
+    ),
+    bumped as (
+        update customers c set watchedversion = c.watchedversion + 1
+        where c.customerid = %s and exists (select 1 from inserted)
+        returning c.watchedversion
+    )
+    select (select count(*) from ids) - (select count(*) from known), (select count(*) from inserted),
+        (select b.watchedversion from bumped b);"""
+
+# validates movie ids for the write-behind watch queue: the number of distinct ids that are known movies
+COUNT_KNOWN_MOVIES = "select count(*) from movies m where m.movieid = any(%s::text[]);"
+
+# writes one batch of the write-behind watch queue as a multi-row insert of (customer id, movie id) arrays.
+# pairs of customers or movies deleted since they were queued, and pairs that already exist, are skipped.
+# every customer with inserted pairs gets a new watchedversion. returns the inserted pair count.
+WATCH_BATCH = """
+    with pairs as (
+        select p.customerid, p.movieid from unnest(%s::int[], %s::text[]) as p(customerid, movieid)
+        where exists (select 1 from movies m where m.movieid = p.movieid)
+            and exists (select 1 from customers c where c.customerid = p.customerid)
+    ),
+    inserted as (
+        insert into watched (customerid, movieid)
+        select p.customerid, p.movieid from pairs p
+        on conflict do nothing
+        returning customerid
+    ),
+    bumped as (
+        update customers c set watchedversion = c.watchedversion + 1
+        where c.customerid in (select i.customerid from inserted i)
+        returning c.customerid
+    )
+    select count(*) from inserted;"""
+
+# wal position of the primary after a customer's write; reads of the customer wait for replicas to replay it
+CURRENT_WAL_LSN = "select pg_current_wal_lsn()::text;"
+
+# wal position a replica has replayed. a server that is not in recovery reports its own position,
+# so a replica section may also point at the primary itself.
+REPLAYED_WAL_LSN = """
+    select case when pg_is_in_recovery() then pg_last_wal_replay_lsn() else pg_current_wal_lsn() end::text;"""
+
+# counts the changes to a customer's watched rows, so sessions can tell whether their watched set is current
+WATCHED_VERSION_DDL = "alter table customers add column if not exists watchedVersion bigint not null default 0;"
+
+# returns the customer's watchedversion, and the watched movie ids only if it differs from the given version
+WATCHED_SET = """
+    select c.watchedversion,
+        case when c.watchedversion is distinct from %(version)s::bigint
+            then array(select w.movieid from watched w where w.customerid = c.customerid) end
+    from customers c where c.customerid = %(customer_id)s;"""
+
+# the watched flag is computed by the search query itself instead of one lookup per movie.
+# {match} is the condition returned by the search engine.
+SEARCH_MOVIES = """
+    select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes,
+        case when exists (select 1 from watched w where w.customerid = %s and w.movieid = m.movieid)
+            then 1 else 0 end
+    from movies m where {match} order by m.movieid;"""
+
+# the customer-independent part of a search; Mp2Client adds the watched flag from the customer's watched set
+SEARCH_MOVIE_ROWS = """
+    select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes
+    from movies m where {match} order by m.movieid;"""
+
+# one page of search results: a keyset seek past the last movie id of the previous page ('' for the first page).
+# the limit is one more than the page size; the extra row only tells whether another page follows.
+SEARCH_MOVIES_PAGE = """
+    select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes,
+        case when exists (select 1 from watched w where w.customerid = %s and w.movieid = m.movieid)
+            then 1 else 0 end
+    from movies m where {match} and m.movieid > %s order by m.movieid limit %s;"""
+
+# the same page without the watched flag, which Mp2Client adds from the customer's watched set
+SEARCH_MOVIE_ROWS_PAGE = """
+    select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes
+    from movies m where {match} and m.movieid > %s order by m.movieid limit %s;"""
+
+# all three suggestion steps in one statement; union removes the movies found by more than one step.
+# watched_movie_ids passes the customer's watched movies as one array; if it is null they are read from watched.
+SUGGEST_MOVIES = """
+    with watched_movies as (
+        select w.movieid from watched w
+        where %(watched_movie_ids)s::text[] is null and w.customerid = %(customer_id)s
+        union all
+        select unnest(%(watched_movie_ids)s::text[])
+    ),
+    customer_genres as (
+        select distinct g.genre from watched_movies w, genres g where g.movieid = w.movieid
+    ),
+    step1 as (
+        select distinct on (g.genre) m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes
+        from customer_genres cg, genres g, movies m
+        where g.genre = cg.genre and m.movieid = g.movieid
+            and m.movieid not in (select movieid from watched_movies)
+        order by g.genre, m.numvotes desc
+    ),
+    step2 as (
+        select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes
+        from movies m
+        where m.startyear >= 2010 and m.movieid not in (select movieid from watched_movies)
+        order by m.numvotes desc, m.averagerating desc limit 10
+    ),
+    step3 as (
+        select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes
+        from movies m
+        where m.numvotes > (select avg(wm.numvotes) from watched_movies w, movies wm where wm.movieid = w.movieid)
+            and m.movieid not in (select movieid from watched_movies)
+        order by m.numvotes desc limit 10
+    )
+    select * from step1 union select * from step2 union select * from step3;"""
+
+# empty until cowatch.py has run; the job replaces the whole table
+MOVIE_NEIGHBORS_DDL = """
+    create table if not exists movie_neighbors (
+        movieId text,
+        neighborIds text[] not null,
+        scores real[] not null,
+        primary key (movieId)
+    );"""
+
+# "because you watched": merges the precomputed co-watch neighbours of the customer's watched movies.
+# reads one movie_neighbors row per watched movie, so the cost does not grow with the catalogue.
+# watched_movie_ids works as in SUGGEST_MOVIES.
+COWATCH_SUGGESTIONS = """
+    with watched_movies as (
+        select w.movieid from watched w
+        where %(watched_movie_ids)s::text[] is null and w.customerid = %(customer_id)s
+        union all
+        select unnest(%(watched_movie_ids)s::text[])
+    ),
+    candidates as (
+        select n.neighborid, sum(n.score) as score
+        from watched_movies w
+            join movie_neighbors mn on mn.movieid = w.movieid
+            cross join unnest(mn.neighborids, mn.scores) as n(neighborid, score)
+        where n.neighborid not in (select movieid from watched_movies)
+        group by n.neighborid
+        order by score desc, n.neighborid
+        limit %(limit)s
+    )
+    select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes
+    from candidates c join movies m on m.movieid = c.neighborid
+    order by c.score desc, m.movieid;"""
@@ -0,0 +1,181 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from config import get_float, read_config_sections
+from pool import ConnectionPool
+import queries
+
+"""
+    Read/write splitting across the primary and its read replicas.
+    - Every [replica.<name>] section of the configuration file describes one hot standby of the [postgresql]
+      primary. Its options override those of [postgresql], so a section may only set host and port.
+      Each replica gets a connection pool configured by the [pool] section.
+    - Mp2Client runs read-only commands on a replica picked by round_robin or least_loaded (fewest connections
+      in use) selection, and every other command on the primary.
+    - Reads follow the customer's own writes: after a write commits, Mp2Client stores the primary's WAL position
+      on the customer. A replica serves the customer's reads only once it has replayed that position, otherwise
+      the read goes to the primary. The replayed position of every replica is cached, so a replica is only asked
+      while it is behind a write it has to serve.
+    - A replica that cannot be reached is left out for retry_interval seconds.
+"""
+
+
+# write_lsn that no replica reaches
+READ_FROM_PRIMARY = 1 << 64
+
+
+"""
+    Converts a textual WAL position such as "16/B374D848" into a comparable integer.
+"""
+
+
+def parse_lsn(lsn):
+    if not lsn:
+        return 0
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+class Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.replayed_lsn = 0
+        self.down_until = 0.0
+        self.reads = 0
+
+
+class ReplicaRouter:
+    def __init__(self, primary_pool, replicas, selection="round_robin", retry_interval=30.0):
+        self.primary_pool = primary_pool
+        self.replicas = replicas
+        self.selection = selection
+        self.retry_interval = retry_interval
+        self.primary_reads = 0
+        self.lag_fallbacks = 0
+        self.unavailable_fallbacks = 0
+        self._lock = threading.Lock()
+        self._next = 0
+
+    """
+        Builds a router from the [replica.<name>] and [routing] sections of the configuration file, or returns
+        None if no replica is configured. conn_params are the connection parameters of the primary's pool.
+    """
+
+    @classmethod
+    def from_config(cls, config_filename, primary_pool, conn_params, pool_params, routing_params):
+        replicas = []
+        for section, replica_params in read_config_sections(filename=config_filename, prefix="replica.").items():
+            replica_conn_params = dict(conn_params)
+            replica_conn_params.update(replica_params)
+            replicas.append(Replica(section[len("replica."):],
+                                    ConnectionPool.from_config(replica_conn_params, pool_params)))
+        if not replicas:
+            return None
+
+        selection = routing_params.get("selection", "round_robin").strip().lower()
+        if selection not in ("round_robin", "least_loaded"):
+            raise Exception('Unknown replica selection {0}'.format(selection))
+        return cls(primary_pool, replicas, selection=selection,
+                   retry_interval=get_float(routing_params, "retryinterval", 30.0))
+
+    def open(self):
+        for replica in self.replicas:
+            try:
+                replica.pool.open()
+            except Exception:
+                # connections are opened again on demand once the replica is back
+                self._mark_down(replica)
+
+    def close(self):
+        for replica in self.replicas:
+            replica.pool.close()
+
+    """
+        Checks out a connection for a read of a customer whose last write is at WAL position min_lsn (0 if the
+        customer has not written): a replica connection if the picked replica is reachable and has replayed
+        min_lsn, a primary connection otherwise.
+    """
+
+    @contextmanager
+    def connection(self, min_lsn=0):
+        replica = self._pick()
+        if replica is not None:
+            conn = caught_up = None
+            try:
+                conn = replica.pool.getconn()
+                caught_up = self._caught_up(replica, conn, min_lsn)
+            except Exception:
+                self._mark_down(replica)
+            if caught_up:
+                with self._lock:
+                    replica.reads += 1
+                try:
+                    yield conn
+                finally:
+                    replica.pool.putconn(conn)
+                return
+            if conn is not None:
+                replica.pool.putconn(conn)
+            with self._lock:
+                if caught_up is None:
+                    self.unavailable_fallbacks += 1
+                else:
+                    self.lag_fallbacks += 1
+
+        with self._lock:
+            self.primary_reads += 1
+        with self.primary_pool.connection() as conn:
+            yield conn
+
+    """
+        Returns the WAL position of the primary after a write committed on conn.
+    """
+
+    @staticmethod
+    def current_lsn(conn):
+        cursor = conn.cursor()
+        cursor.execute(queries.CURRENT_WAL_LSN)
+        lsn = parse_lsn(cursor.fetchone()[0])
+        cursor.close()
+        conn.commit()
+        return lsn
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "primary_reads": self.primary_reads,
+                "lag_fallbacks": self.lag_fallbacks,
+                "unavailable_fallbacks": self.unavailable_fallbacks,
+            }
+            for replica in self.replicas:
+                stats["replica_" + replica.name + "_reads"] = replica.reads
+                stats["replica_" + replica.name + "_in_use"] = replica.pool.stats()["in_use"]
+            return stats
+
+    def _pick(self):
+        now = time.monotonic()
+        with self._lock:
+            available = [replica for replica in self.replicas if replica.down_until <= now]
+            if not available:
+                return None
+            if self.selection == "least_loaded":
+                return min(available, key=lambda replica: replica.pool.stats()["in_use"])
+            self._next += 1
+            return available[self._next % len(available)]
+
+    def _caught_up(self, replica, conn, min_lsn):
+        if replica.replayed_lsn >= min_lsn:
+            return True
+        cursor = conn.cursor()
+        cursor.execute(queries.REPLAYED_WAL_LSN)
+        replayed_lsn = parse_lsn(cursor.fetchone()[0])
+        cursor.close()
+        with self._lock:
+            replica.replayed_lsn = max(replica.replayed_lsn, replayed_lsn)
+        return replayed_lsn >= min_lsn
+
+    def _mark_down(self, replica):
+        with self._lock:
+            replica.down_until = time.monotonic() + self.retry_interval
@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+
+import psycopg2.extensions
+
+"""
+    Cursor class of the pooled connections that builds model objects (Customer, Plan, Movie) from result rows.
+    - If row_factory is set, every fetched row is passed to it and the result is returned instead of the
+      tuple. Rows are converted as they are fetched, so the tuples of a large result set are not kept.
+    - A new cursor returns plain tuples. Use rows_as to set the factory on a cursor that is shared with
+      other statements.
+"""
+
+
+class RowFactoryCursor(psycopg2.extensions.cursor):
+    row_factory = None
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is None or self.row_factory is None:
+            return row
+        return self.row_factory(row)
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self.row_factory is None:
+            return rows
+        return [self.row_factory(row) for row in rows]
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self.row_factory is None:
+            return rows
+        return [self.row_factory(row) for row in rows]
+
+    def __iter__(self):
+        while True:
+            try:
+                row = psycopg2.extensions.cursor.__next__(self)
+            except StopIteration:
+                return
+            yield row if self.row_factory is None else self.row_factory(row)
+
+
+"""
+    Builds the rows fetched from cursor with factory inside the block, and plain tuples again afterwards.
+"""
+
+
+@contextmanager
+def rows_as(cursor, factory):
+    previous = cursor.row_factory
+    cursor.row_factory = factory
+    try:
+        yield cursor
+    finally:
+        cursor.row_factory = previous
@@ -0,0 +1,271 @@
+import re
+import threading
+
+from config import get_bool, get_int
+from notifications import ALL_ROWS, install_notify_trigger
+
+MOVIES_CHANNEL = "movies_changed"
+
+"""
+    Search engines decide which movies match a search_for_movies text.
+    - match_clause returns a SQL condition on "movies m" and its parameters. It selects exactly the rows
+      "m.originaltitle ILIKE '%' || search_text || '%'" selects, so callers can combine it with
+      other columns, ordering and limits.
+    - install runs the engine's idempotent DDL. migrate.py runs it once per deployment, never the client.
+    - start loads in-process state and subscribes to change notifications; stop releases it.
+"""
+
+
+class SearchEngine:
+    name = None
+
+    def install(self, cursor):
+        pass
+
+    def start(self, pool, listener):
+        pass
+
+    def stop(self):
+        pass
+
+    def match_clause(self, search_text):
+        raise NotImplementedError
+
+
+"""
+    The original full scan of movies with ILIKE.
+"""
+
+
+class ScanSearchEngine(SearchEngine):
+    name = "scan"
+
+    def match_clause(self, search_text):
+        return "m.originaltitle ILIKE %s", ('%' + search_text + '%',)
+
+
+"""
+    ILIKE backed by a pg_trgm GIN index on movies.originalTitle, which PostgreSQL uses for unanchored patterns.
+    If managed is false, the extension and index are expected to be created by the database administrator.
+"""
+
+
+class TrigramSearchEngine(ScanSearchEngine):
+    name = "trigram"
+
+    def __init__(self, managed=True):
+        self.managed = managed
+
+    def install(self, cursor):
+        if self.managed:
+            cursor.execute("create extension if not exists pg_trgm;")
+            cursor.execute("create index if not exists movies_originaltitle_trgm_idx "
+                           "on movies using gin (originaltitle gin_trgm_ops);")
+
+
+"""
+    In-process n-gram inverted index over lower-cased movie titles.
+    - Built from the movies table when the client starts.
+    - Kept up to date through notifications sent by a trigger on movies.
+    - Candidates are the intersection of the posting lists of every n-gram of the literal parts of the
+      search text; each candidate is then checked against the full ILIKE pattern, so '%', '_' and '\\' in
+      the search text keep their ILIKE meaning.
+    - The matching movie ids are sent to the database as one array. A search matching more than
+      max_candidates movies falls back to the ILIKE condition, which then reads about as many rows anyway.
+    - python -m benchmarks.search_equivalence checks that it matches the same movies as the scan engine.
+"""
+
+
+class NgramSearchEngine(SearchEngine):
+    name = "ngram"
+
+    def __init__(self, gram_size=3, batch_size=10000, max_candidates=10000):
+        self.gram_size = gram_size
+        self.batch_size = batch_size
+        self.max_candidates = max_candidates
+        self.fallbacks = 0
+        self.pool = None
+        self._lock = threading.RLock()
+        self._movie_ids = []
+        self._movie_index = {}
+        self._titles = []
+        self._postings = {}
+
+    def install(self, cursor):
+        install_notify_trigger(cursor, "movies", MOVIES_CHANNEL, "movieid")
+
+    def start(self, pool, listener):
+        self.pool = pool
+        self.rebuild()
+        listener.subscribe(MOVIES_CHANNEL, self._on_movies_changed)
+
+    def stop(self):
+        with self._lock:
+            self._movie_ids = []
+            self._movie_index = {}
+            self._titles = []
+            self._postings = {}
+
+    """
+        Rebuilds the whole index from the movies table.
+    """
+
+    def rebuild(self):
+        movie_ids = []
+        movie_index = {}
+        titles = []
+        postings = {}
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(name="ngram_index_build")
+            cursor.itersize = self.batch_size
+            cursor.execute("select m.movieid, m.originaltitle from movies m;")
+            for movie_id, title in cursor:
+                index = len(movie_ids)
+                movie_ids.append(movie_id)
+                movie_index[movie_id] = index
+                title = title.lower() if title is not None else None
+                titles.append(title)
+                for gram in self._grams(title):
+                    postings.setdefault(gram, set()).add(index)
+            cursor.close()
+            conn.commit()
+
+        with self._lock:
+            self._movie_ids = movie_ids
+            self._movie_index = movie_index
+            self._titles = titles
+            self._postings = postings
+
+    """
+        Re-reads the titles of the given movies, adding, updating or removing their index entries.
+    """
+
+    def refresh(self, movie_ids):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("select m.movieid, m.originaltitle from movies m where m.movieid = any(%s);",
+                           (list(movie_ids),))
+            current_titles = dict(cursor.fetchall())
+            cursor.close()
+            conn.commit()
+
+        with self._lock:
+            for movie_id in movie_ids:
+                title = current_titles.get(movie_id)
+                title = title.lower() if title is not None else None
+                index = self._movie_index.get(movie_id)
+                if index is None:
+                    if movie_id not in current_titles:
+                        continue
+                    index = len(self._movie_ids)
+                    self._movie_ids.append(movie_id)
+                    self._movie_index[movie_id] = index
+                    self._titles.append(None)
+
+                for gram in self._grams(self._titles[index]):
+                    self._postings[gram].discard(index)
+                self._titles[index] = title
+                for gram in self._grams(title):
+                    self._postings.setdefault(gram, set()).add(index)
+
+    """
+        Returns the ids of movies whose titles match search_text, in no particular order.
+    """
+
+    def search(self, search_text):
+        literals, pattern = parse_ilike_pattern('%' + search_text.lower() + '%')
+        grams = set()
+        for literal in literals:
+            grams.update(self._grams(literal))
+
+        with self._lock:
+            if grams:
+                posting_lists = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+                candidates = set(posting_lists[0])
+                for posting_list in posting_lists[1:]:
+                    candidates.intersection_update(posting_list)
+                    if not candidates:
+                        break
+            else:
+                candidates = range(len(self._titles))
+
+            titles = self._titles
+            return [self._movie_ids[index] for index in candidates
+                    if titles[index] is not None and pattern.fullmatch(titles[index])]
+
+    def match_clause(self, search_text):
+        movie_ids = self.search(search_text)
+        if len(movie_ids) > self.max_candidates:
+            self.fallbacks += 1
+            return ScanSearchEngine.match_clause(self, search_text)
+        return "m.movieid = any(%s)", (movie_ids,)
+
+    def _grams(self, text):
+        if not text:
+            return ()
+        size = self.gram_size
+        return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+    def _on_movies_changed(self, payloads):
+        if ALL_ROWS in payloads:
+            self.rebuild()
+        else:
+            self.refresh(set(payloads))
+
+
+"""
+    Translates an ILIKE pattern into a compiled regular expression that matches the same whole strings with
+    fullmatch. '\\' escapes the next character, including the '%' that search_for_movies appends, so a search
+    text ending in a backslash only matches titles ending in that text and '%', as with ILIKE.
+    Also returns the literal runs of the pattern, which every matching title must contain.
+    Raises ValueError if the pattern ends with the escape character, which PostgreSQL rejects.
+"""
+
+
+def parse_ilike_pattern(text):
+    literals = []
+    regex = []
+    literal = []
+    escaped = False
+
+    for char in text:
+        if escaped:
+            literal.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char in "%_":
+            if literal:
+                literals.append("".join(literal))
+                regex.append(re.escape(literals[-1]))
+                literal = []
+            regex.append(".*" if char == "%" else ".")
+        else:
+            literal.append(char)
+
+    if escaped:
+        raise ValueError("LIKE pattern must not end with escape character")
+    if literal:
+        literals.append("".join(literal))
+        regex.append(re.escape(literals[-1]))
+
+    return literals, re.compile("".join(regex), re.DOTALL)
+
+
+"""
+    Creates the search engine selected in the [search] section of the configuration file.
+"""
+
+
+def create_search_engine(search_params):
+    engine = search_params.get("engine", ScanSearchEngine.name).strip().lower()
+    if engine == ScanSearchEngine.name:
+        return ScanSearchEngine()
+    elif engine == TrigramSearchEngine.name:
+        return TrigramSearchEngine(managed=get_bool(search_params, "managed", True))
+    elif engine == NgramSearchEngine.name:
+        return NgramSearchEngine(gram_size=get_int(search_params, "gramsize", 3),
+                                 max_candidates=get_int(search_params, "maxcandidates", 10000))
+    else:
+        raise Exception('Unknown search engine {0}'.format(engine))
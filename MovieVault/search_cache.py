@@ -0,0 +1,148 @@
+import sys
+import threading
+from collections import OrderedDict
+
+from config import get_bool, get_int
+from notifications import install_notify_trigger
+from routing import READ_FROM_PRIMARY, ReplicaRouter
+from search import MOVIES_CHANNEL
+
+"""
+    Bounded LRU cache of search_for_movies results.
+    - Entries hold the customer-independent part of a result, the (movieid, originaltitle, startyear,
+      averagerating, numvotes) rows, keyed by the lower-cased search text, since ILIKE ignores case.
+      The watched flag is applied per customer on top of a cached result.
+    - The cache holds at most max_entries results and max_bytes of estimated row memory. The least recently
+      used results are evicted first. A result larger than a quarter of max_bytes is never cached.
+    - A trigger on movies notifies the client, which drops every entry on any change, since a changed or new
+      movie may belong to any result. Results read while an invalidation happens are not stored.
+    - With track_lsn set (read replicas are configured), every invalidation also records the primary's WAL
+      position as invalidated_lsn. Misses must be read from a server that has replayed it, otherwise a lagging
+      replica would store rows from before the change under the new generation.
+    - hits, misses, evictions and invalidations count since the client started; bytes is the current estimate.
+"""
+
+
+class SearchResultCache:
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024, track_lsn=False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 4
+        self.track_lsn = track_lsn
+        self.invalidated_lsn = 0
+        self.pool = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+
+    """
+        Builds a search cache from the [search] section of the configuration file, or returns None if it is disabled.
+    """
+
+    @classmethod
+    def from_config(cls, search_params, track_lsn=False):
+        if not get_bool(search_params, "cache", True):
+            return None
+        return cls(max_entries=get_int(search_params, "cacheentries", 1000),
+                   max_bytes=get_int(search_params, "cachemegabytes", 64) * 1024 * 1024,
+                   track_lsn=track_lsn)
+
+    def install(self, cursor):
+        install_notify_trigger(cursor, "movies", MOVIES_CHANNEL, "movieid")
+
+    def start(self, pool, listener):
+        self.pool = pool
+        listener.subscribe(MOVIES_CHANNEL, self._on_movies_changed)
+
+    def stop(self):
+        self.invalidate()
+
+    @staticmethod
+    def key(search_text):
+        return search_text.lower()
+
+    """
+        Returns the cached rows for search_text, or None. On a miss, also returns the generation that
+        put must be given, so results read during an invalidation are not stored.
+    """
+
+    def get(self, search_text):
+        key = self.key(search_text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, self._generation
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], self._generation
+
+    def put(self, search_text, rows, generation, size=None):
+        size = size if size is not None else sum(row_size(row) for row in rows)
+        if size > self.max_entry_bytes:
+            return False
+        key = self.key(search_text)
+        with self._lock:
+            if generation != self._generation:
+                return False
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (tuple(rows), size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def invalidate(self, lsn=0):
+        with self._lock:
+            # notifications arrive in commit order, so a later position replaces an earlier one
+            if lsn:
+                self.invalidated_lsn = lsn
+            self._entries.clear()
+            self._bytes = 0
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _on_movies_changed(self, payloads):
+        if not self.track_lsn:
+            self.invalidate()
+            return
+        # the notification arrives after the change committed, so the primary's position now is past it
+        try:
+            with self.pool.connection() as conn:
+                lsn = ReplicaRouter.current_lsn(conn)
+        except Exception:
+            # misses are read from the primary until the next invalidation records a position
+            lsn = READ_FROM_PRIMARY
+        self.invalidate(lsn)
+
+
+"""
+    Estimated memory of a cached row: the tuple and each of its values.
+"""
+
+
+def row_size(row):
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import io
+
+from async_mp2 import AsyncMp2Client
+from config import get_float, get_int, read_config
+from messages import CMD_EXECUTION_FAILED
+from mp2 import tokenize_command
+
+ANON_CUSTOMER = "ANONYMOUS"
+POSTGRESQL_CONFIG_FILE_NAME = "database.cfg"
+
+"""
+    Serves the command shell of main.py to many concurrent clients over TCP.
+    - Clients send one command per line, in the grammar main.py accepts. After each command the server
+      writes the command's output followed by the same "<customer> > " prompt main.py prints.
+    - Every connection has its own signed in customer; all connections share the AsyncMp2Client pool.
+    - At most max_connections clients are served at once; extra clients are told so and disconnected.
+    - At most max_in_flight commands run at once across all connections.
+    - Each connection queues at most max_pending unread commands. When the queue is full the server stops
+      reading from that client, and it waits for the client to read its output before running more commands.
+    - A connection that sends nothing for idle_timeout seconds is signed out and closed.
+"""
+
+
+class CommandServer:
+    def __init__(self, client, host="127.0.0.1", port=3520, max_connections=1000, max_in_flight=50,
+                 max_pending=16, max_line_length=1048576, idle_timeout=900.0):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.max_pending = max_pending
+        self.max_line_length = max_line_length
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self.commands = 0
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._server = None
+
+    """
+        Builds a server from the [server] section of the configuration file.
+    """
+
+    @classmethod
+    def from_config(cls, client, server_params):
+        return cls(client,
+                   host=server_params.get("host", "127.0.0.1"),
+                   port=get_int(server_params, "port", 3520),
+                   max_connections=get_int(server_params, "maxconnections", 1000),
+                   max_in_flight=get_int(server_params, "maxinflight", 50),
+                   max_pending=get_int(server_params, "maxpending", 16),
+                   max_line_length=get_int(server_params, "maxlinelength", 1048576),
+                   idle_timeout=get_float(server_params, "idletimeout", 900.0))
+
+    async def serve_forever(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  limit=self.max_line_length)
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        if self.connections >= self.max_connections:
+            writer.write(b"ERROR: Too many connections, try again later.\n")
+            await self._close(writer)
+            return
+
+        self.connections += 1
+        pending = asyncio.Queue(maxsize=self.max_pending)
+        reading = asyncio.ensure_future(self._read_commands(reader, pending))
+        auth_customer = None
+        try:
+            writer.write(self._prompt(auth_customer))
+            await writer.drain()
+
+            while True:
+                cmd_text = await pending.get()
+                if cmd_text is None:
+                    break
+
+                cmd_tokens = tokenize_command(cmd_text)
+                out = io.StringIO()
+                async with self._in_flight:
+                    try:
+                        auth_customer, status, message = await self.client.execute(auth_customer, cmd_tokens,
+                                                                                   out=out)
+                    except Exception:
+                        # a failing command is reported to its client instead of dropping the connection
+                        status = False
+                        out.write("ERROR: %s\n" % CMD_EXECUTION_FAILED)
+                self.commands += 1
+
+                if cmd_tokens[0] == "quit" and status:
+                    writer.write(out.getvalue().encode())
+                    await writer.drain()
+                    break
+
+                writer.write(out.getvalue().encode() + self._prompt(auth_customer))
+                # waits until the client has read enough of its output
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            reading.cancel()
+            if auth_customer:
+                await self.client.sign_out(customer=auth_customer)
+            self.connections -= 1
+            await self._close(writer)
+
+    async def _read_commands(self, reader, pending):
+        try:
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                if not line:
+                    break
+                # blocks while the connection has max_pending unprocessed commands
+                await pending.put(line.decode(errors="replace").rstrip("\r\n"))
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        await pending.put(None)
+
+    @staticmethod
+    def _prompt(customer):
+        return ("%s > " % (customer if customer else ANON_CUSTOMER)).encode()
+
+    @staticmethod
+    async def _close(writer):
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def serve(config_filename):
+    client = AsyncMp2Client(config_filename=config_filename)
+    await client.connect()
+    server_params = read_config(filename=config_filename, section="server", required=False)
+    server = CommandServer.from_config(client, server_params)
+    try:
+        # the pool connects in the background; a server that cannot reach the database does not listen
+        await client.pool.wait(timeout=get_float(client.pool_params, "timeout", 30.0))
+        await server.serve_forever()
+    finally:
+        await client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve the MovieVault command shell over TCP")
+    parser.add_argument("--config", default=POSTGRESQL_CONFIG_FILE_NAME)
+    args = parser.parse_args()
+    asyncio.run(serve(args.config))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import threading
+
+from config import get_float
+import queries
+
+"""
+    Lease-based session accounting.
+    - Every signed in session holds a row in customer_sessions that expires lease seconds after its
+      last heartbeat. customers.sessionCount counts the leases of the customer.
+    - sign_in checks the plan limit, increments sessionCount and takes the lease in one statement
+      (queries.SIGN_IN_LEASE). Concurrent sign-ins of the same customer wait for each other's row lock
+      and re-check the limit, so sessionCount never exceeds maxParallelSessions.
+    - sign_out ends the lease and decrements sessionCount in one statement. A lease that has already
+      expired is not counted twice.
+    - The manager renews the leases of its own sessions every heartbeat_interval seconds, and reclaims
+      expired leases of every client, e.g. of a crashed process, every reap_interval seconds.
+"""
+
+SESSION_SCHEMA_DDL = [
+    """create table if not exists customer_sessions (
+        sessionId bigserial,
+        customerId int not null,
+        startedAt timestamptz not null default now(),
+        heartbeatAt timestamptz not null default now(),
+        expiresAt timestamptz not null,
+        primary key (sessionId),
+        foreign key (customerId) references customers(customerId) on delete cascade
+    );""",
+    "create index if not exists customer_sessions_customerid_idx on customer_sessions (customerId);",
+    "create index if not exists customer_sessions_expiresat_idx on customer_sessions (expiresAt);",
+]
+
+
+class SessionLeaseManager:
+    def __init__(self, lease=300.0, heartbeat_interval=60.0, reap_interval=60.0):
+        self.lease = lease
+        self.heartbeat_interval = heartbeat_interval
+        self.reap_interval = reap_interval
+        self.pool = None
+        self.renewed = 0
+        self.reaped = 0
+        self._lock = threading.Lock()
+        self._session_ids = set()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    """
+        Builds a lease manager from the [sessions] section of the configuration file.
+    """
+
+    @classmethod
+    def from_config(cls, session_params):
+        return cls(lease=get_float(session_params, "leaseseconds", 300.0),
+                   heartbeat_interval=get_float(session_params, "heartbeatinterval", 60.0),
+                   reap_interval=get_float(session_params, "reapinterval", 60.0))
+
+    def install(self, cursor):
+        for statement in SESSION_SCHEMA_DDL:
+            cursor.execute(statement)
+
+    def start(self, pool, listener):
+        self.pool = pool
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="session-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def track(self, session_id):
+        with self._lock:
+            self._session_ids.add(session_id)
+
+    def untrack(self, session_id):
+        with self._lock:
+            self._session_ids.discard(session_id)
+
+    """
+        Extends the leases of the tracked sessions. Returns the number of renewed leases; sessions
+        whose lease was reclaimed in the meantime are no longer tracked.
+    """
+
+    def renew(self):
+        with self._lock:
+            session_ids = list(self._session_ids)
+        if not session_ids:
+            return 0
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(queries.RENEW_SESSION_LEASES, (self.lease, session_ids))
+            renewed_ids = set(row[0] for row in cursor.fetchall())
+            conn.commit()
+            cursor.close()
+
+        with self._lock:
+            self._session_ids.difference_update(set(session_ids) - renewed_ids)
+        self.renewed += len(renewed_ids)
+        return len(renewed_ids)
+
+    """
+        Deletes every expired lease and gives its session back to the customer.
+        Returns the number of reclaimed leases.
+    """
+
+    def reap(self):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(queries.REAP_EXPIRED_SESSIONS)
+            reaped = cursor.fetchone()[0]
+            conn.commit()
+            cursor.close()
+        self.reaped += reaped
+        return reaped
+
+    def _run(self):
+        interval = min(self.heartbeat_interval, self.reap_interval)
+        since_heartbeat = since_reap = 0.0
+        while not self._stopped.wait(interval):
+            since_heartbeat += interval
+            since_reap += interval
+            try:
+                if since_heartbeat >= self.heartbeat_interval:
+                    since_heartbeat = 0.0
+                    self.renew()
+                if since_reap >= self.reap_interval:
+                    since_reap = 0.0
+                    self.reap()
+            except Exception:
+                # the database may be unreachable for a while; leases are renewed on the next round
+                pass
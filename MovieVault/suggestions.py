@@ -0,0 +1,608 @@
+import datetime
+import threading
+
+from config import get_bool, get_float, get_int
+from movie import Movie
+from notifications import ALL_ROWS, install_notify_trigger
+import prepared
+from rows import rows_as
+from search import MOVIES_CHANNEL
+
+try:
+    import numpy as np
+except ImportError:
+    # only the numpy engine needs it
+    np = None
+
+GENRES_CHANNEL = "genres_changed"
+
+"""
+    Suggestion engines compute the movies printed by suggest_movies.
+    - suggest returns Movie objects, without duplicates, in no particular order. If watched_movie_ids is given,
+      the customer's watched movies are taken from it instead of being read from watched.
+    - install runs the engine's idempotent DDL. migrate.py runs it once per deployment, never the client.
+    - start prepares the engine after the pool is open; stop releases it.
+    - refresh brings precomputed state up to date and returns the number of refreshed ranking lists.
+    - staleness returns metrics about how far precomputed state lags behind the catalogue.
+"""
+
+
+class SuggestionEngine:
+    name = None
+
+    def install(self, cursor):
+        pass
+
+    def start(self, pool, listener):
+        pass
+
+    def stop(self):
+        pass
+
+    def suggest(self, cursor, customer_id, watched_movie_ids=None):
+        raise NotImplementedError
+
+    def refresh(self, full=False):
+        return 0
+
+    def staleness(self):
+        return {}
+
+
+"""
+    Computes the per-genre top movie, the post-2010 top 10 and the above-average top 10 from the catalogue
+    in a single statement.
+"""
+
+
+class SqlSuggestionEngine(SuggestionEngine):
+    name = "sql"
+
+    def suggest(self, cursor, customer_id, watched_movie_ids=None):
+        with rows_as(cursor, Movie.from_row):
+            prepared.execute(cursor, prepared.SUGGEST_MOVIES, {"customer_id": customer_id,
+                                                               "watched_movie_ids": watched_movie_ids})
+            return cursor.fetchall()
+
+
+"""
+    Serves suggestions from ranking lists that are shared by every customer:
+        genre:<genre>   movies of the genre by numVotes
+        post2010        movies released in or after 2010 by numVotes, then averageRating
+        votes           every movie by numVotes
+    - Triggers on movies and genres mark the affected lists dirty and count the change; refresh rebuilds only
+      dirty lists, or every list if full is set. A list stays dirty if it changed again while it was rebuilt.
+    - Lists are rebuilt whole, so any movie change rebuilds the votes list. With refresh_interval set, a
+      background thread refreshes the dirty lists every refresh_interval seconds, so a change shows up in
+      suggestions within refresh_interval seconds plus the time a refresh of the dirty lists takes.
+    - suggest walks down each list and stops at the first unwatched movies, instead of sorting the catalogue.
+    - If refresh_on_start is set, dirty lists are rebuilt when the client starts. Lists that were never built
+      are always built on start.
+"""
+
+
+class MaterializedSuggestionEngine(SuggestionEngine):
+    name = "materialized"
+
+    schema_ddl = [
+        """create table if not exists suggestion_ranking_lists (
+            listName text,
+            refreshedAt timestamptz,
+            dirtySince timestamptz,
+            changeCount bigint not null default 0,
+            primary key (listName)
+        );""",
+        "alter table suggestion_ranking_lists add column if not exists changeCount bigint not null default 0;",
+        """create table if not exists suggestion_rankings (
+            listName text,
+            rank int,
+            movieId text,
+            numVotes int,
+            primary key (listName, rank)
+        );""",
+        """create or replace function movievault_mark_rankings_dirty() returns trigger as $$
+        declare
+            changed_movieid text;
+        begin
+            if tg_table_name = 'genres' then
+                if tg_op <> 'INSERT' then
+                    update suggestion_ranking_lists
+                    set dirtySince = coalesce(dirtySince, now()), changeCount = changeCount + 1
+                    where listName = 'genre:' || old.genre;
+                end if;
+                if tg_op <> 'DELETE' then
+                    insert into suggestion_ranking_lists (listName, dirtySince) values ('genre:' || new.genre, now())
+                    on conflict (listName) do update
+                    set dirtySince = coalesce(suggestion_ranking_lists.dirtySince, now()),
+                        changeCount = suggestion_ranking_lists.changeCount + 1;
+                end if;
+                return null;
+            end if;
+
+            if tg_op = 'DELETE' then
+                changed_movieid := old.movieid;
+            else
+                changed_movieid := new.movieid;
+            end if;
+            update suggestion_ranking_lists l
+            set dirtySince = coalesce(l.dirtySince, now()), changeCount = l.changeCount + 1
+            where (l.listName in ('votes', 'post2010')
+                   or l.listName in (select 'genre:' || g.genre from genres g where g.movieid = changed_movieid));
+            return null;
+        end;
+        $$ language plpgsql;""",
+        "drop trigger if exists movies_mark_rankings_dirty on movies;",
+        """create trigger movies_mark_rankings_dirty after insert or update or delete on movies
+            for each row execute procedure movievault_mark_rankings_dirty();""",
+        "drop trigger if exists genres_mark_rankings_dirty on genres;",
+        """create trigger genres_mark_rankings_dirty after insert or update or delete on genres
+            for each row execute procedure movievault_mark_rankings_dirty();""",
+    ]
+
+    register_lists_query = """
+        insert into suggestion_ranking_lists (listName, dirtySince)
+        select l.listname, now() from (
+            select 'votes' as listname union select 'post2010' union select distinct 'genre:' || g.genre from genres g
+        ) l
+        on conflict (listName) do nothing;"""
+
+    list_ranking_queries = {
+        "votes": """
+            select %(list_name)s, row_number() over (order by m.numvotes desc), m.movieid, m.numvotes
+            from movies m;""",
+        "post2010": """
+            select %(list_name)s, row_number() over (order by m.numvotes desc, m.averagerating desc), m.movieid, m.numvotes
+            from movies m where m.startyear >= 2010;""",
+        "genre": """
+            select %(list_name)s, row_number() over (order by m.numvotes desc), m.movieid, m.numvotes
+            from genres g, movies m where m.movieid = g.movieid and g.genre = %(genre)s;""",
+    }
+
+    suggest_movies_query = """
+        with watched_movies as (
+            select w.movieid from watched w
+            where %(watched_movie_ids)s::text[] is null and w.customerid = %(customer_id)s
+            union all
+            select unnest(%(watched_movie_ids)s::text[])
+        ),
+        customer_genres as (
+            select distinct g.genre from watched_movies w, genres g where g.movieid = w.movieid
+        ),
+        step1 as (
+            select top.movieid from customer_genres cg,
+            lateral (
+                select r.movieid from suggestion_rankings r
+                where r.listname = 'genre:' || cg.genre and r.movieid not in (select movieid from watched_movies)
+                order by r.rank limit 1
+            ) top
+        ),
+        step2 as (
+            select r.movieid from suggestion_rankings r
+            where r.listname = 'post2010' and r.movieid not in (select movieid from watched_movies)
+            order by r.rank limit 10
+        ),
+        step3 as (
+            select r.movieid from suggestion_rankings r
+            where r.listname = 'votes'
+                and r.numvotes > (select avg(wm.numvotes) from watched_movies w, movies wm where wm.movieid = w.movieid)
+                and r.movieid not in (select movieid from watched_movies)
+            order by r.rank limit 10
+        ),
+        suggested as (
+            select movieid from step1 union select movieid from step2 union select movieid from step3
+        )
+        select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes
+        from movies m, suggested s where m.movieid = s.movieid;"""
+
+    suggest_movies_statement = prepared.register("mp2_suggest_rankings", suggest_movies_query)
+
+    staleness_query = """
+        select count(*), count(dirtySince), count(*) - count(refreshedAt),
+            extract(epoch from now() - min(dirtySince)), min(refreshedAt), max(refreshedAt)
+        from suggestion_ranking_lists;"""
+
+    def __init__(self, refresh_on_start=True, refresh_interval=0.0):
+        self.refresh_on_start = refresh_on_start
+        self.refresh_interval = refresh_interval
+        self.pool = None
+        self.background_refreshes = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def install(self, cursor):
+        for statement in self.schema_ddl:
+            cursor.execute(statement)
+
+    def start(self, pool, listener):
+        self.pool = pool
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("select to_regclass('suggestion_ranking_lists');")
+            if cursor.fetchone()[0] is None:
+                conn.rollback()
+                cursor.close()
+                raise Exception('The materialized suggestion engine needs its tables, run migrate.py first')
+            cursor.execute(self.register_lists_query)
+            conn.commit()
+            cursor.close()
+        self._refresh_lists(never_refreshed_only=not self.refresh_on_start)
+        if self.refresh_interval > 0:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="ranking-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def suggest(self, cursor, customer_id, watched_movie_ids=None):
+        with rows_as(cursor, Movie.from_row):
+            prepared.execute(cursor, self.suggest_movies_statement, {"customer_id": customer_id,
+                                                                     "watched_movie_ids": watched_movie_ids})
+            return cursor.fetchall()
+
+    def refresh(self, full=False):
+        return self._refresh_lists(full=full)
+
+    """
+        Returns the number of lists, dirty lists and never built lists, the age in seconds of the oldest
+        change that is not reflected in the rankings, and the oldest and newest refresh times.
+    """
+
+    def staleness(self):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.staleness_query)
+            lists, dirty_lists, unbuilt_lists, oldest_change_age, oldest_refresh, newest_refresh = cursor.fetchone()
+            cursor.close()
+            conn.commit()
+
+        return {
+            "lists": lists,
+            "dirty_lists": dirty_lists,
+            "unbuilt_lists": unbuilt_lists,
+            "oldest_change_age": float(oldest_change_age or 0),
+            "oldest_refresh": oldest_refresh,
+            "newest_refresh": newest_refresh,
+        }
+
+    def _refresh_lists(self, full=False, never_refreshed_only=False):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            if full:
+                cursor.execute(self.register_lists_query)
+                cursor.execute("select listName from suggestion_ranking_lists;")
+            elif never_refreshed_only:
+                cursor.execute("select listName from suggestion_ranking_lists where refreshedAt is null;")
+            else:
+                cursor.execute("select listName from suggestion_ranking_lists where dirtySince is not null;")
+            list_names = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+
+            # every list is rebuilt in its own transaction, so the rebuilt rankings of one list
+            # become visible without waiting for the others
+            for list_name in list_names:
+                self._refresh_list(cursor, list_name)
+                conn.commit()
+            cursor.close()
+
+        return len(list_names)
+
+    def _refresh_list(self, cursor, list_name):
+        # refreshers of the same list take turns; a list that is being rebuilt elsewhere is skipped
+        cursor.execute("select pg_try_advisory_xact_lock(hashtext('suggestion_rankings:' || %s));", (list_name,))
+        if not cursor.fetchone()[0]:
+            return
+        # the rankings are read after the count, so they include every change the count includes. The list
+        # row is not locked: writers keep marking it dirty while it is rebuilt.
+        cursor.execute("select changeCount from suggestion_ranking_lists where listName = %s;", (list_name,))
+        row = cursor.fetchone()
+        if not row:
+            return
+        change_count = row[0]
+
+        if list_name.startswith("genre:"):
+            ranking_query = self.list_ranking_queries["genre"]
+            params = {"list_name": list_name, "genre": list_name[len("genre:"):]}
+        else:
+            ranking_query = self.list_ranking_queries[list_name]
+            params = {"list_name": list_name}
+
+        cursor.execute("delete from suggestion_rankings where listName = %s;", (list_name,))
+        cursor.execute("insert into suggestion_rankings (listName, rank, movieId, numVotes) " + ranking_query, params)
+
+        # changes counted after the count was read keep the list dirty for the next refresh
+        if cursor.rowcount == 0 and list_name.startswith("genre:"):
+            # no movie has this genre anymore
+            cursor.execute("delete from suggestion_ranking_lists where listName = %s and changeCount = %s;",
+                           (list_name, change_count))
+        else:
+            cursor.execute("update suggestion_ranking_lists set refreshedAt = now(), "
+                           "dirtySince = case when changeCount = %s then null else dirtySince end "
+                           "where listName = %s;", (change_count, list_name))
+
+    def _run(self):
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                self._refresh_lists()
+                self.background_refreshes += 1
+            except Exception:
+                # the database may be unreachable for a while; dirty lists are refreshed on the next round
+                pass
+
+
+"""
+    Columnar copy of the catalogue. Deleted movies keep their position, with present unset, until the next
+    full refresh. A catalogue is never changed once built; patched returns a changed copy.
+    The copy is deliberate: suggest reads the current catalogue without taking a lock, so a patch must not
+    be visible half applied. Its cost is that of a rebuild without the database reads, O(catalogue) per
+    notification batch: the rows list and index dict are copied, every column and the genre mask are
+    reallocated and genre_members is recomputed. Notifications are applied in batches, so a bulk update
+    pays it once per poll of the listener rather than once per row.
+"""
+
+
+class _Catalogue:
+    def __init__(self, rows, index, present, start_year, rating, votes, genre_mask, genre_names):
+        self.rows = rows
+        self.index = index
+        self.present = present
+        self.start_year = start_year
+        self.rating = rating
+        self.votes = votes
+        self.genre_mask = genre_mask
+        self.genre_names = genre_names
+        # descending sort keys: NULL sorts first, as in PostgreSQL
+        self.votes_key = np.where(np.isnan(votes), np.inf, votes)
+        self.rating_key = np.where(np.isnan(rating), np.inf, rating)
+        self.genre_members = [np.flatnonzero(self.has_genre(bit) & present) for bit in range(len(genre_names))]
+        self.refreshed_at = datetime.datetime.now(datetime.timezone.utc)
+
+    @classmethod
+    def build(cls, rows, movie_genres):
+        index = {movie.movie_id: position for position, movie in enumerate(rows)}
+        genre_names = sorted(set(genre for genres in movie_genres.values() for genre in genres))
+        genre_mask = np.zeros((len(rows), _words(len(genre_names))), dtype=np.uint64)
+        _set_genres(genre_mask, index, movie_genres, {genre: bit for bit, genre in enumerate(genre_names)})
+        return cls(rows, index, np.ones(len(rows), dtype=bool),
+                   np.array([_number(movie.year) for movie in rows], dtype=np.float64),
+                   np.array([_number(movie.rating) for movie in rows], dtype=np.float64),
+                   np.array([_number(movie.votes) for movie in rows], dtype=np.float64),
+                   genre_mask, genre_names)
+
+    def has_genre(self, bit):
+        return (self.genre_mask[:, bit // 64] >> np.uint64(bit % 64)) & np.uint64(1) == np.uint64(1)
+
+    """
+        Returns a copy with the given movies replaced by changed_rows and changed_genres. Movies missing
+        from changed_rows were deleted.
+    """
+
+    def patched(self, movie_ids, changed_rows, changed_genres):
+        rows = list(self.rows)
+        index = dict(self.index)
+        new_genres = sorted(set(genre for genres in changed_genres.values() for genre in genres) -
+                            set(self.genre_names))
+        genre_names = self.genre_names + new_genres
+        added = sum(1 for movie_id in changed_rows if movie_id not in index)
+
+        present = np.concatenate([self.present, np.ones(added, dtype=bool)])
+        columns = [np.concatenate([column, np.full(added, np.nan)])
+                   for column in (self.start_year, self.rating, self.votes)]
+        genre_mask = np.zeros((len(rows) + added, _words(len(genre_names))), dtype=np.uint64)
+        genre_mask[:len(rows), :self.genre_mask.shape[1]] = self.genre_mask
+
+        for movie_id in movie_ids:
+            movie = changed_rows.get(movie_id)
+            position = index.get(movie_id)
+            if position is None:
+                if movie is None:
+                    continue
+                position = index[movie_id] = len(rows)
+                rows.append(movie)
+            rows[position] = movie
+            present[position] = movie is not None
+            if movie is None:
+                for values in columns:
+                    values[position] = np.nan
+            else:
+                columns[0][position] = _number(movie.year)
+                columns[1][position] = _number(movie.rating)
+                columns[2][position] = _number(movie.votes)
+            genre_mask[position] = 0
+        _set_genres(genre_mask, index, changed_genres, {genre: bit for bit, genre in enumerate(genre_names)})
+        return _Catalogue(rows, index, present, columns[0], columns[1], columns[2], genre_mask, genre_names)
+
+
+def _words(genre_count):
+    return max(1, (genre_count + 63) // 64)
+
+
+def _set_genres(genre_mask, index, movie_genres, genre_bits):
+    for movie_id, genres in movie_genres.items():
+        position = index.get(movie_id)
+        if position is None:
+            continue
+        for genre in genres:
+            bit = genre_bits[genre]
+            genre_mask[position, bit // 64] |= np.uint64(1 << (bit % 64))
+
+
+def _number(value):
+    return np.nan if value is None else float(value)
+
+
+"""
+    Computes the same suggestions as SqlSuggestionEngine in process, from a columnar copy of the catalogue
+    in NumPy arrays: numVotes, averageRating and startYear, plus a bitmask of the genres of every movie.
+    - The catalogue is loaded when the client starts. Triggers on movies and genres send the ids of changed
+      movies, which are re-read and patched into a new copy of the arrays. Each batch of notifications
+      therefore costs a copy of the whole catalogue, see _Catalogue.
+    - Only the customer's watched movie ids are read from the database per call. Each step masks out
+      the watched movies and picks its top movies with argpartition instead of sorting the catalogue.
+    - Like the SQL ORDER BY ... DESC, a NULL numVotes or averageRating sorts before every value. Movies
+      that tie on the sort keys may be picked differently than by PostgreSQL, which breaks ties arbitrarily.
+    - Requires the numpy package.
+"""
+
+
+class NumpySuggestionEngine(SuggestionEngine):
+    name = "numpy"
+
+    def __init__(self, batch_size=10000):
+        if np is None:
+            raise Exception('The numpy suggestion engine requires the numpy package')
+        self.batch_size = batch_size
+        self.pool = None
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._catalogue = None
+
+    def install(self, cursor):
+        install_notify_trigger(cursor, "movies", MOVIES_CHANNEL, "movieid")
+        install_notify_trigger(cursor, "genres", GENRES_CHANNEL, "movieid")
+
+    def start(self, pool, listener):
+        self.pool = pool
+        self.refresh(full=True)
+        listener.subscribe(MOVIES_CHANNEL, self._on_catalogue_changed)
+        listener.subscribe(GENRES_CHANNEL, self._on_catalogue_changed)
+
+    def stop(self):
+        self._catalogue = None
+
+    def suggest(self, cursor, customer_id, watched_movie_ids=None):
+        catalogue = self._catalogue
+        if watched_movie_ids is None:
+            cursor.execute("select w.movieid from watched w where w.customerid = %s;", (customer_id,))
+            watched_movie_ids = [row[0] for row in cursor.fetchall()]
+        watched = np.array([catalogue.index[movie_id] for movie_id in watched_movie_ids
+                            if movie_id in catalogue.index], dtype=np.int64)
+
+        unwatched = catalogue.present.copy()
+        unwatched[watched] = False
+        suggested = set()
+
+        # step 1: the most voted unwatched movie of each genre the customer watched
+        customer_genres = np.bitwise_or.reduce(catalogue.genre_mask[watched], axis=0) if len(watched) else None
+        for bit in range(len(catalogue.genre_names)):
+            if customer_genres is None or not (int(customer_genres[bit // 64]) >> (bit % 64)) & 1:
+                continue
+            members = catalogue.genre_members[bit]
+            candidates = members[unwatched[members]]
+            if len(candidates):
+                suggested.add(int(candidates[np.argmax(catalogue.votes_key[candidates])]))
+
+        # step 2: the top 10 unwatched movies since 2010 by numVotes, then averageRating
+        candidates = np.flatnonzero(unwatched & (catalogue.start_year >= 2010))
+        suggested.update(self._top(candidates, catalogue.votes_key, catalogue.rating_key, 10))
+
+        # step 3: the top 10 unwatched movies with more votes than the customer's watched movies on average
+        watched_votes = catalogue.votes[watched]
+        watched_votes = watched_votes[~np.isnan(watched_votes)]
+        if len(watched_votes):
+            candidates = np.flatnonzero(unwatched & (catalogue.votes > watched_votes.mean()))
+            suggested.update(self._top(candidates, catalogue.votes_key, None, 10))
+
+        return [catalogue.rows[position] for position in suggested]
+
+    """
+        Rebuilds the arrays from the movies and genres tables. Changed movies are also patched in
+        automatically as their notifications arrive. Returns the number of loaded movies.
+    """
+
+    def refresh(self, full=False):
+        movie_genres = {}
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(name="numpy_catalogue_load")
+            cursor.itersize = self.batch_size
+            cursor.row_factory = Movie.from_row
+            cursor.execute("select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes from movies m;")
+            rows = list(cursor)
+            cursor.close()
+            cursor = conn.cursor(name="numpy_genres_load")
+            cursor.itersize = self.batch_size
+            cursor.execute("select g.movieid, g.genre from genres g;")
+            for movie_id, genre in cursor:
+                movie_genres.setdefault(movie_id, []).append(genre)
+            cursor.close()
+            conn.commit()
+
+        catalogue = _Catalogue.build(rows, movie_genres)
+        with self._lock:
+            self._catalogue = catalogue
+            self.refreshes += 1
+        return len(rows)
+
+    def staleness(self):
+        catalogue = self._catalogue
+        return {
+            "lists": len(catalogue.genre_names) if catalogue else 0,
+            "dirty_lists": 0,
+            "unbuilt_lists": 0 if catalogue else 1,
+            "oldest_change_age": 0.0,
+            "newest_refresh": catalogue.refreshed_at if catalogue else None,
+        }
+
+    """
+        Re-reads the given movies and their genres and swaps in a patched copy of the arrays.
+    """
+
+    def refresh_movies(self, movie_ids):
+        movie_ids = list(movie_ids)
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            with rows_as(cursor, Movie.from_row):
+                cursor.execute("select m.movieid, m.originaltitle, m.startyear, m.averagerating, m.numvotes "
+                               "from movies m where m.movieid = any(%s);", (movie_ids,))
+                changed_rows = {movie.movie_id: movie for movie in cursor.fetchall()}
+            cursor.execute("select g.movieid, g.genre from genres g where g.movieid = any(%s);", (movie_ids,))
+            changed_genres = {}
+            for movie_id, genre in cursor.fetchall():
+                changed_genres.setdefault(movie_id, []).append(genre)
+            cursor.close()
+            conn.commit()
+
+        with self._lock:
+            self._catalogue = self._catalogue.patched(movie_ids, changed_rows, changed_genres)
+            self.refreshes += 1
+
+    @staticmethod
+    def _top(candidates, primary_key, secondary_key, count):
+        # descending order of primary_key, then secondary_key; only the candidates that can reach
+        # the top count are sorted
+        if len(candidates) > count:
+            keys = primary_key[candidates]
+            threshold = np.partition(keys, len(keys) - count)[len(keys) - count]
+            candidates = candidates[keys >= threshold]
+        if secondary_key is None:
+            order = np.argsort(-primary_key[candidates], kind="stable")
+        else:
+            order = np.lexsort((-secondary_key[candidates], -primary_key[candidates]))
+        return [int(position) for position in candidates[order[:count]]]
+
+    def _on_catalogue_changed(self, payloads):
+        if ALL_ROWS in payloads:
+            self.refresh(full=True)
+        else:
+            self.refresh_movies(set(payloads))
+
+
+"""
+    Creates the suggestion engine selected in the [suggestions] section of the configuration file.
+"""
+
+
+def create_suggestion_engine(suggestion_params):
+    engine = suggestion_params.get("engine", SqlSuggestionEngine.name).strip().lower()
+    if engine == SqlSuggestionEngine.name:
+        return SqlSuggestionEngine()
+    elif engine == MaterializedSuggestionEngine.name:
+        return MaterializedSuggestionEngine(refresh_on_start=get_bool(suggestion_params, "refreshonstart", True),
+                                            refresh_interval=get_float(suggestion_params, "refreshinterval", 10.0))
+    elif engine == NumpySuggestionEngine.name:
+        return NumpySuggestionEngine(batch_size=get_int(suggestion_params, "batchsize", 10000))
+    else:
+        raise Exception('Unknown suggestion engine {0}'.format(engine))
@@ -87,6 +87,15 @@ def search_for_movies_validator(auth_customer, cmd_tokens):
     # only accept signed in users
     if not auth_customer:
         return False, messages.USER_NOT_AUTHORIZED
+    # search_for_movies --page <page_size> [--after <page_token>] <keyword_1> <keyword_2> ... <keyword_n>
+    elif len(cmd_tokens) > 1 and cmd_tokens[1] == "--page":
+        keywords_at = 5 if len(cmd_tokens) > 3 and cmd_tokens[3] == "--after" else 3
+        if len(cmd_tokens) <= keywords_at:
+            return False, messages.CMD_NOT_ENOUGH_ARGS_AT_LEAST % keywords_at
+        elif not cmd_tokens[2].isdigit() or int(cmd_tokens[2]) == 0:
+            return False, messages.SEARCH_PAGE_SIZE_INVALID
+        else:
+            return True, None
     # search_for_movies <keyword_1> <keyword_2> <keyword_3> ... <keyword_n>
     elif len(cmd_tokens) > 1:
         return True, None
@@ -94,5 +103,49 @@ def search_for_movies_validator(auth_customer, cmd_tokens):
         return False, messages.CMD_NOT_ENOUGH_ARGS_AT_LEAST % 1
 
 
+"""
+    Splits validated search_for_movies tokens into (search_text, page_size, page_token).
+    page_size and page_token are None unless --page and --after are given.
+"""
+
+
+def search_for_movies_args(cmd_tokens):
+    if cmd_tokens[1] != "--page":
+        return " ".join(cmd_tokens[1:]), None, None
+    if cmd_tokens[3] == "--after":
+        return " ".join(cmd_tokens[5:]), int(cmd_tokens[2]), cmd_tokens[4]
+    return " ".join(cmd_tokens[3:]), int(cmd_tokens[2]), None
+
+
 def suggest_movies_validator(auth_customer, cmd_tokens):
+    # only accept signed in users
+    if not auth_customer:
+        return False, messages.USER_NOT_AUTHORIZED
+    # suggest_movies [--cowatch]
+    elif len(cmd_tokens) == 1 or (len(cmd_tokens) == 2 and cmd_tokens[1] == "--cowatch"):
+        return True, None
+    else:
+        return False, messages.CMD_INVALID_ARGS
+
+
+def refresh_suggestions_validator(auth_customer, cmd_tokens):
+    # only accept signed in users
+    if not auth_customer:
+        return False, messages.USER_NOT_AUTHORIZED
+    # refresh_suggestions [--full]
+    elif len(cmd_tokens) == 1 or (len(cmd_tokens) == 2 and cmd_tokens[1] == "--full"):
+        return True, None
+    else:
+        return False, messages.CMD_INVALID_ARGS
+
+
+def show_suggestion_status_validator(auth_customer, cmd_tokens):
     return basic_validator(auth_customer, cmd_tokens)
+
+
+def stats_validator(auth_customer, cmd_tokens):
+    # stats [--prometheus]
+    if len(cmd_tokens) == 1 or (len(cmd_tokens) == 2 and cmd_tokens[1] == "--prometheus"):
+        return True, None
+    else:
+        return False, messages.CMD_INVALID_ARGS
@@ -0,0 +1,259 @@
+import atexit
+import signal
+import threading
+import time
+
+from config import get_bool, get_float, get_int
+import queries
+
+"""
+    Write-behind queue of watch events.
+    - Mp2Client.watch validates the movie ids and appends the customer-movie pairs here instead of inserting them.
+    - A background thread writes everything queued in one multi-row insert once flush_rows pairs are queued or
+      the oldest pair has waited flush_interval seconds. A failed flush puts its pairs back and is retried
+      flush_interval seconds later.
+    - At most max_rows pairs are queued. add blocks while the queue is full and gives up after timeout seconds,
+      so producers slow down to the rate the database accepts.
+    - flush returns once everything queued before the call is written. Mp2Client flushes on sign_out and quit,
+      and stop, which also runs at interpreter exit, writes what is left.
+    - When started from the main thread, SIGTERM and SIGINT also write what is left before the previous
+      handler runs. Pairs are still lost if the process is killed otherwise or the database stays unreachable
+      for timeout seconds; at most max_rows pairs, queued during the last flush_interval seconds unless
+      flushes fail.
+    - pending returns the queued movie ids of a customer, so a customer's watches are visible to the session's
+      watched set before they are written.
+"""
+
+
+class WatchQueue:
+    def __init__(self, max_rows=100000, flush_rows=5000, flush_interval=0.5, timeout=30.0):
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.pool = None
+        self.max_depth = 0
+        self.full_waits = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rows_flushed = 0
+        self.rows_inserted = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._condition = threading.Condition()
+        # customer id -> queued movie ids, and the batch that is being written
+        self._queued = {}
+        self._flushing = {}
+        self._depth = 0
+        self._oldest = None
+        self._retry_at = 0.0
+        self._enqueued = 0
+        self._written = 0
+        self._flush_waiters = 0
+        self._stopping = False
+        self._thread = None
+        self._previous_handlers = {}
+
+    """
+        Builds a watch queue from the [watch] section of the configuration file, or returns None if write-behind
+        is disabled.
+    """
+
+    @classmethod
+    def from_config(cls, watch_params):
+        if not get_bool(watch_params, "writebehind", False):
+            return None
+        return cls(max_rows=get_int(watch_params, "queuerows", 100000),
+                   flush_rows=get_int(watch_params, "flushrows", 5000),
+                   flush_interval=get_float(watch_params, "flushinterval", 0.5),
+                   timeout=get_float(watch_params, "queuetimeout", 30.0))
+
+    def install(self, cursor):
+        pass
+
+    def start(self, pool, listener):
+        self.pool = pool
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="watch-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        # only the main thread may install signal handlers
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                self._previous_handlers[signum] = signal.signal(signum, self._on_signal)
+
+    """
+        Writes what is still queued and stops the flusher. Returns False if the queue could not be emptied
+        within timeout seconds.
+    """
+
+    def stop(self):
+        atexit.unregister(self.stop)
+        for signum, handler in self._previous_handlers.items():
+            if signal.getsignal(signum) == self._on_signal:
+                signal.signal(signum, handler)
+        self._previous_handlers = {}
+        if self._thread is None:
+            return True
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join(self.timeout)
+        stopped = not self._thread.is_alive()
+        self._thread = None
+        return stopped
+
+    """
+        Queues the watched movie ids of a customer. Blocks while the queue is full; raises an exception if
+        no room was freed within timeout seconds or the flusher is not running.
+    """
+
+    def add(self, customer_id, movie_ids):
+        with self._condition:
+            deadline = time.monotonic() + self.timeout
+            if self._depth and self._depth + len(movie_ids) > self.max_rows:
+                self.full_waits += 1
+            # a call larger than the whole queue still goes through once the queue is empty
+            while self._depth and self._depth + len(movie_ids) > self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception('Watch queue stayed full for {0} seconds'.format(self.timeout))
+                self._condition.wait(remaining)
+            if self._thread is None or self._stopping:
+                raise Exception('Watch queue is not running')
+
+            self._queued.setdefault(customer_id, []).extend(movie_ids)
+            self._depth += len(movie_ids)
+            self._enqueued += len(movie_ids)
+            self.max_depth = max(self.max_depth, self._depth)
+            # the flusher sleeps without a deadline while the queue is empty
+            if self._oldest is None or self._depth >= self.flush_rows:
+                self._oldest = self._oldest or time.monotonic()
+                self._condition.notify_all()
+
+    """
+        Waits until every pair queued before the call is written. Returns False if that took longer than
+        timeout seconds.
+    """
+
+    def flush(self):
+        with self._condition:
+            target = self._enqueued
+            deadline = time.monotonic() + self.timeout
+            self._flush_waiters += 1
+            self._condition.notify_all()
+            try:
+                while self._written < target:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+                return True
+            finally:
+                self._flush_waiters -= 1
+
+    def pending(self, customer_id):
+        with self._condition:
+            return self._queued.get(customer_id, []) + self._flushing.get(customer_id, [])
+
+    def stats(self):
+        with self._condition:
+            return {
+                "depth": self._depth + sum(len(movie_ids) for movie_ids in self._flushing.values()),
+                "max_depth": self.max_depth,
+                "full_waits": self.full_waits,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "rows_flushed": self.rows_flushed,
+                "rows_inserted": self.rows_inserted,
+                "rows_per_flush": self.rows_flushed / self.flushes if self.flushes else 0.0,
+                "flush_seconds": self.flush_seconds,
+                "max_flush_seconds": self.max_flush_seconds,
+            }
+
+    """
+        Writes what is queued, then hands the signal to the handler that was installed before start, so the
+        process still terminates, or raises KeyboardInterrupt on SIGINT.
+    """
+
+    def _on_signal(self, signum, frame):
+        handler = self._previous_handlers.get(signum, signal.SIG_DFL)
+        self.stop()
+        if callable(handler):
+            handler(signum, frame)
+        elif handler == signal.SIG_DFL:
+            signal.signal(signum, signal.SIG_DFL)
+            signal.raise_signal(signum)
+
+    """
+        Returns the seconds until the queue is due to be written, or None if nothing is queued.
+    """
+
+    def _due_in(self, now):
+        if not self._depth:
+            return None
+        if self._depth >= self.flush_rows or self._flush_waiters or self._stopping:
+            return self._retry_at - now
+        return max(self._oldest + self.flush_interval, self._retry_at) - now
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    due_in = self._due_in(time.monotonic())
+                    if due_in is None and self._stopping:
+                        return
+                    if due_in is not None and due_in <= 0:
+                        break
+                    self._condition.wait(due_in)
+                batch, self._queued = self._queued, {}
+                self._flushing = batch
+                target = self._enqueued
+                self._depth = 0
+                self._oldest = None
+                # producers waiting for room may continue while the batch is written
+                self._condition.notify_all()
+
+            written = self._write(batch)
+
+            with self._condition:
+                self._flushing = {}
+                if written:
+                    self._written = target
+                else:
+                    # the failed batch goes back in front of what was queued meanwhile
+                    for customer_id, movie_ids in self._queued.items():
+                        batch.setdefault(customer_id, []).extend(movie_ids)
+                    self._queued = batch
+                    self._depth = sum(len(movie_ids) for movie_ids in batch.values())
+                    self._oldest = time.monotonic()
+                    self._retry_at = self._oldest + self.flush_interval
+                self._condition.notify_all()
+
+    def _write(self, batch):
+        customer_ids = []
+        movie_ids = []
+        for customer_id, customer_movie_ids in batch.items():
+            customer_ids.extend([customer_id] * len(customer_movie_ids))
+            movie_ids.extend(customer_movie_ids)
+
+        started = time.perf_counter()
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(queries.WATCH_BATCH, (customer_ids, movie_ids))
+                inserted = cursor.fetchone()[0]
+                conn.commit()
+                cursor.close()
+        except Exception:
+            # the database may be unreachable for a while; the batch is retried
+            self.failed_flushes += 1
+            return False
+        elapsed = time.perf_counter() - started
+
+        self.flushes += 1
+        self.rows_flushed += len(movie_ids)
+        self.rows_inserted += inserted
+        self.flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        return True
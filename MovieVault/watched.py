@@ -0,0 +1,51 @@
+"""
+    Movie ids a signed in customer has watched, loaded at sign_in and updated in place by watch.
+    - version is the customers.watchedVersion the set was read at. Every watch that inserts rows increments it
+      in the same statement, so a set whose version still matches the database is complete.
+    - Other sessions of the same customer, and transactions that were rolled back, leave the versions apart;
+      Mp2Client then reloads the set in the round trip that compares them.
+    - Movie ids are text, so they are kept in a hash set rather than a sorted integer array.
+"""
+
+
+class WatchedSet:
+    __slots__ = ("version", "_movie_ids")
+
+    def __init__(self, movie_ids=(), version=None):
+        self.version = version
+        self._movie_ids = set(movie_ids)
+
+    def __contains__(self, movie_id):
+        return movie_id in self._movie_ids
+
+    def __len__(self):
+        return len(self._movie_ids)
+
+    """
+        Adds the movie ids of a watch that moved the database version to version. If another change happened
+        in between, the set is marked stale instead.
+    """
+
+    def add(self, movie_ids, version):
+        if self.version is None or version != self.version + 1:
+            self.invalidate()
+            return
+        self._movie_ids.update(movie_ids)
+        self.version = version
+
+    """
+        Adds movie ids that are queued to be written, without changing the version.
+    """
+
+    def include(self, movie_ids):
+        self._movie_ids.update(movie_ids)
+
+    def invalidate(self):
+        self.version = None
+
+    """
+        Returns the movie ids as a list, the form passed to queries as one text[] parameter.
+    """
+
+    def movie_ids(self):
+        return list(self._movie_ids)